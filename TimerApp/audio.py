@@ -0,0 +1,553 @@
+import os
+import mmap
+import time
+import wave
+import struct
+import threading
+import logging
+import numpy as np
+from instrumentation import metrics
+
+log = logging.getLogger("timerapp.audio")
+
+# Output format of audio backends
+SAMPLE_RATE = 44100
+CHANNELS = 2
+BLOCK_SIZE = 256
+# WAV files larger than this are streamed from a memory-mapped file instead of being decoded into memory
+STREAM_THRESHOLD = 4 * 1024 * 1024
+
+class Sound:
+    """Decoded sound: float32 samples of shape (frames, channels) in [-1; 1] range.
+    """
+
+    def __init__(self, samples, sample_rate):
+        self.samples = samples
+        self.sample_rate = sample_rate
+        # (sample_rate, channels) -> samples converted for an output
+        self._converted = {}
+        self._pcm16 = None
+
+    @property
+    def nbytes(self):
+        return self.samples.nbytes
+
+    @property
+    def channels(self):
+        return self.samples.shape[1]
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    def converted(self, sample_rate, channels):
+        """Get samples converted to given sample rate and number of channels. Result is memoized.
+
+        Args:
+            sample_rate (int): target sample rate.
+            channels (int): target number of channels.
+        Returns:
+            samples (numpy.ndarray): float32 array of shape (frames, channels).
+        """
+        key = (sample_rate, channels)
+        samples = self._converted.get(key)
+        if samples is None:
+            samples = convert_samples(self.samples, self.sample_rate, sample_rate, channels)
+            self._converted[key] = samples
+        return samples
+
+    def pcm16(self):
+        """Get samples as interleaved 16-bit PCM bytes. Result is memoized.
+        """
+        if self._pcm16 is None:
+            self._pcm16 = (np.clip(self.samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+        return self._pcm16
+
+def decode_pcm(data, sample_width, channels):
+    """Decode raw little-endian PCM frames to float32 samples.
+
+    Args:
+        data (bytes-like): raw PCM frames.
+        sample_width (int): bytes per sample (1, 2, 3 or 4).
+        channels (int): number of interleaved channels.
+    Returns:
+        samples (numpy.ndarray): float32 array of shape (frames, channels).
+    """
+    if sample_width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 2:
+        samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768
+    elif sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        samples = ints.astype(np.float32) / 8388608
+    elif sample_width == 4:
+        samples = np.frombuffer(data, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported sample width: {sample_width}")
+    return samples.reshape(-1, channels)
+
+def mix_channels(samples, channels):
+    """Mix samples to given number of channels: down to mono, then spread to all channels.
+
+    Args:
+        samples (numpy.ndarray): float32 array of shape (frames, source channels).
+        channels (int): target number of channels.
+    Returns:
+        samples (numpy.ndarray): float32 array of shape (frames, channels).
+    """
+    if samples.shape[1] == channels:
+        return samples
+    mono = samples.mean(axis=1, keepdims=True) if samples.shape[1] > 1 else samples
+    return np.repeat(mono, channels, axis=1)
+
+def convert_samples(samples, from_rate, to_rate, channels):
+    """Resample (linear interpolation) and mix samples to given number of channels.
+
+    Args:
+        samples (numpy.ndarray): float32 array of shape (frames, source channels).
+        from_rate (int): source sample rate.
+        to_rate (int): target sample rate.
+        channels (int): target number of channels.
+    Returns:
+        samples (numpy.ndarray): float32 array of shape (frames, channels).
+    """
+    samples = mix_channels(samples, channels)
+    if from_rate != to_rate and len(samples):
+        frames = int(round(len(samples) * to_rate / from_rate))
+        positions = np.arange(frames) * (from_rate / to_rate)
+        source = np.arange(len(samples))
+        samples = np.stack([np.interp(positions, source, samples[:, c]) for c in range(channels)], axis=1)
+    return np.ascontiguousarray(samples, dtype=np.float32)
+
+class StreamedSound:
+    """Sound played straight from a memory-mapped WAV file. Frames are decoded block by block
+    while playing, so memory use doesn't grow with the sound's length and loading costs
+    only reading the header.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str or pathlib.Path): path to PCM WAV file.
+        Raises:
+            wave.Error: if file is not a PCM WAV file.
+        """
+        with wave.open(str(path), "rb") as wav:
+            self.sample_rate = wav.getframerate()
+            self.sample_width = wav.getsampwidth()
+            channels = wav.getnchannels()
+        with open(path, "rb") as f:
+            data_offset, data_size = find_data_chunk(f)
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.frame_size = self.sample_width * channels
+        # Data size in header may be wrong for files that were written by streaming recorders
+        data_size = min(data_size, len(self._mmap) - data_offset)
+        self.frames = data_size // self.frame_size
+        self._data = memoryview(self._mmap)[data_offset:data_offset + self.frames * self.frame_size]
+        self._channels = channels
+
+    @property
+    def nbytes(self):
+        # Frames stay in the file, pages are read and dropped by the OS as needed
+        return 0
+
+    @property
+    def channels(self):
+        return self._channels
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+    def read(self, start, count):
+        """Decode frames.
+
+        Args:
+            start (int): index of first frame.
+            count (int): number of frames, fewer are returned at the end of sound.
+        Returns:
+            samples (numpy.ndarray): float32 array of shape (frames, channels).
+        """
+        start = max(0, min(start, self.frames))
+        end = min(self.frames, start + max(0, count))
+        return decode_pcm(self._data[start * self.frame_size:end * self.frame_size], self.sample_width, self._channels)
+
+    def converted(self, sample_rate, channels):
+        """Get frames converted to given sample rate and number of channels. Conversion happens
+        as the frames are sliced, so nothing is converted ahead.
+
+        Returns:
+            samples (StreamedSamples): array-like of shape (frames, channels) that can be sliced.
+        """
+        return StreamedSamples(self, sample_rate, channels)
+
+    def pcm16(self):
+        """Get all samples as interleaved 16-bit PCM bytes. Unlike with Sound, whole sound
+        is decoded into memory and nothing is memoized, so this is only for outputs that
+        can't stream.
+        """
+        samples = self.read(0, self.frames)
+        return (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+class StreamedSamples:
+    """Frames of StreamedSound converted for an output. Slicing decodes, mixes and resamples
+    (linear interpolation, as in convert_samples()) only the requested frames.
+    """
+    __slots__ = ("sound", "channels", "ratio", "frames")
+
+    def __init__(self, sound, sample_rate, channels):
+        self.sound = sound
+        self.channels = channels
+        # Source frames per output frame
+        self.ratio = sound.sample_rate / sample_rate
+        self.frames = int(round(sound.frames / self.ratio)) if sound.frames else 0
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, index):
+        start, stop, step = index.indices(self.frames)
+        if step != 1:
+            raise IndexError("Only contiguous slices of streamed samples are supported")
+        if stop <= start:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        if self.ratio == 1:
+            return mix_channels(self.sound.read(start, stop - start), self.channels)
+        positions = np.arange(start, stop) * self.ratio
+        first = int(positions[0])
+        source = mix_channels(self.sound.read(first, int(positions[-1]) - first + 2), self.channels)
+        if not len(source):
+            return np.zeros((stop - start, self.channels), dtype=np.float32)
+        # Positions past the last frame hold its value, as np.interp does
+        source = np.concatenate([source, source[-1:]])
+        indices = positions.astype(np.intp) - first
+        np.minimum(indices, len(source) - 2, out=indices)
+        weights = (positions - first - indices).astype(np.float32)[:, None]
+        np.clip(weights, 0.0, 1.0, out=weights)
+        return source[indices] + (source[indices + 1] - source[indices]) * weights
+
+def find_data_chunk(f):
+    """Find PCM frames in RIFF WAVE file.
+
+    Args:
+        f (file): file opened in binary mode.
+    Returns:
+        offset (int): position of the first frame in file.
+        size (int): size of frames in bytes as stated in chunk header.
+    Raises:
+        wave.Error: if file is not a WAVE file or has no data chunk.
+    """
+    riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+    if riff != b"RIFF" or wave_id != b"WAVE":
+        raise wave.Error("File is not a WAVE file")
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise wave.Error("WAVE file has no data chunk")
+        chunk_id, size = struct.unpack("<4sI", header)
+        if chunk_id == b"data":
+            return f.tell(), size
+        # Chunks are padded to even size
+        f.seek(size + (size & 1), os.SEEK_CUR)
+
+def load_wave(path, stream_threshold=STREAM_THRESHOLD):
+    """Read WAV file. Files up to stream_threshold bytes are decoded into memory,
+    larger ones are streamed from the file while playing.
+
+    Args:
+        path (str or pathlib.Path): path to WAV file.
+        stream_threshold (int): size of file in bytes above which it is streamed.
+    Returns:
+        sound (Sound or StreamedSound): loaded sound.
+    """
+    if os.path.getsize(path) > stream_threshold:
+        return StreamedSound(path)
+    with wave.open(str(path), "rb") as wav:
+        data = wav.readframes(wav.getnframes())
+        samples = decode_pcm(data, wav.getsampwidth(), wav.getnchannels())
+        return Sound(samples, wav.getframerate())
+
+class Voice:
+    """Sound queued on Mixer. Pass it to AudioOutput.stop() to stop playing.
+    """
+    __slots__ = ("samples", "start_frame", "position", "requested_at", "stopped")
+
+    def __init__(self, samples, start_frame, requested_at):
+        self.samples = samples
+        # Absolute output frame to start at, None to start with the next block
+        self.start_frame = start_frame
+        self.position = 0
+        self.requested_at = requested_at
+        self.stopped = False
+
+class Mixer:
+    """Mixes any number of voices into fixed-size blocks of output frames.
+    """
+
+    def __init__(self, channels=CHANNELS, block_size=BLOCK_SIZE):
+        self.channels = channels
+        self.block_size = block_size
+        self.voices = []
+        # Absolute index of the first frame of the next block
+        self.frame = 0
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def add(self, voice):
+        with self._lock:
+            self._pending.append(voice)
+
+    def render(self, out):
+        """Mix voices into out, overwriting its contents, and advance frame counter.
+
+        Args:
+            out (numpy.ndarray): float32 array of shape (frames, channels).
+        Returns:
+            started (list of Voice): voices that started playing in this block.
+        """
+        out.fill(0)
+        frames = len(out)
+        block_start = self.frame
+        block_end = block_start + frames
+        if self._pending:
+            with self._lock:
+                self.voices.extend(self._pending)
+                self._pending.clear()
+        started = []
+        active = []
+        for voice in self.voices:
+            if voice.stopped:
+                continue
+            if voice.start_frame is None:
+                voice.start_frame = block_start
+            if voice.start_frame >= block_end:
+                active.append(voice)
+                continue
+            if voice.position == 0:
+                started.append(voice)
+            # Voices scheduled in the past start right away, from their beginning
+            offset = max(0, voice.start_frame - block_start)
+            count = min(frames - offset, len(voice.samples) - voice.position)
+            out[offset:offset + count] += voice.samples[voice.position:voice.position + count]
+            voice.position += count
+            if voice.position < len(voice.samples):
+                active.append(voice)
+        self.voices = active
+        self.frame = block_end
+        np.clip(out, -1.0, 1.0, out=out)
+        return started
+
+class AudioOutput:
+    """Base of audio backends that keep one output stream open and mix all sounds into it.
+
+    Backends call _render() for every block with the monotonic time when the block reaches
+    the speaker. That time is used to map monotonic deadlines to output frames, so that
+    play_at() starts a sound on the exact sample of its deadline.
+    """
+    supports_scheduling = True
+
+    def __init__(self, sample_rate=SAMPLE_RATE, channels=CHANNELS, block_size=BLOCK_SIZE, clock=time.monotonic):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_size = block_size
+        self.clock = clock
+        self.mixer = Mixer(channels, block_size)
+        # Output frame of the next block and the time it will be heard. Kept in one tuple
+        # because it's replaced from the audio thread and read from others.
+        self._reference = (0, clock())
+        # Measured time between play() and its first sample being heard, seconds
+        self.start_latency = None
+
+    @property
+    def latency(self):
+        """Nominal latency of play() in seconds: one block plus latency reported by device."""
+        return self.block_size / self.sample_rate + self.device_latency
+
+    @property
+    def device_latency(self):
+        return 0.0
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+    def play(self, sound):
+        """Play sound as soon as possible.
+
+        Args:
+            sound (Sound): sound to play.
+        Returns:
+            voice (Voice): handle to stop sound with.
+        """
+        voice = Voice(sound.converted(self.sample_rate, self.channels), None, self.clock())
+        self.mixer.add(voice)
+        return voice
+
+    def play_at(self, sound, when):
+        """Start sound exactly at given time. Sounds scheduled in the past start immediately.
+
+        Args:
+            sound (Sound): sound to play.
+            when (float): time on monotonic clock.
+        Returns:
+            voice (Voice): handle to stop sound with.
+        """
+        ref_frame, ref_time = self._reference
+        start_frame = ref_frame + int(round((when - ref_time) * self.sample_rate))
+        voice = Voice(sound.converted(self.sample_rate, self.channels), start_frame, None)
+        self.mixer.add(voice)
+        return voice
+
+    def stop(self, voice):
+        if voice is not None:
+            voice.stopped = True
+
+    def _render(self, out, play_time):
+        """Render next block.
+
+        Args:
+            out (numpy.ndarray): float32 array of shape (frames, channels) to fill.
+            play_time (float): monotonic time when the first frame of the block is heard.
+        """
+        block_frame = self.mixer.frame
+        started = self.mixer.render(out)
+        for voice in started:
+            if voice.requested_at is not None:
+                heard_at = play_time + (voice.start_frame - block_frame) / self.sample_rate
+                self.start_latency = heard_at - voice.requested_at
+                metrics.observe("sound_start_latency_seconds", self.start_latency)
+        # Reference for play_at(): the next block follows right after this one
+        self._reference = (self.mixer.frame, play_time + len(out) / self.sample_rate)
+
+class NullAudioOutput(AudioOutput):
+    """Output without a device. Blocks are rendered and discarded, either on demand with
+    render() or in real time by a background thread after start(). Useful for headless
+    machines and for testing.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._thread = None
+        self._running = False
+
+    def render(self, frames=None):
+        """Render block right away, as if it started playing now.
+
+        Args:
+            frames (int): block length, block_size by default.
+        Returns:
+            block (numpy.ndarray): float32 array of shape (frames, channels).
+        """
+        out = np.zeros((frames or self.block_size, self.channels), dtype=np.float32)
+        self._render(out, max(self.clock(), self._reference[1]))
+        return out
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="NullAudioOutput", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        out = np.zeros((self.block_size, self.channels), dtype=np.float32)
+        block_duration = self.block_size / self.sample_rate
+        next_time = self.clock()
+        while self._running:
+            self._render(out, next_time)
+            next_time += block_duration
+            time.sleep(max(0.0, next_time - self.clock()))
+
+class SoundDeviceOutput(AudioOutput):
+    """Output to the default device through one persistent PortAudio stream (sounddevice).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        import sounddevice
+        self._stream = sounddevice.OutputStream(samplerate=self.sample_rate,
+                                                channels=self.channels,
+                                                blocksize=self.block_size,
+                                                dtype="float32",
+                                                latency="low",
+                                                callback=self._callback)
+
+    @property
+    def device_latency(self):
+        return self._stream.latency
+
+    def start(self):
+        self._stream.start()
+
+    def close(self):
+        self._stream.close()
+
+    def _callback(self, outdata, frames, time_info, status):
+        # Translate stream time of DAC output to monotonic clock
+        play_time = self.clock() + (time_info.outputBufferDacTime - time_info.currentTime)
+        self._render(outdata, play_time)
+
+class SimpleAudioOutput:
+    """Fallback output that plays each sound with simpleaudio in its own stream.
+    It can't schedule sounds ahead, so it has no play_at() and sounds are played at their deadlines.
+    """
+    supports_scheduling = False
+    latency = None
+    start_latency = None
+
+    def __init__(self):
+        import simpleaudio
+        self._simpleaudio = simpleaudio
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+    def play(self, sound):
+        # Stream is opened on every call, which is most of the delay before the sound starts
+        start = metrics.start()
+        play_object = self._simpleaudio.play_buffer(sound.pcm16(), sound.channels, 2, sound.sample_rate)
+        metrics.observe_since("sound_start_latency_seconds", start)
+        return play_object
+
+    def stop(self, voice):
+        if voice is not None:
+            voice.stop()
+
+def open_output(backend=None):
+    """Create and start audio output.
+
+    Args:
+        backend (str): "sounddevice", "simpleaudio" or "null". By default TIMERAPP_AUDIO
+            environment variable is used, or sounddevice with fallback to simpleaudio
+            if PortAudio is not available.
+    Returns:
+        output (AudioOutput or SimpleAudioOutput): started output.
+    """
+    backend = backend or os.environ.get("TIMERAPP_AUDIO")
+    if backend == "null":
+        output = NullAudioOutput()
+    elif backend == "simpleaudio":
+        output = SimpleAudioOutput()
+    else:
+        try:
+            output = SoundDeviceOutput()
+        except Exception as e:
+            if backend == "sounddevice":
+                raise
+            log.warning("persistent audio stream is not available, falling back to simpleaudio", extra={"error": str(e)})
+            output = SimpleAudioOutput()
+    output.start()
+    return output
@@ -0,0 +1,220 @@
+"""Benchmarks of TimerApp hot paths. Runs headless with Qt's offscreen platform and
+the null audio output, so no display or sound device is needed.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--output results.json] [--compare baseline.json] [--quick]
+"""
+import os
+import sys
+import json
+import logging
+import time
+import random
+import itertools
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+
+# Must be set before Qt and the app are imported
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ["TIMERAPP_AUDIO"] = "null"
+
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR))
+
+from PyQt6.QtWidgets import QApplication
+import main
+import sound_prep
+from multislider import MultiSlider
+from storage import SettingsStore, INSERT_HISTORY, settings_to_row
+from settings import SOUNDS_PATH
+
+# App's log records would only add noise and time to the measurements
+logging.getLogger("timerapp").setLevel(logging.CRITICAL)
+
+def measure(func, number, repeat, batch=1):
+    """Time func.
+
+    Args:
+        func (callable): function to time.
+        number (int): calls per sample.
+        repeat (int): number of samples.
+        batch (int): number of operations done by one call of func.
+    Returns:
+        result (dict): per-operation time statistics in seconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / (number * batch))
+    return {"number": number * batch,
+            "repeat": repeat,
+            "mean": statistics.fmean(samples),
+            "median": statistics.median(samples),
+            "min": min(samples),
+            "max": max(samples)}
+
+class BenchmarkSuite:
+    def __init__(self, quick=False):
+        self.quick = quick
+        self.results = []
+        self.tmp_dir = Path(tempfile.mkdtemp(prefix="timerapp-bench-"))
+        # Never touch the user's database
+        main.DB_PATH = self.tmp_dir / "timer_app.db"
+        # Nor its prepared sounds, which cold loads delete
+        sound_prep.prepared_sounds.directory = self.tmp_dir / "prepared_sounds"
+        self.app = QApplication.instance() or QApplication(sys.argv)
+        self.window = main.TimerApp()
+        self.window.show()
+        self.window.ensure_audio()
+
+    def close(self):
+        self.window.reset_timer()
+        self.window.writer.flush()
+        self.app.quit()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def scale(self, number):
+        return max(1, number // 10) if self.quick else number
+
+    def record(self, name, params, result):
+        print(f"{name:<28} {json.dumps(params):<40} {result['median'] * 1e6:12.2f} us")
+        self.results.append({"name": name, "params": params, **result})
+
+    def run(self):
+        self.bench_update_timer()
+        self.bench_get_time()
+        self.bench_settings_db()
+        self.bench_load_sounds()
+        self.bench_multislider()
+        return self.results
+
+    def bench_update_timer(self):
+        window = self.window
+        window.settings = window.settings.replace(timer_duration=3600.0)
+        window.start_timer()
+        for precision in (0, 2):
+            window.set_display_precision(precision)
+
+            def tick():
+                window.update_timer()
+                # Drop the tick scheduled by update_timer, only the tick itself is measured
+                window.scheduler.cancel(window.tick_event)
+
+            self.record("update_timer", {"precision": precision}, measure(tick, self.scale(2000), 5))
+        window.reset_timer()
+
+    def bench_get_time(self):
+        values = [random.uniform(0, 7200) for _ in range(1000)]
+        self.record("get_time", {}, measure(lambda: [self.window.get_time(v) for v in values], self.scale(20), 5, len(values)))
+        formatter = main.TimeFormatter(2)
+        self.record("TimeFormatter.format", {}, measure(lambda: [formatter.format(v) for v in values], self.scale(20), 5, len(values)))
+
+    def bench_settings_db(self):
+        window = self.window
+        db_path = self.tmp_dir / "settings_growth.db"
+        for history_rows in (0, 1000, 10000, 100000):
+            store = SettingsStore(db_path, history_limit=10 ** 9)
+            # Grow history to the wanted size
+            missing = history_rows - store.con.execute("SELECT COUNT(*) FROM settings_history").fetchone()[0]
+            if missing > 0:
+                values = settings_to_row(window.settings)
+                with store.transaction():
+                    store.con.executemany(INSERT_HISTORY, ((time.time(), *values) for _ in range(missing)))
+            params = {"history_rows": history_rows}
+            # Unchanged settings are not written, so every save changes the duration
+            snapshots = itertools.cycle([window.settings, window.settings.replace(timer_duration=window.settings.timer_duration + 1)])
+            self.record("store.save_settings", params, measure(lambda: store.save_settings(next(snapshots)), self.scale(200), 5))
+            self.record("store.load_settings", params, measure(store.load_settings, self.scale(500), 5))
+            store.close()
+        self.record("save_settings_to_db", {}, measure(window.save_settings_to_db, self.scale(500), 5))
+        self.record("load_settings_from_db", {}, measure(window.load_settings_from_db, self.scale(500), 5))
+        window.writer.flush()
+
+    def bench_load_sounds(self):
+        window = self.window
+        for name in ("bell.wav", "beep.wav"):
+            window.settings = window.settings.replace(final_sound_filename=str(SOUNDS_PATH / name),
+                                                      intermediate_sound_filename=str(SOUNDS_PATH / name))
+
+            def cold():
+                main.sound_cache.clear()
+                sound_prep.prepared_sounds.clear()
+                window.load_sounds()
+
+            def prepared():
+                main.sound_cache.clear()
+                window.load_sounds()
+
+            self.record("load_sounds", {"file": name, "cache": "cold"}, measure(cold, self.scale(20), 5))
+            # Sounds are prepared already, only their files are read
+            self.record("load_sounds", {"file": name, "cache": "prepared"}, measure(prepared, self.scale(20), 5))
+            self.record("load_sounds", {"file": name, "cache": "warm"}, measure(window.load_sounds, self.scale(200), 5))
+
+    def bench_multislider(self):
+        slider = MultiSlider()
+        slider.resize(400, 20)
+        slider.show()
+        self.app.processEvents()
+        rng = random.Random(0)
+        for count in (10, 100, 1000, 10000, 100000):
+            slider.set_points([rng.random() for _ in range(count)])
+            params = {"points": count}
+
+            def full_paint():
+                slider.invalidate_cache()
+                slider.repaint()
+
+            self.record("MultiSlider.paint_full", params, measure(full_paint, self.scale(50), 5))
+            self.record("MultiSlider.paint_cached", params, measure(slider.repaint, self.scale(200), 5))
+            xs = [rng.uniform(0, slider.width()) for _ in range(100)]
+            self.record("MultiSlider.is_on_point", params, measure(lambda: [slider.is_on_point(x) for x in xs], self.scale(50), 5, len(xs)))
+        slider.close()
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=APP_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path):
+    """Print ratio of median times to a baseline results file.
+    """
+    with open(baseline_path) as f:
+        baseline = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(f)["results"]}
+    print(f"\nCompared to {baseline_path} (ratio > 1 is slower):")
+    for result in results:
+        key = (result["name"], json.dumps(result["params"], sort_keys=True))
+        if key in baseline:
+            ratio = result["median"] / baseline[key]["median"]
+            print(f"{result['name']:<28} {key[1]:<40} {ratio:8.2f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run TimerApp benchmarks headless.")
+    parser.add_argument("--output", default="benchmark_results.json", help="path to write JSON results to")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--quick", action="store_true", help="run fewer iterations")
+    args = parser.parse_args()
+
+    suite = BenchmarkSuite(quick=args.quick)
+    try:
+        results = suite.run()
+    finally:
+        suite.close()
+    report = {"commit": git_commit(),
+              "timestamp": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
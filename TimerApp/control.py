@@ -0,0 +1,362 @@
+"""Control API over a local Unix socket, shared by the GUI and the headless service.
+
+Protocol: every request is one line of JSON and gets one line of JSON in response.
+A request is a command object or an array of command objects; an array is run in order
+and answered with an array of results, so any number of commands takes one round trip.
+
+    {"cmd": "start", "timer": "timer-1"}      -> {"ok": true}
+    [{"cmd": "start"}, {"cmd": "status"}]     -> [{"ok": true}, {"ok": true, "result": {...}}]
+    {"cmd": "nope"}                           -> {"ok": false, "error": "Unknown command 'nope'"}
+
+Commands: start, pause, resume, reset (all timers if "timer" is omitted), load-profile
+("timer", "profile"), status, subscribe ("timers", "interval") and unsubscribe.
+"id" of a command is copied to its result. After subscribe the server also sends event
+lines: {"event": "start", "timer": ...} on state changes and, while subscribed timers run,
+{"event": "tick", "remaining": {timer: seconds}} every interval.
+
+Usage of the client:
+    python control.py start timer-1 timer-2
+    python control.py subscribe
+"""
+import os
+import sys
+import json
+import socket
+import asyncio
+import logging
+import argparse
+from settings import CONTROL_SOCKET_PATH
+
+log = logging.getLogger("timerapp.control")
+
+# Longest request line, and most unsent output a client may fall behind by
+MAX_LINE = 1024 * 1024
+
+class ControlSession:
+    """Protocol state of one client connection, independent of transport.
+
+    Transport passes received lines to handle_line() and calls close() on disconnect.
+    Responses and events are written with send(line). Commands run on target, which must
+    provide countdowns (dict name -> Countdown), scheduler, start(name), pause(name),
+    resume(name), reset(name) and load_profile(name, profile_name).
+    """
+    DEFAULT_INTERVAL = 0.1
+    MIN_INTERVAL = 0.01
+
+    def __init__(self, target, send):
+        """
+        Args:
+            target: timers to control, e.g. daemon.TimerService.
+            send (callable): send(line) writes one line, without newline, to client.
+        """
+        self.target = target
+        self.send = send
+        # Names of subscribed timers, None if not subscribed
+        self.subscribed = None
+        self.interval = self.DEFAULT_INTERVAL
+        self.tick_event = None
+        self.commands = {"start": self.run_on_timers(target.start),
+                         "pause": self.run_on_timers(target.pause),
+                         "resume": self.run_on_timers(target.resume),
+                         "reset": self.run_on_timers(target.reset),
+                         "load-profile": self.load_profile,
+                         "status": self.status,
+                         "subscribe": self.subscribe,
+                         "unsubscribe": self.unsubscribe}
+
+    def handle_line(self, line):
+        """Run request and send its response. A request that fails in any way, e.g. JSON
+        nested too deep to parse, is answered with an error and logged; it never reaches
+        the transport, which may be running in a GUI slot.
+
+        Args:
+            line (str or bytes): one request line.
+        """
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                self.send_json({"ok": False, "error": f"Invalid JSON: {e}"})
+                return
+            if isinstance(request, list):
+                self.send_json([self.run(command) for command in request])
+            else:
+                self.send_json(self.run(request))
+        except Exception as e:
+            log.error("control request failed", extra={"error": repr(e), "length": len(line)})
+            self.send_json({"ok": False, "error": f"Request failed: {e}"})
+
+    def run(self, command):
+        """Run one command.
+
+        Args:
+            command (dict): command object.
+        Returns:
+            result (dict): result object.
+        """
+        if not isinstance(command, dict):
+            return {"ok": False, "error": "Command must be an object"}
+        name = command.get("cmd")
+        # Names that aren't strings, e.g. lists, can't even be looked up
+        handler = self.commands.get(name) if isinstance(name, str) else None
+        if handler is None:
+            result = {"ok": False, "error": f"Unknown command {name!r}"}
+        else:
+            try:
+                value = handler(command)
+                result = {"ok": True} if value is None else {"ok": True, "result": value}
+            except (KeyError, ValueError, TypeError) as e:
+                # KeyError's message is its only argument
+                result = {"ok": False, "error": e.args[0] if isinstance(e, KeyError) else str(e)}
+            except Exception as e:
+                # One failing command must not take down the rest of its batch
+                log.error("control command failed", extra={"cmd": name, "error": repr(e)})
+                result = {"ok": False, "error": f"Command failed: {e}"}
+        if "id" in command:
+            result["id"] = command["id"]
+        return result
+
+    def run_on_timers(self, method):
+        def handler(command):
+            for name in self.timer_names(command.get("timer")):
+                method(name)
+        return handler
+
+    def timer_names(self, names):
+        if names is None:
+            return list(self.target.countdowns)
+        if isinstance(names, str):
+            names = [names]
+        for name in names:
+            if name not in self.target.countdowns:
+                raise KeyError(f"No timer named {name!r}")
+        return names
+
+    def load_profile(self, command):
+        if "profile" not in command:
+            raise ValueError("load-profile needs a profile")
+        for name in self.timer_names(command.get("timer")):
+            self.target.load_profile(name, command["profile"])
+
+    def status(self, command):
+        return {name: timer_status(self.target.countdowns[name])
+                for name in self.timer_names(command.get("timer"))}
+
+    def subscribe(self, command):
+        """Start sending state events and remaining time of timers.
+        """
+        names = self.timer_names(command.get("timers"))
+        interval = max(self.MIN_INTERVAL, float(command.get("interval", self.DEFAULT_INTERVAL)))
+        self.unsubscribe(command)
+        self.subscribed = names
+        self.interval = interval
+        for name in names:
+            self.target.countdowns[name].listeners.append(self.on_countdown_event)
+        self.schedule_tick()
+
+    def unsubscribe(self, command=None):
+        if self.subscribed is None:
+            return
+        for name in self.subscribed:
+            countdown = self.target.countdowns.get(name)
+            if countdown is not None and self.on_countdown_event in countdown.listeners:
+                countdown.listeners.remove(self.on_countdown_event)
+        self.subscribed = None
+        self.target.scheduler.cancel(self.tick_event)
+        self.tick_event = None
+
+    def close(self):
+        self.unsubscribe()
+
+    def on_countdown_event(self, countdown, event):
+        self.send_json({"event": event, "timer": countdown.name, **timer_status(countdown)})
+        if self.tick_event is None:
+            self.schedule_tick()
+
+    def schedule_tick(self):
+        # Ticks run only while some subscribed timer is running, countdown events restart them
+        if not any(self.target.countdowns[name].is_running for name in self.subscribed):
+            self.tick_event = None
+            return
+        scheduler = self.target.scheduler
+        self.tick_event = scheduler.schedule(scheduler.clock() + self.interval, self.tick, precise=False)
+
+    def tick(self):
+        remaining = {}
+        for name in self.subscribed:
+            countdown = self.target.countdowns[name]
+            if countdown.is_running:
+                remaining[name] = round(countdown.remaining(), 3)
+        if remaining:
+            self.send_json({"event": "tick", "remaining": remaining})
+        self.schedule_tick()
+
+    def send_json(self, message):
+        self.send(json.dumps(message, separators=(",", ":")))
+
+def timer_status(countdown):
+    """Get state of countdown as sent to clients.
+
+    Returns: status (dict)"""
+    if countdown.is_running:
+        state = "running"
+    elif countdown.is_paused:
+        state = "paused"
+    else:
+        state = "stopped"
+    return {"state": state,
+            "remaining": round(countdown.remaining(), 3),
+            "duration": countdown.engine.duration}
+
+def bounded_sender(write, buffered, abort):
+    """Make send(line) for ControlSession over a transport's write buffer. Clients that don't
+    read their events are disconnected rather than buffered without limit.
+
+    Args:
+        write (callable): write(data) queues bytes for client.
+        buffered (callable): buffered() gives number of bytes not yet sent.
+        abort (callable): abort() drops connection and unsent data.
+    Returns:
+        send (callable)"""
+    def send(line):
+        if buffered() > MAX_LINE:
+            abort()
+            return
+        write(line.encode() + b"\n")
+    return send
+
+def remove_stale_socket(path):
+    """Remove socket file left by a process that didn't exit cleanly.
+
+    Raises:
+        OSError: if another server is listening on path.
+    """
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(str(path))
+        except OSError:
+            os.unlink(path)
+            return
+    raise OSError(f"Control socket {path} is in use")
+
+async def start_control_server(target, path=CONTROL_SOCKET_PATH):
+    """Start serving control API for target on asyncio event loop.
+
+    Args:
+        target: timers to control, see ControlSession.
+        path (str or pathlib.Path): path of Unix socket.
+    Returns:
+        server (asyncio.Server)"""
+    remove_stale_socket(path)
+
+    async def handle_client(reader, writer):
+        send = bounded_sender(writer.write, writer.transport.get_write_buffer_size, writer.transport.abort)
+        session = ControlSession(target, send)
+        try:
+            while line := await reader.readline():
+                session.handle_line(line)
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            # ValueError: request line longer than reader's limit
+            pass
+        finally:
+            session.close()
+            writer.close()
+
+    server = await asyncio.start_unix_server(handle_client, path, limit=MAX_LINE)
+    log.info("control server listening", extra={"path": str(path)})
+    return server
+
+class ControlClient:
+    """Blocking client of control API.
+    """
+
+    def __init__(self, path=CONTROL_SOCKET_PATH, timeout=None):
+        """
+        Args:
+            path (str or pathlib.Path): path of server's Unix socket.
+            timeout (float): socket timeout in seconds.
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(str(path))
+        self.file = self.sock.makefile("rb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def request(self, request):
+        """Send request and wait for its response. Events received meanwhile are skipped.
+
+        Args:
+            request (dict or list of dict): command or batch of commands.
+        Returns:
+            response (dict or list of dict): result or list of results.
+        """
+        self.sock.sendall(json.dumps(request, separators=(",", ":")).encode() + b"\n")
+        while True:
+            message = self.receive()
+            if isinstance(message, list) or "event" not in message:
+                return message
+
+    def receive(self):
+        """Wait for next line from server.
+
+        Returns:
+            message (dict or list): response or event.
+        """
+        line = self.file.readline(MAX_LINE)
+        if not line:
+            raise ConnectionError("Control server closed connection")
+        return json.loads(line)
+
+    def events(self):
+        """Iterate over events after subscribe, forever.
+        """
+        while True:
+            yield self.receive()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Control running timers.")
+    parser.add_argument("command", choices=["start", "pause", "resume", "reset", "load-profile", "status", "subscribe"])
+    parser.add_argument("timers", nargs="*", help="timer names, all timers by default")
+    parser.add_argument("--profile", help="profile name for load-profile")
+    parser.add_argument("--interval", type=float, default=ControlSession.DEFAULT_INTERVAL,
+                        help="seconds between remaining time updates for subscribe")
+    parser.add_argument("--socket", default=CONTROL_SOCKET_PATH, help="path of control socket")
+    args = parser.parse_args(argv)
+    with ControlClient(args.socket) as client:
+        if args.command == "subscribe":
+            command = {"cmd": "subscribe", "interval": args.interval}
+            if args.timers:
+                command["timers"] = args.timers
+            print(json.dumps(client.request(command)))
+            try:
+                for event in client.events():
+                    print(json.dumps(event), flush=True)
+            except KeyboardInterrupt:
+                return 0
+        # One command per timer, sent as one batch
+        commands = []
+        for name in args.timers or [None]:
+            command = {"cmd": args.command}
+            if name is not None:
+                command["timer"] = name
+            if args.profile is not None:
+                command["profile"] = args.profile
+            commands.append(command)
+        results = client.request(commands)
+        print(json.dumps(results if len(results) > 1 else results[0], indent=2))
+        return 0 if all(result["ok"] for result in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,436 @@
+import time
+import logging
+from timer_engine import TimerEngine, BellSchedule
+from sound_cache import SoundCache
+from instrumentation import metrics
+from settings import changed_fields
+
+log = logging.getLogger("timerapp.countdown")
+
+# Memory budget for decoded sounds kept in sound cache
+SOUND_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Settings fields with sound file paths -> Countdown attributes with their sounds
+SOUND_FILE_FIELDS = {"final_sound_filename": "final_sound",
+                     "intermediate_sound_filename": "intermediate_sound"}
+# Settings fields that decide what is played at bells and finish
+SOUND_FIELDS = frozenset({"enable_sound", *SOUND_FILE_FIELDS})
+# Sounds are queued on audio output this long before their deadlines. Queued sounds start on
+# the exact sample of the deadline; queueing them earlier would let the difference between
+# the device's clock and the system's clock build up.
+SOUND_QUEUE_AHEAD = 0.5
+
+def load_sound(path):
+    """Load sound file converted to output format, converting it on first use of the file
+    (see sound_prep.py). sound_prep module (and NumPy with it) is imported on first call,
+    which happens on a background thread during startup.
+
+    Returns: sound (audio.Sound or audio.StreamedSound)"""
+    import sound_prep
+    start = metrics.start()
+    sound = sound_prep.prepared_sounds.load(path)
+    metrics.observe_since("sound_decode_seconds", start)
+    return sound
+
+# Decoded sounds shared by all countdowns of the process
+sound_cache = SoundCache(load_sound, SOUND_CACHE_MAX_BYTES)
+
+def checkpoint_name(namespace, name):
+    """Get name that countdown's checkpoint is saved under. Frontends that share a database,
+    like dashboard and daemon, use different namespaces, so that their countdowns with equal
+    names don't overwrite each other's checkpoints.
+
+    Args:
+        namespace (str): frontend's namespace, None for none.
+        name (str): name of countdown.
+    Returns:
+        name (str): name of checkpoint.
+    """
+    return name if namespace is None else f"{namespace}/{name}"
+
+def checkpoint_listener(submit, namespace=None):
+    """Make countdown listener that keeps countdown's checkpoint in database up to date.
+    Checkpoints are written on state changes only, never on display updates.
+
+    Args:
+        submit (callable): submit(job, key) queues job(store) on a writer thread,
+            e.g. storage.BackgroundWriter.submit().
+        namespace (str): namespace of checkpoint names, see checkpoint_name().
+    Returns:
+        listener (callable): listener to add to Countdown.listeners.
+    """
+    def listener(countdown, event):
+        name = checkpoint_name(namespace, countdown.name)
+        checkpoint = countdown.checkpoint()
+        if checkpoint is None:
+            submit(lambda store: store.delete_checkpoint(name), key=("checkpoint", name))
+        else:
+            checkpoint["name"] = name
+            submit(lambda store: store.save_checkpoint(checkpoint), key=("checkpoint", name))
+    return listener
+
+class Countdown:
+    """One timer: countdown, intermediate bells, sounds and run history, without any UI.
+
+    Bells and the final deadline are events on a Scheduler, which may be shared by any number
+    of countdowns and driven by QTimer or asyncio alike. Sounds are queued on the audio output
+    shortly before their deadlines when it supports that. Frontends follow the countdown through
+    listeners: listener(countdown, event) is called after "start", "pause", "resume", "reset",
+    "bell" and "finish".
+    """
+
+    def __init__(self, scheduler, settings, audio=None, on_session=None, name=None):
+        """
+        Args:
+            scheduler (Scheduler): scheduler to put bell and finish events on.
+            settings (settings.Settings): settings of countdown. Duration applies from the next start or reset.
+            audio (audio.AudioOutput or audio.SimpleAudioOutput): output to play sounds on,
+                None to stay silent until it is set.
+            on_session (callable): on_session(session) is called with a finished or interrupted run,
+                see storage.SettingsStore.add_sessions().
+            name (str): name of countdown, e.g. station name.
+        """
+        self.scheduler = scheduler
+        self.settings = settings
+        self.audio = audio
+        self.on_session = on_session
+        self.name = name
+        self.listeners = []
+        self.final_sound = None
+        self.intermediate_sound = None
+        self.engine = TimerEngine(settings.timer_duration, clock=scheduler.clock)
+        self.bells = BellSchedule([], 0)
+        # Number of times this countdown's events woke the application during current run
+        self.wakeups = 0
+        # Pending scheduler events
+        self.bell_event = None
+        self.finish_event = None
+        # Pending events that queue sounds of the next bell and finish on audio output
+        self.bell_queue_event = None
+        self.final_queue_event = None
+        # Sounds queued on audio output ahead of their deadlines
+        self.bell_voice = None
+        self.final_voice = None
+        # Wall-clock start of current run, None if countdown is not running
+        self.session_started_at = None
+
+    @property
+    def is_running(self):
+        return self.engine.is_running
+
+    @property
+    def is_paused(self):
+        return self.engine.is_paused
+
+    def remaining(self):
+        return self.engine.remaining()
+
+    def load_sounds(self, fields=tuple(SOUND_FILE_FIELDS), sounds=None):
+        """Take sounds of current settings from sound cache, decoding them if needed.
+        A sound that fails to load is logged and the previous one is kept; until some sound
+        loads, its bell or finish stays silent.
+
+        Args:
+            fields (iterable of str): settings fields of sounds to load, both sounds by default.
+            sounds (dict): settings field -> sound already decoded for current settings, e.g.
+                profile's sounds. Sounds that are missing or None are taken from sound cache.
+        """
+        for field, attribute in SOUND_FILE_FIELDS.items():
+            if field not in fields:
+                continue
+            sound = sounds.get(field) if sounds else None
+            if sound is not None:
+                setattr(self, attribute, sound)
+                continue
+            path = getattr(self.settings, field)
+            try:
+                setattr(self, attribute, sound_cache.get(path))
+            except Exception as e:
+                log.warning("sound not loaded", extra={"countdown": self.name, "path": path, "error": str(e)})
+
+    def set_audio(self, audio):
+        """Start playing sounds on audio output, e.g. once it's opened in background.
+        Sounds are loaded and those of a running countdown are queued.
+
+        Args:
+            audio (audio.AudioOutput or audio.SimpleAudioOutput): output to play sounds on.
+        """
+        self.audio = audio
+        self.load_sounds()
+        self.requeue_sounds()
+
+    def apply_settings(self, settings, sounds=None):
+        """Make new settings active, reloading only sounds whose paths changed. Running countdown
+        is not interrupted, new duration applies from the next start or reset; if its sounds
+        or enable_sound changed, sounds already queued on audio output are replaced.
+
+        Args:
+            settings (settings.Settings): new settings.
+            sounds (dict): sounds already decoded for new settings, see load_sounds().
+        Returns:
+            changed (frozenset of str): names of changed fields, see settings.changed_fields().
+        """
+        changed = changed_fields(self.settings, settings)
+        self.settings = settings
+        self.load_sounds(changed, sounds)
+        if changed & SOUND_FIELDS:
+            self.requeue_sounds()
+        return changed
+
+    def start(self):
+        """Start countdown from full duration. Running countdown is restarted.
+        """
+        self.end_session("reset")
+        self.cancel_events()
+        self.engine.reset(self.settings.timer_duration)
+        self.engine.start()
+        self.session_started_at = time.time()
+        self.wakeups = 0
+        self.bells = BellSchedule(self.settings.intermediate_bells, self.engine.duration)
+        self.schedule_finish()
+        self.schedule_bell()
+        self.notify("start")
+
+    def pause(self):
+        """Freeze countdown. Does nothing if it is not running.
+        """
+        if not self.engine.is_running:
+            return
+        self.cancel_events()
+        self.engine.pause()
+        self.notify("pause")
+
+    def resume(self):
+        """Continue paused countdown. Bells that were due before pausing don't ring again.
+        """
+        if not self.engine.is_paused:
+            return
+        self.engine.resume()
+        self.bells.seek(self.engine.duration - self.engine.remaining())
+        self.schedule_finish()
+        self.schedule_bell()
+        self.notify("resume")
+
+    def reset(self, duration=None):
+        """Stop countdown.
+
+        Args:
+            duration (float): new duration, duration from settings by default.
+        """
+        self.end_session("reset")
+        self.cancel_events()
+        self.engine.reset(self.settings.timer_duration if duration is None else duration)
+        self.notify("reset")
+
+    def checkpoint(self):
+        """Get state of running or paused countdown that restore() can continue from, even
+        in another process. Deadline is saved as Unix time, since monotonic clocks restart with the system.
+
+        Returns:
+            checkpoint (dict): checkpoint dictionary, see storage.SettingsStore.save_checkpoint(),
+                or None if countdown is stopped.
+        """
+        if self.session_started_at is None:
+            return None
+        deadline = None
+        if self.engine.is_running:
+            deadline = time.time() + (self.engine.deadline - self.scheduler.clock())
+        return {"name": self.name,
+                "deadline": deadline,
+                "paused_remaining": self.engine.paused_remaining,
+                "duration": self.engine.duration,
+                "bell_offsets": self.bells.offsets,
+                "bells_fired": self.bells.fired,
+                "bells_skipped": self.bells.skipped,
+                "started_at": self.session_started_at}
+
+    def restore(self, checkpoint):
+        """Continue run saved by checkpoint(). Running countdown keeps its original deadline;
+        bells that came due meanwhile are skipped: they don't ring and don't count as fired
+        in the run's session. A run whose deadline passed meanwhile is recorded as finished
+        without playing the final sound. Listeners get "resume", "pause" or "finish".
+
+        Args:
+            checkpoint (dict): checkpoint dictionary.
+        Returns:
+            restored (bool): whether countdown is running or paused now.
+        """
+        self.end_session("reset")
+        self.cancel_events()
+        self.engine.reset(checkpoint["duration"])
+        self.bells = BellSchedule.from_offsets(checkpoint["bell_offsets"], checkpoint["bells_fired"],
+                                               checkpoint["bells_skipped"])
+        self.session_started_at = checkpoint["started_at"]
+        self.wakeups = 0
+        if checkpoint["deadline"] is None:
+            self.engine.paused_remaining = checkpoint["paused_remaining"]
+            self.notify("pause")
+            return True
+        remaining = checkpoint["deadline"] - time.time()
+        if remaining <= 0:
+            self.bells.skip(checkpoint["duration"])
+            self.session_started_at = None
+            self.engine.reset(self.settings.timer_duration)
+            if self.on_session is not None:
+                self.on_session({"started_at": checkpoint["started_at"],
+                                 "ended_at": checkpoint["deadline"],
+                                 "duration": checkpoint["duration"],
+                                 "elapsed": checkpoint["duration"],
+                                 "bells_fired": self.bells.fired,
+                                 "outcome": "finished"})
+            self.notify("finish")
+            return False
+        self.engine.deadline = self.scheduler.clock() + remaining
+        self.bells.skip(self.engine.duration - remaining)
+        self.schedule_finish()
+        self.schedule_bell()
+        self.notify("resume")
+        return True
+
+    def schedule_finish(self):
+        self.finish_event = self.scheduler.schedule(self.engine.deadline, self.finish)
+        self.final_queue_event = self.schedule_sound("final", self.engine.deadline)
+
+    def schedule_bell(self):
+        """Schedule the next intermediate bell, if any left.
+        """
+        offset = self.bells.next_offset()
+        if offset is None:
+            self.bell_event = None
+            self.bell_queue_event = None
+            return
+        deadline = self.engine.deadline - self.engine.duration + offset
+        self.bell_event = self.scheduler.schedule(deadline, self.ring_bell)
+        self.bell_queue_event = self.schedule_sound("bell", deadline)
+
+    def schedule_sound(self, kind, deadline):
+        """Arrange for sound of a bell or finish to be queued on audio output SOUND_QUEUE_AHEAD
+        before deadline, if audio output supports scheduling. Sounds due sooner are queued now.
+
+        Args:
+            kind (str): "bell" or "final".
+            deadline (float): time on scheduler's clock.
+        Returns:
+            event (ScheduledEvent): pending event that queues the sound, None if there is none.
+        """
+        if self.audio is None or not self.audio.supports_scheduling:
+            return None
+        queue_at = deadline - SOUND_QUEUE_AHEAD
+        if queue_at <= self.scheduler.clock():
+            self.queue_sound(kind, deadline)
+            return None
+        return self.scheduler.schedule(queue_at, self.wake_to_queue_sound, kind, deadline)
+
+    def wake_to_queue_sound(self, kind, deadline):
+        self.wakeups += 1
+        self.queue_sound(kind, deadline)
+
+    def queue_sound(self, kind, deadline):
+        """Queue sound on audio output to start exactly at deadline, if sound is enabled.
+        Bell or finish plays the sound itself if it is not queued.
+
+        Args:
+            kind (str): "bell" or "final".
+            deadline (float): time on scheduler's clock.
+        """
+        sound = self.intermediate_sound if kind == "bell" else self.final_sound
+        voice = self.audio.play_at(sound, deadline) if self.sound_enabled(sound) else None
+        if kind == "bell":
+            self.bell_voice = voice
+        else:
+            self.final_voice = voice
+
+    def requeue_sounds(self):
+        """Stop sounds queued for the next bell and finish and queue current ones instead,
+        e.g. after sounds or enable_sound changed. Does nothing if countdown is not running.
+        """
+        if not self.engine.is_running:
+            return
+        self.cancel_sounds()
+        self.final_queue_event = self.schedule_sound("final", self.engine.deadline)
+        if self.bell_event is not None:
+            self.bell_queue_event = self.schedule_sound("bell", self.bell_event.deadline)
+
+    def sound_enabled(self, sound):
+        return self.settings.enable_sound and self.audio is not None and sound is not None
+
+    def ring_bell(self):
+        """Play intermediate sound (unless already queued on audio output) and schedule the next bell.
+        """
+        self.wakeups += 1
+        self.observe_lateness(self.bell_event, "bell")
+        self.bells.advance()
+        if self.bell_voice is None and self.sound_enabled(self.intermediate_sound):
+            self.audio.play(self.intermediate_sound)
+        self.bell_voice = None
+        self.schedule_bell()
+        self.notify("bell")
+
+    def finish(self):
+        """Stop countdown when the deadline is reached [and play sound].
+        """
+        self.wakeups += 1
+        self.observe_lateness(self.finish_event, "finish")
+        # Keep sounds that are playing now
+        final_queued = self.final_voice is not None
+        self.bell_voice = None
+        self.final_voice = None
+        self.cancel_events()
+        self.end_session("finished")
+        self.engine.reset(self.settings.timer_duration)
+        if not final_queued and self.sound_enabled(self.final_sound):
+            self.audio.play(self.final_sound)
+        self.notify("finish")
+
+    def cancel_events(self):
+        """Cancel pending bell and finish events and stop sounds queued on audio output.
+        """
+        self.cancel_sounds()
+        self.scheduler.cancel(self.bell_event)
+        self.scheduler.cancel(self.finish_event)
+        self.bell_event = None
+        self.finish_event = None
+
+    def cancel_sounds(self):
+        """Stop sounds queued on audio output and cancel pending queueing of sounds.
+        """
+        if self.audio is not None:
+            self.audio.stop(self.bell_voice)
+            self.audio.stop(self.final_voice)
+        self.bell_voice = None
+        self.final_voice = None
+        self.scheduler.cancel(self.bell_queue_event)
+        self.scheduler.cancel(self.final_queue_event)
+        self.bell_queue_event = None
+        self.final_queue_event = None
+
+    def end_session(self, outcome):
+        """Pass current run to on_session, if countdown is running or paused.
+
+        Args:
+            outcome (str): "finished" if countdown reached zero, "reset" if it was interrupted.
+        """
+        if self.session_started_at is None:
+            return
+        session = {"started_at": self.session_started_at,
+                   "ended_at": time.time(),
+                   "duration": self.engine.duration,
+                   "elapsed": self.engine.duration - self.engine.remaining(),
+                   "bells_fired": self.bells.fired,
+                   "outcome": outcome}
+        self.session_started_at = None
+        if self.on_session is not None:
+            self.on_session(session)
+
+    def observe_lateness(self, event, kind):
+        """Record how late a scheduler event of this countdown fired.
+
+        Args:
+            event (ScheduledEvent): event being fired.
+            kind (str): "tick", "bell" or "finish".
+        """
+        if metrics.enabled:
+            metrics.observe("tick_lateness_seconds", max(0.0, self.scheduler.clock() - event.deadline), event=kind)
+
+    def notify(self, event):
+        for listener in self.listeners:
+            listener(self, event)
@@ -0,0 +1,236 @@
+"""Headless timer service: runs any number of countdowns in one asyncio event loop, without Qt.
+
+Usage:
+    python daemon.py --timers 4 --duration 300 --start
+    python daemon.py --timers 100 --control
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+import argparse
+from scheduler import Scheduler
+from storage import SettingsStore, BackgroundWriter
+from settings import DB_PATH, CONTROL_SOCKET_PATH, load_settings
+from countdown import Countdown, sound_cache, checkpoint_listener, checkpoint_name
+from instrumentation import metrics, configure_metrics, configure_logging
+from control import start_control_server
+import profiles
+
+log = logging.getLogger("timerapp.daemon")
+
+# Namespace of daemon's checkpoints, see countdown.checkpoint_name()
+CHECKPOINT_NAMESPACE = "daemon"
+
+def create_scheduler(loop):
+    """Create scheduler driven by asyncio event loop. asyncio has one kind of timer,
+    so events' precision is not used.
+
+    Args:
+        loop (asyncio.AbstractEventLoop): running event loop.
+    Returns:
+        scheduler (Scheduler)"""
+    handle = None
+
+    def arm(delay, precise):
+        nonlocal handle
+        if handle is not None:
+            handle.cancel()
+            handle = None
+        if delay is not None:
+            handle = loop.call_later(delay, scheduler.run_due)
+
+    # Same clock as audio output's, so that sounds can be queued at scheduler's deadlines
+    scheduler = Scheduler(arm, clock=time.monotonic)
+    return scheduler
+
+def open_audio_output():
+    # Imported here, since audio module loads NumPy
+    import audio
+    return audio.open_output()
+
+class TimerService:
+    """Countdowns of one process sharing scheduler, audio output, sound cache and database.
+
+    Settings and profiles are read from the same database as the GUI uses and runs are
+    recorded in its history. All methods must be called from the event loop's thread;
+    slow work (decoding sounds, opening audio, loading profiles) is done in executor threads.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        """
+        Args:
+            db_path (str or pathlib.Path): path to database file.
+        """
+        self.db_path = db_path
+        self.loop = None
+        self.scheduler = None
+        self.store = None
+        self.writer = None
+        self.audio = None
+        self.settings = None
+        self.profiles = {}
+        # name -> checkpoint of countdown that was running or paused when service last exited
+        self.checkpoints = {}
+        # name -> Countdown
+        self.countdowns = {}
+        self.listeners = []
+
+    async def open(self):
+        """Open database and audio output and load profiles.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.scheduler = create_scheduler(self.loop)
+        self.store = SettingsStore(self.db_path)
+        self.settings, _ = load_settings(self.store)
+        self.checkpoints = self.store.load_checkpoints()
+        self.writer = BackgroundWriter(self.db_path, on_error=self.log_persistence_error)
+        self.audio, self.profiles = await asyncio.gather(self.loop.run_in_executor(None, open_audio_output),
+                                                         self.loop.run_in_executor(None, self.load_profiles))
+
+    def load_profiles(self):
+        # Runs on executor thread, which needs its own connection
+        store = SettingsStore(self.db_path)
+        try:
+            return profiles.load_profiles(store, sound_cache)
+        finally:
+            store.close()
+
+    async def close(self):
+        """Stop scheduling and write pending history. Running countdowns are left as they are.
+        """
+        for countdown in self.countdowns.values():
+            countdown.cancel_events()
+        await self.loop.run_in_executor(None, self.writer.close)
+        self.store.close()
+        self.audio.close()
+
+    async def add_timer(self, name, settings=None):
+        """Create countdown and decode its sounds. Countdown that was running or paused
+        when service last exited is continued.
+
+        Args:
+            name (str): unique name of countdown.
+            settings (settings.Settings): settings of countdown, active settings from database by default.
+        Returns:
+            countdown (Countdown)"""
+        if name in self.countdowns:
+            raise ValueError(f"Timer {name!r} already exists")
+        countdown = Countdown(self.scheduler, settings or self.settings, self.audio,
+                              on_session=self.record_session, name=name)
+        countdown.listeners.append(self.on_countdown_event)
+        countdown.listeners.append(checkpoint_listener(self.writer.submit, CHECKPOINT_NAMESPACE))
+        await self.loop.run_in_executor(None, countdown.load_sounds)
+        self.countdowns[name] = countdown
+        checkpoint = self.checkpoints.pop(checkpoint_name(CHECKPOINT_NAMESPACE, name), None)
+        if checkpoint is not None:
+            countdown.restore(checkpoint)
+        return countdown
+
+    def get_timer(self, name):
+        try:
+            return self.countdowns[name]
+        except KeyError:
+            raise KeyError(f"No timer named {name!r}") from None
+
+    def start(self, name):
+        self.get_timer(name).start()
+
+    def pause(self, name):
+        self.get_timer(name).pause()
+
+    def resume(self, name):
+        self.get_timer(name).resume()
+
+    def reset(self, name):
+        self.get_timer(name).reset()
+
+    def load_profile(self, name, profile_name):
+        """Make preloaded profile's settings and sounds active for a countdown, see
+        countdown.Countdown.apply_settings(). Running countdown is not interrupted, new duration
+        applies from the next start.
+
+        Args:
+            name (str): name of countdown.
+            profile_name (str): profile name.
+        """
+        countdown = self.get_timer(name)
+        try:
+            profile = self.profiles[profile_name]
+        except KeyError:
+            raise KeyError(f"No profile named {profile_name!r}") from None
+        changed = countdown.apply_settings(profile.settings, profile.sounds)
+        if "timer_duration" in changed and not countdown.is_running and not countdown.is_paused:
+            countdown.reset()
+        log.info("profile loaded", extra={"timer": name, "profile": profile_name})
+
+    def record_session(self, session):
+        self.writer.submit(lambda store: store.add_sessions([session]))
+
+    def log_persistence_error(self, error):
+        log.error("history not saved", extra={"error": str(error)})
+
+    def on_countdown_event(self, countdown, event):
+        log.info("timer event", extra={"timer": countdown.name, "event": event,
+                                       "remaining": round(countdown.remaining(), 3)})
+        for listener in self.listeners:
+            listener(countdown, event)
+
+    def is_idle(self):
+        """Whether no countdown is running or paused.
+        """
+        return not any(countdown.is_running or countdown.is_paused for countdown in self.countdowns.values())
+
+async def serve(args):
+    service = TimerService(args.db)
+    await service.open()
+    stopped = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        service.loop.add_signal_handler(signum, stopped.set)
+    settings = service.settings
+    if args.duration is not None:
+        settings = settings.replace(timer_duration=args.duration)
+    for i in range(1, args.timers + 1):
+        name = f"timer-{i}"
+        await service.add_timer(name, settings)
+        if args.profile:
+            service.load_profile(name, args.profile)
+    if args.exit_when_done:
+        service.listeners.append(lambda countdown, event: service.is_idle() and stopped.set())
+    if args.start:
+        # Restored countdowns continue where they were
+        for name, countdown in service.countdowns.items():
+            if not countdown.is_running and not countdown.is_paused:
+                service.start(name)
+    server = None
+    if args.control is not None:
+        server = await start_control_server(service, args.control)
+    log.info("service ready", extra={"timers": len(service.countdowns)})
+    await stopped.wait()
+    if server is not None:
+        server.close()
+        os.unlink(args.control)
+    await service.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run timers without a display.")
+    parser.add_argument("--timers", type=int, default=1, help="number of timers")
+    parser.add_argument("--duration", type=float, help="timer duration in seconds, from saved settings by default")
+    parser.add_argument("--profile", help="profile to load into every timer")
+    parser.add_argument("--start", action="store_true", help="start all timers right away")
+    parser.add_argument("--exit-when-done", action="store_true", help="exit when no timer is running")
+    parser.add_argument("--db", default=DB_PATH, help="path to database")
+    parser.add_argument("--control", nargs="?", const=CONTROL_SOCKET_PATH,
+                        help=f"serve control API on Unix socket, {CONTROL_SOCKET_PATH} by default")
+    args = parser.parse_args(argv)
+    configure_logging()
+    configure_metrics()
+    try:
+        asyncio.run(serve(args))
+    finally:
+        metrics.stop_dumping()
+
+if __name__ == '__main__':
+    sys.exit(main())
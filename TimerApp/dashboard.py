@@ -0,0 +1,489 @@
+"""Dashboard of many timers in one window, e.g. one per station.
+
+Usage:
+    python dashboard.py --timers 200
+"""
+import sys
+import logging
+import argparse
+from PyQt6.QtWidgets import (QApplication,
+                             QMainWindow,
+                             QListView,
+                             QPushButton,
+                             QHBoxLayout,
+                             QVBoxLayout,
+                             QStyle,
+                             QStyledItemDelegate,
+                             QWidget)
+from PyQt6.QtCore import QAbstractListModel, QEvent, QModelIndex, QRect, QSize, Qt, pyqtSignal
+from PyQt6.QtGui import QColor, QFont, QPainter
+from timer_engine import TickPolicy
+from time_format import TimeFormatter
+from storage import SettingsStore
+from settings import BASE_DIR, DB_PATH, load_settings
+from countdown import Countdown, checkpoint_listener, checkpoint_name
+from instrumentation import metrics, configure_metrics, configure_logging
+from main import get_shared_scheduler, SettingsWindow, SettingsWriter, HistoryExporter, AudioLoader, EventLoopLagProbe
+
+log = logging.getLogger("timerapp.dashboard")
+
+# Namespace of dashboard's checkpoints, see countdown.checkpoint_name()
+CHECKPOINT_NAMESPACE = "dashboard"
+
+# Roles of CountdownListModel besides DisplayRole, which is the displayed time
+NAME_ROLE = Qt.ItemDataRole.UserRole + 1
+STATE_ROLE = Qt.ItemDataRole.UserRole + 2
+
+class CountdownListModel(QAbstractListModel):
+    """List model of countdowns that keeps displayed times of visible rows current.
+
+    All rows share one display update event on the scheduler. It is scheduled like a single
+    window's update (see TickPolicy), for whichever visible running row changes its text
+    first. On every update rows whose displayed text changed are announced with one
+    dataChanged signal; rows outside visible range are not touched until they are shown.
+    """
+
+    def __init__(self, scheduler, countdowns, parent=None):
+        """
+        Args:
+            scheduler (Scheduler): scheduler of countdowns' events.
+            countdowns (list of Countdown): countdowns to show, one per row.
+        """
+        super().__init__(parent)
+        self.scheduler = scheduler
+        self.countdowns = countdowns
+        self.rows = {countdown.name: row for row, countdown in enumerate(countdowns)}
+        # Display units of each row when its text was last given to the view, None if unknown
+        self.displayed_units = [None] * len(countdowns)
+        # Rows showing "Time's up!" until their countdown is started or reset
+        self.finished = [False] * len(countdowns)
+        self.formatters = {}
+        self.tick_policy = TickPolicy(countdowns[0].engine.tick_interval / 1000 if countdowns else 0.01)
+        self.visible_rows = range(0)
+        self.display_visible = True
+        # Pending display update
+        self.tick_event = None
+        for countdown in countdowns:
+            countdown.listeners.append(self.on_countdown_event)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.countdowns)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        countdown = self.countdowns[row]
+        if role == Qt.ItemDataRole.DisplayRole:
+            if self.finished[row]:
+                self.displayed_units[row] = None
+                return 'Time\'s up!'
+            formatter = self.formatter(countdown)
+            units = formatter.units(countdown.remaining())
+            self.displayed_units[row] = units
+            return formatter.format_units(units)
+        if role == NAME_ROLE:
+            return countdown.name
+        if role == STATE_ROLE:
+            return self.state(row)
+        return None
+
+    def state(self, row):
+        """Get state of row's countdown: "running", "paused", "finished" or "stopped".
+        """
+        countdown = self.countdowns[row]
+        if countdown.is_running:
+            return "running"
+        if countdown.is_paused:
+            return "paused"
+        return "finished" if self.finished[row] else "stopped"
+
+    def formatter(self, countdown):
+        # Formatters are shared by rows with the same display precision
+        precision = countdown.settings.display_precision
+        formatter = self.formatters.get(precision)
+        if formatter is None:
+            formatter = self.formatters[precision] = TimeFormatter(precision)
+        return formatter
+
+    def set_visible_rows(self, first, last):
+        """Set rows shown by the view. Rows that come into view are rendered by the view itself.
+
+        Args:
+            first (int): first visible row.
+            last (int): last visible row, inclusive.
+        """
+        visible_rows = range(first, last + 1)
+        if visible_rows == self.visible_rows:
+            return
+        self.visible_rows = visible_rows
+        self.schedule_tick()
+
+    def set_display_visible(self, visible):
+        """Stop display updates while the view is hidden or minimized.
+        """
+        self.display_visible = visible
+        self.schedule_tick()
+
+    def schedule_tick(self):
+        """Schedule next display update for the visible row whose text changes first.
+        """
+        self.scheduler.cancel(self.tick_event)
+        self.tick_event = None
+        if not self.display_visible:
+            return
+        now = self.scheduler.clock()
+        next_delay = None
+        next_precise = False
+        for row in self.visible_rows:
+            countdown = self.countdowns[row]
+            if not countdown.is_running:
+                continue
+            until_bell = None
+            if countdown.bell_event is not None:
+                until_bell = countdown.bell_event.deadline - now
+            delay, precise = self.tick_policy.next_tick(countdown.remaining(), until_bell,
+                                                        self.formatter(countdown), True)
+            if delay is not None and (next_delay is None or delay < next_delay):
+                next_delay = delay
+            next_precise = next_precise or precise
+        if next_delay is not None:
+            self.tick_event = self.scheduler.schedule(now + next_delay, self.tick, precise=next_precise)
+
+    def tick(self):
+        """Announce visible rows whose displayed text changed, in one dataChanged signal.
+        """
+        if metrics.enabled:
+            metrics.observe("tick_lateness_seconds", max(0.0, self.scheduler.clock() - self.tick_event.deadline),
+                            event="tick")
+        first = last = None
+        for row in self.visible_rows:
+            countdown = self.countdowns[row]
+            if not countdown.is_running:
+                continue
+            units = self.formatter(countdown).units(countdown.remaining())
+            if units != self.displayed_units[row]:
+                if first is None:
+                    first = row
+                last = row
+        if first is not None:
+            self.dataChanged.emit(self.index(first), self.index(last), [Qt.ItemDataRole.DisplayRole])
+        self.schedule_tick()
+
+    def refresh_row(self, row):
+        """Render row again, e.g. after its settings changed.
+        """
+        self.displayed_units[row] = None
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def on_countdown_event(self, countdown, event):
+        row = self.rows[countdown.name]
+        self.finished[row] = event == "finish"
+        # Hidden rows are rendered from current state when they come into view
+        if row in self.visible_rows:
+            self.refresh_row(row)
+        else:
+            self.displayed_units[row] = None
+        if event != "bell":
+            self.schedule_tick()
+
+class CountdownDelegate(QStyledItemDelegate):
+    """Paints a row of the dashboard: name, displayed time and Start, Reset and Settings buttons.
+    Buttons are painted, not widgets, so rows cost nothing until they are shown.
+    """
+    # action_requested(row, action): action is "start", "reset" or "settings"
+    action_requested = pyqtSignal(int, str)
+    ACTIONS = (("start", "Start"), ("reset", "Reset"), ("settings", "Settings"))
+    ROW_HEIGHT = 44
+    BUTTON_WIDTH = 84
+    MARGIN = 6
+    # Same colors as buttons in styles.qss
+    BUTTON_COLOR = QColor("#af2896")
+    BUTTON_BORDER_COLOR = QColor("#8b1d73")
+    STATE_COLORS = {"running": QColor("white"),
+                    "paused": QColor("#c9a9d9"),
+                    "finished": QColor("#ffd54f"),
+                    "stopped": QColor("#c9a9d9")}
+
+    def sizeHint(self, option, index):
+        return QSize(len(self.ACTIONS) * (self.BUTTON_WIDTH + self.MARGIN) + 300, self.ROW_HEIGHT)
+
+    def button_rects(self, rect):
+        """Get rectangles of row's buttons, right-aligned in rect.
+
+        Returns: rects (list of (str, str, QRect)): action, label and rectangle of each button."""
+        rects = []
+        height = rect.height() - 2 * self.MARGIN
+        x = rect.right() - len(self.ACTIONS) * (self.BUTTON_WIDTH + self.MARGIN) + 1
+        for action, label in self.ACTIONS:
+            rects.append((action, label, QRect(x, rect.top() + self.MARGIN, self.BUTTON_WIDTH, height)))
+            x += self.BUTTON_WIDTH + self.MARGIN
+        return rects
+
+    def paint(self, painter, option, index):
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        if option.state & QStyle.StateFlag.State_MouseOver:
+            painter.fillRect(option.rect, self.BUTTON_BORDER_COLOR.darker(150))
+        buttons = self.button_rects(option.rect)
+        text_rect = option.rect.adjusted(self.MARGIN * 2, 0, 0, 0)
+        text_rect.setRight(buttons[0][2].left() - self.MARGIN)
+        color = self.STATE_COLORS[index.data(STATE_ROLE)]
+        font = QFont(option.font)
+        font.setPointSizeF(font.pointSizeF() * 1.2)
+        painter.setFont(font)
+        painter.setPen(color)
+        painter.drawText(text_rect, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter, index.data(NAME_ROLE))
+        font.setBold(True)
+        font.setPointSizeF(font.pointSizeF() * 1.3)
+        painter.setFont(font)
+        painter.drawText(text_rect, Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter, index.data())
+        font = QFont(option.font)
+        font.setBold(True)
+        painter.setFont(font)
+        for action, label, rect in buttons:
+            painter.setPen(self.BUTTON_BORDER_COLOR)
+            painter.setBrush(self.BUTTON_COLOR)
+            painter.drawRoundedRect(rect, 8, 8)
+            painter.setPen(QColor("white"))
+            painter.drawText(rect, Qt.AlignmentFlag.AlignCenter, label)
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        # Clicks on painted buttons request actions instead of editing
+        if event.type() == QEvent.Type.MouseButtonRelease and event.button() == Qt.MouseButton.LeftButton:
+            for action, _, rect in self.button_rects(option.rect):
+                if rect.contains(event.position().toPoint()):
+                    self.action_requested.emit(index.row(), action)
+                    return True
+        return super().editorEvent(event, model, option, index)
+
+class DashboardWindow(QMainWindow):
+    """Window with any number of countdowns in a virtualized list. Every row behaves like the
+    main window's timer: Start restarts it, Reset stops it and Settings opens the settings
+    dialog for that row's countdown.
+
+    Rows start with the active settings from database. Settings saved from a row apply to
+    that row only and are not written to database, profiles are saved as usual.
+    """
+
+    def __init__(self, count):
+        """
+        Args:
+            count (int): number of countdowns.
+        """
+        super().__init__()
+        # to refer to in styles.qss
+        self.setObjectName("dashboardWindow")
+        self.setWindowTitle('Dashboard | Timer Application')
+        self.scheduler = get_shared_scheduler()
+        store = SettingsStore(DB_PATH)
+        try:
+            settings, _ = load_settings(store)
+            checkpoints = store.load_checkpoints()
+        finally:
+            store.close()
+        self.writer = SettingsWriter(DB_PATH, self)
+        self.writer.error.connect(self.show_persistence_error)
+        self.history_exporter = HistoryExporter(DB_PATH, self.writer, self)
+        self.history_exporter.exported.connect(self.show_history_exported)
+        self.history_exporter.failed.connect(self.show_export_error)
+        self.countdowns = [Countdown(self.scheduler, settings, on_session=self.record_session,
+                                     name=f"timer-{i}")
+                           for i in range(1, count + 1)]
+        # Countdown whose settings are being edited in settings window
+        self.editing = self.countdowns[0] if self.countdowns else None
+        self.settings_window = None
+        self.profiles = {}
+        self.model = CountdownListModel(self.scheduler, self.countdowns, self)
+        # Running timers are saved on state changes and continued after a crash or restart
+        for countdown in self.countdowns:
+            countdown.listeners.append(checkpoint_listener(self.writer.submit, CHECKPOINT_NAMESPACE))
+            name = checkpoint_name(CHECKPOINT_NAMESPACE, countdown.name)
+            if name in checkpoints:
+                countdown.restore(checkpoints[name])
+        self.initUI()
+        # Sounds of all rows are the same files until a row's settings change, so they are decoded once
+        self.audio = None
+        self.audio_loader = AudioLoader(self)
+        self.audio_loader.loaded.connect(self.set_audio)
+        self.audio_loader.start(settings)
+
+    def initUI(self):
+        """ Initialize UI of dashboard window.
+        """
+        self.view = QListView(self)
+        self.view.setObjectName("dashboardList")
+        self.view.setModel(self.model)
+        # All rows have the same height, so the view doesn't ask the delegate for every row's size
+        self.view.setUniformItemSizes(True)
+        self.view.setMouseTracking(True)
+        self.view.setSelectionMode(QListView.SelectionMode.NoSelection)
+        self.delegate = CountdownDelegate(self.view)
+        self.delegate.action_requested.connect(self.run_action)
+        self.view.setItemDelegate(self.delegate)
+        self.view.verticalScrollBar().valueChanged.connect(self.update_visible_rows)
+        self.start_all_button = QPushButton('Start &all', self)
+        self.start_all_button.clicked.connect(self.start_all)
+        self.reset_all_button = QPushButton('&Reset all', self)
+        self.reset_all_button.clicked.connect(self.reset_all)
+        layoutButtons = QHBoxLayout()
+        layoutButtons.addStretch()
+        layoutButtons.addWidget(self.start_all_button)
+        layoutButtons.addWidget(self.reset_all_button)
+        layoutMain = QVBoxLayout()
+        layoutMain.addWidget(self.view)
+        layoutMain.addLayout(layoutButtons)
+        container = QWidget()
+        container.setLayout(layoutMain)
+        self.setCentralWidget(container)
+        self.resize(720, 600)
+
+    @property
+    def settings(self):
+        # Settings window edits settings of the row it was opened from
+        return self.editing.settings
+
+    def update_visible_rows(self):
+        viewport = self.view.viewport().rect()
+        first = self.view.indexAt(viewport.topLeft())
+        if not first.isValid():
+            self.model.set_visible_rows(0, -1)
+            return
+        last = self.view.indexAt(viewport.bottomLeft())
+        self.model.set_visible_rows(first.row(), last.row() if last.isValid() else self.model.rowCount() - 1)
+
+    def update_display_visible(self):
+        self.model.set_display_visible(self.isVisible() and not self.isMinimized())
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_display_visible()
+        self.update_visible_rows()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.update_display_visible()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_visible_rows()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.Type.WindowStateChange:
+            self.update_display_visible()
+
+    def set_audio(self, output):
+        """Start using audio output once it is opened by audio loader.
+        """
+        if self.audio is not None:
+            return
+        self.audio = output
+        for countdown in self.countdowns:
+            countdown.set_audio(output)
+
+    def ensure_audio(self):
+        if self.audio is None:
+            self.set_audio(self.audio_loader.wait())
+
+    def run_action(self, row, action):
+        """Run action of a row's button.
+
+        Args:
+            row (int): row of countdown.
+            action (str): "start", "reset" or "settings".
+        """
+        countdown = self.countdowns[row]
+        if action == "start":
+            self.ensure_audio()
+            countdown.start()
+        elif action == "reset":
+            countdown.reset()
+        elif action == "settings":
+            self.open_settings(countdown)
+
+    def start_all(self):
+        self.ensure_audio()
+        for countdown in self.countdowns:
+            countdown.start()
+
+    def reset_all(self):
+        for countdown in self.countdowns:
+            countdown.reset()
+
+    def open_settings(self, countdown):
+        self.editing = countdown
+        if self.settings_window is None:
+            self.settings_window = SettingsWindow(self)
+        else:
+            self.settings_window.settings = self.settings
+            self.settings_window.load_from_settings()
+        self.settings_window.setWindowTitle(f'Settings of {countdown.name} | Timer Application')
+        start = metrics.start()
+        self.settings_window.exec()
+        metrics.observe_since("settings_dialog_seconds", start)
+
+    def save_settings(self, settings):
+        """Apply settings passed from settings window to the countdown they were opened for.
+        Only sounds whose paths changed are reloaded.
+
+        Args:
+            settings (Settings): new settings.
+        """
+        countdown = self.editing
+        changed = countdown.apply_settings(settings)
+        if settings.reset_timer_on_save:
+            countdown.reset()
+        elif "timer_duration" in changed and not countdown.is_running and not countdown.is_paused:
+            countdown.reset()
+        if changed:
+            self.model.refresh_row(self.model.rows[countdown.name])
+
+    def save_profile(self, name, settings):
+        """Save settings as a profile.
+
+        Args:
+            name (str): profile name.
+            settings (Settings): profile's settings.
+        """
+        self.writer.submit(lambda store: store.save_profile(name, settings), key=("profile", name))
+        log.info("profile saved", extra={"profile": name})
+
+    def record_session(self, session):
+        self.writer.submit(lambda store: store.add_sessions([session]))
+
+    def export_sessions(self, path):
+        self.history_exporter.start(path)
+
+    def show_persistence_error(self, message):
+        log.error("not saved", extra={"error": message})
+        self.statusBar().showMessage(f"Could not save: {message}", 10000)
+
+    def show_history_exported(self, path, count):
+        log.info("history exported", extra={"path": path, "sessions": count})
+        self.statusBar().showMessage(f"Exported {count} timer runs to {path}", 10000)
+
+    def show_export_error(self, message):
+        log.error("history not exported", extra={"error": message})
+        self.statusBar().showMessage(f"Could not export history: {message}", 10000)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show many timers in one window.")
+    parser.add_argument("--timers", type=int, default=50, help="number of timers")
+    args = parser.parse_args(argv)
+    configure_logging()
+    app = QApplication(sys.argv[:1])
+    if configure_metrics():
+        lag_probe = EventLoopLagProbe(app)
+        lag_probe.start()
+        app.aboutToQuit.connect(metrics.stop_dumping)
+    with open(BASE_DIR / "styles.qss", "r") as f:
+        app.setStyleSheet(f.read())
+    window = DashboardWindow(args.timers)
+    window.show()
+    return app.exec()
+
+if __name__ == '__main__':
+    sys.exit(main())
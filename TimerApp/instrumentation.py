@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from pathlib import Path
+
+# Upper bounds of histogram buckets in seconds, from sub-millisecond to a few seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+class Histogram:
+    """Cumulative histogram of observed values, as in Prometheus.
+    """
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets (tuple of float): sorted upper bounds of buckets. +Inf bucket is added implicitly.
+        """
+        self.buckets = buckets
+        # Counts per bucket, not cumulative; the last one is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def cumulative_counts(self):
+        """Get number of values less than or equal to each bucket's upper bound.
+
+        Returns:
+            counts (list of int): cumulative counts, the last one is for +Inf.
+        """
+        counts = []
+        total = 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+class Metrics:
+    """Registry of histograms that can be dumped to a file periodically.
+
+    While disabled, observe() returns right away and start() returns None, so instrumented
+    code costs one method call. Histograms are created on first observation and can be
+    observed from any thread.
+    """
+
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            enabled (bool): whether observations are recorded.
+            buckets (tuple of float): upper bounds of buckets of all histograms.
+        """
+        self.enabled = enabled
+        self.buckets = buckets
+        # (name, sorted label items) -> Histogram
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._dump_thread = None
+        self._dump_stop = threading.Event()
+
+    def observe(self, name, value, **labels):
+        """Record value in histogram.
+
+        Args:
+            name (str): metric name, e.g. "tick_lateness_seconds".
+            value (float): observed value.
+            labels: label values that select one histogram of the metric.
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def start(self):
+        """Start timing an operation.
+
+        Returns:
+            start (float): perf_counter() value or None if metrics are disabled.
+        """
+        return time.perf_counter() if self.enabled else None
+
+    def observe_since(self, name, start, **labels):
+        """Record time elapsed since start(). Does nothing if start is None.
+
+        Args:
+            name (str): metric name.
+            start (float): value returned by start().
+            labels: label values.
+        """
+        if start is not None:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def snapshot(self):
+        """Get copy of all histograms.
+
+        Returns:
+            snapshot (list of dict): one dict per histogram with name, labels, bucket counts, count, sum and max.
+        """
+        with self._lock:
+            items = sorted(self._histograms.items())
+            return [{"name": name,
+                     "labels": dict(labels),
+                     "buckets": dict(zip([*map(str, histogram.buckets), "+Inf"], histogram.cumulative_counts())),
+                     "count": histogram.count,
+                     "sum": histogram.sum,
+                     "max": histogram.max}
+                    for (name, labels), histogram in items]
+
+    def to_json(self):
+        return json.dumps({"timestamp": time.time(), "metrics": self.snapshot()}, indent=2)
+
+    def to_prometheus(self):
+        """Format histograms in Prometheus text exposition format.
+
+        Returns: text (str)"""
+        lines = []
+        described = set()
+        for entry in self.snapshot():
+            name = "timerapp_" + entry["name"]
+            if name not in described:
+                described.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            labels = [f'{key}="{value}"' for key, value in entry["labels"].items()]
+            for bound, count in entry["buckets"].items():
+                bucket_labels = ",".join([*labels, f'le="{bound}"'])
+                lines.append(f"{name}_bucket{{{bucket_labels}}} {count}")
+            suffix = "{" + ",".join(labels) + "}" if labels else ""
+            lines.append(f"{name}_sum{suffix} {entry['sum']!r}")
+            lines.append(f"{name}_count{suffix} {entry['count']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write metrics to file, replacing it atomically. Files with .json suffix get JSON,
+        others Prometheus text format.
+
+        Args:
+            path (str or pathlib.Path): path to output file.
+        """
+        path = Path(path)
+        text = self.to_json() if path.suffix == ".json" else self.to_prometheus()
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(text)
+        os.replace(tmp_path, path)
+
+    def start_dumping(self, path, interval):
+        """Dump metrics to file every interval seconds on a background thread.
+
+        Args:
+            path (str or pathlib.Path): path to output file, see dump().
+            interval (float): seconds between dumps.
+        """
+        if self._dump_thread is not None:
+            return
+        self._dump_stop.clear()
+        self._dump_thread = threading.Thread(target=self._dump_periodically, args=(path, interval),
+                                             name="MetricsDump", daemon=True)
+        self._dump_thread.start()
+
+    def stop_dumping(self):
+        """Stop periodic dumping. Metrics are dumped one last time before the thread exits.
+        """
+        if self._dump_thread is not None:
+            self._dump_stop.set()
+            self._dump_thread.join()
+            self._dump_thread = None
+
+    def _dump_periodically(self, path, interval):
+        while not self._dump_stop.wait(interval):
+            self._dump_safely(path)
+        self._dump_safely(path)
+
+    def _dump_safely(self, path):
+        try:
+            self.dump(path)
+        except OSError as e:
+            logging.getLogger("timerapp.metrics").warning("metrics dump failed", extra={"path": str(path), "error": str(e)})
+
+# Metrics of the whole application
+metrics = Metrics()
+
+def configure_metrics():
+    """Enable metrics and start dumping them if TIMERAPP_METRICS environment variable is set
+    to an output file path. Dump interval is taken from TIMERAPP_METRICS_INTERVAL, 10 seconds by default.
+
+    Returns:
+        enabled (bool): whether metrics are enabled.
+    """
+    path = os.environ.get("TIMERAPP_METRICS")
+    if not path:
+        return False
+    metrics.enabled = True
+    metrics.start_dumping(path, float(os.environ.get("TIMERAPP_METRICS_INTERVAL", 10)))
+    return True
+
+# Attributes every LogRecord has; anything else was passed with extra= and is a field of the event
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class StructuredFormatter(logging.Formatter):
+    """Formats records as logfmt lines: time, level, logger and message followed by
+    key=value fields passed with extra=.
+    """
+
+    def format(self, record):
+        fields = {"time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+                  "level": record.levelname.lower(),
+                  "logger": record.name,
+                  "msg": record.getMessage()}
+        fields.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            fields["exc"] = self.formatException(record.exc_info)
+        return " ".join(f"{key}={self._quote(value)}" for key, value in fields.items())
+
+    @staticmethod
+    def _quote(value):
+        text = value if isinstance(value, str) else json.dumps(value, default=str)
+        if text and not any(c in text for c in ' ="\n'):
+            return text
+        return json.dumps(text)
+
+def configure_logging(level=None):
+    """Send application's log records to stderr in structured format.
+
+    Args:
+        level (str or int): log level, TIMERAPP_LOG_LEVEL environment variable or INFO by default.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter())
+    logger = logging.getLogger("timerapp")
+    logger.addHandler(handler)
+    logger.setLevel(level or os.environ.get("TIMERAPP_LOG_LEVEL", "INFO").upper())
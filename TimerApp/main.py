@@ -1,7 +1,11 @@
+import time
+# Taken before the heavy imports below, to measure time to first paint from process start
+STARTUP_TIME = time.perf_counter()
 import sys
-import sqlite3
-import simpleaudio as sa
-from pathlib import Path
+import os
+import math
+import logging
+import threading
 from PyQt6.QtWidgets import (QApplication,
                              QMainWindow,
                              QDialog,
@@ -10,57 +14,300 @@ from PyQt6.QtWidgets import (QApplication,
                              QPushButton,
                              QCheckBox,
                              QDoubleSpinBox,
+                             QComboBox,
+                             QInputDialog,
                              QVBoxLayout,
                              QHBoxLayout,
-                             QGridLayout,
                              QSizePolicy,
                              QWidget)
-from PyQt6.QtCore import QTimer, Qt
-from multislider import MultiSlider
+from PyQt6.QtCore import QEvent, QObject, QTimer, Qt, pyqtSignal
+from timer_engine import TickPolicy
+from time_format import TimeFormatter
+from scheduler import Scheduler
+from storage import SettingsStore, BackgroundWriter
+from settings import BASE_DIR, DB_PATH, CONTROL_SOCKET_PATH, Settings, load_settings
+from countdown import Countdown, sound_cache, checkpoint_listener
+from control import ControlSession, bounded_sender, remove_stale_socket, MAX_LINE
+from instrumentation import metrics, configure_metrics, configure_logging
+import profiles
 
-# Specifying base directory, path to database and path to sounds directory.
-BASE_DIR = Path(__file__).resolve().parent
-DB_PATH = BASE_DIR / "timer_app.db"
-SOUNDS_PATH = BASE_DIR / "sounds"
+log = logging.getLogger("timerapp")
 
-def initialize_db():
-    """Initialize database. Create (if non-existent) tables: settings, profiles.
+_shared_scheduler = None
+
+def get_shared_scheduler():
+    """Get scheduler shared by all timers of the application. It is driven by a single
+    single-shot QTimer that is armed to the nearest deadline only, with coarse timer type
+    when the nearest event doesn't need precision.
+
+    Returns: scheduler (Scheduler)"""
+    global _shared_scheduler
+    if _shared_scheduler is None:
+        qtimer = QTimer(QApplication.instance())
+        qtimer.setSingleShot(True)
+
+        def arm(delay, precise):
+            if delay is None:
+                qtimer.stop()
+            else:
+                qtimer.setTimerType(Qt.TimerType.PreciseTimer if precise else Qt.TimerType.CoarseTimer)
+                qtimer.start(math.ceil(delay * 1000))
+
+        _shared_scheduler = Scheduler(arm)
+        qtimer.timeout.connect(_shared_scheduler.run_due)
+    return _shared_scheduler
+
+_audio_output = None
+_audio_output_lock = threading.Lock()
+
+def get_audio_output():
+    """Get audio output shared by all timers of the application. It keeps one output stream
+    open for the application's lifetime and is closed when application quits.
+    Can be called from any thread.
+
+    Returns: output (audio.AudioOutput or audio.SimpleAudioOutput)"""
+    global _audio_output
+    with _audio_output_lock:
+        if _audio_output is None:
+            import audio
+            _audio_output = audio.open_output()
+            QApplication.instance().aboutToQuit.connect(_audio_output.close)
+    return _audio_output
+
+class EventLoopLagProbe(QObject):
+    """Measures event loop lag: how late a periodic precise timer fires compared to its interval.
+    Lag shows how long the GUI thread was blocked, e.g. by a slow slot or a modal dialog.
     """
-    con = sqlite3.connect(DB_PATH)
-    cursor = con.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS settings (
-                    id INTEGER PRIMARY KEY,
-                    timer_duration REAL,
-                    reset_timer_on_save BOOLEAN,
-                    enable_sound BOOLEAN,
-                    final_sound_filename TEXT,
-                    intermediate_sound_filename TEXT
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS profiles (
-                    id INTEGER PRIMARY KEY,
-                    name TEXT,
-                    settings_id INTEGER,
-                    FOREIGN KEY (settings_id) REFERENCES settings (id)
-        )              
-    """)
-    con.commit()
-    con.close()
-
-def get_default_settings():
-    """Get default settings in dictonary format identical to what's used throughout the program.
-    
-    Returns: settings (dict)"""
-    settings = {
-        "timer_duration" : 10.0,
-        "reset_timer_on_save" : False,
-        "enable_sound" : True,
-        "final_sound_filename" : str(SOUNDS_PATH / "bell.wav"),
-        "intermediate_sound_filename" : str(SOUNDS_PATH / "beep.wav")
-    }
-    return settings
+    INTERVAL = 0.1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.timer.timeout.connect(self.measure)
+        self.last_time = None
+
+    def start(self):
+        self.last_time = time.perf_counter()
+        self.timer.start(int(self.INTERVAL * 1000))
+
+    def measure(self):
+        now = time.perf_counter()
+        metrics.observe("event_loop_lag_seconds", max(0.0, now - self.last_time - self.INTERVAL))
+        self.last_time = now
+
+class ControlServer(QObject):
+    """Serves control API (see control.py) on a Unix socket from GUI thread.
+    """
+
+    def __init__(self, target, parent=None):
+        """
+        Args:
+            target: timers to control, see control.ControlSession.
+        """
+        super().__init__(parent)
+        # Imported here, since most launches don't serve control API
+        from PyQt6.QtNetwork import QLocalServer
+        self.target = target
+        self.server = QLocalServer(self)
+        self.server.newConnection.connect(self.accept)
+        # Open sessions. They are closed when application quits, while the shared scheduler's
+        # timer still exists: sockets disconnect only after QApplication is deleted.
+        self.sessions = set()
+
+    def listen(self, path):
+        """Start listening. Socket file is removed when application quits.
+
+        Args:
+            path (str or pathlib.Path): path of Unix socket.
+        Raises:
+            OSError: if socket can't be created.
+        """
+        remove_stale_socket(path)
+        if not self.server.listen(str(path)):
+            raise OSError(f"Control socket {path}: {self.server.errorString()}")
+        QApplication.instance().aboutToQuit.connect(self.close)
+        log.info("control server listening", extra={"path": str(path)})
+
+    def accept(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            send = bounded_sender(socket.write, socket.bytesToWrite, socket.abort)
+            session = ControlSession(self.target, send)
+            self.sessions.add(session)
+            socket.readyRead.connect(lambda socket=socket, session=session: self.read(socket, session))
+            socket.disconnected.connect(lambda session=session: self.close_session(session))
+            socket.disconnected.connect(socket.deleteLater)
+
+    def close_session(self, session):
+        if session in self.sessions:
+            self.sessions.remove(session)
+            session.close()
+
+    def close(self):
+        """Stop listening and close open sessions.
+        """
+        self.server.close()
+        for session in list(self.sessions):
+            self.close_session(session)
+
+    def read(self, socket, session):
+        while socket.canReadLine():
+            session.handle_line(bytes(socket.readLine()))
+        if socket.bytesAvailable() > MAX_LINE:
+            socket.abort()
+
+class WindowTimers:
+    """Control API target with the main window's countdown. Commands go through the window,
+    as if its buttons were pressed.
+    """
+
+    def __init__(self, window):
+        self.window = window
+
+    @property
+    def countdowns(self):
+        return {self.window.countdown.name: self.window.countdown}
+
+    @property
+    def scheduler(self):
+        return self.window.scheduler
+
+    def start(self, name):
+        self.window.start_timer()
+
+    def pause(self, name):
+        self.window.countdown.pause()
+
+    def resume(self, name):
+        self.window.countdown.resume()
+
+    def reset(self, name):
+        self.window.reset_timer()
+
+    def load_profile(self, name, profile_name):
+        if profile_name not in self.window.profiles:
+            raise KeyError(f"No profile named {profile_name!r}")
+        self.window.profile_combobox.setCurrentText(profile_name)
+        self.window.switch_profile(profile_name)
+
+class SettingsWriter(QObject):
+    """Qt wrapper of BackgroundWriter that reports write errors to GUI thread with a signal.
+    Pending writes are flushed when application quits.
+    """
+    error = pyqtSignal(str)
+
+    def __init__(self, db_path, parent=None):
+        super().__init__(parent)
+        # Signal emitted from writer thread is delivered through a queued connection
+        self.writer = BackgroundWriter(db_path, on_error=lambda e: self.error.emit(str(e)))
+        QApplication.instance().aboutToQuit.connect(self.writer.close)
+
+    def submit(self, job, key=None):
+        self.writer.submit(job, key)
+
+    def flush(self, timeout=None):
+        return self.writer.flush(timeout)
+
+class AudioLoader(QObject):
+    """Opens audio output and decodes sounds of given settings on a background thread,
+    so that neither delays showing the window.
+    """
+    loaded = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.output = None
+        self._thread = None
+
+    def start(self, settings):
+        """Start loading. loaded signal is emitted with audio output when done.
+
+        Args:
+            settings (Settings): settings with sound files to decode.
+        """
+        paths = [settings.final_sound_filename, settings.intermediate_sound_filename]
+        self._thread = threading.Thread(target=self._load, args=(paths,), name="AudioLoader", daemon=True)
+        self._thread.start()
+
+    def wait(self):
+        """Block until loading is done.
+
+        Returns: output (audio.AudioOutput or audio.SimpleAudioOutput)"""
+        self._thread.join()
+        return self.output
+
+    def _load(self, paths):
+        for path in paths:
+            try:
+                sound_cache.get(path)
+            except Exception as e:
+                log.warning("sound not loaded", extra={"path": path, "error": str(e)})
+        self.output = get_audio_output()
+        self.loaded.emit(self.output)
+
+class ProfileLoader(QObject):
+    """Loads profiles and decodes their sounds on a background thread.
+    """
+    loaded = pyqtSignal(dict)
+
+    def start(self, db_path):
+        """Start loading profiles. loaded signal is emitted with dictionary profile name -> Profile.
+
+        Args:
+            db_path (str or pathlib.Path): path to database file.
+        """
+        thread = threading.Thread(target=self._load, args=(db_path,), name="ProfileLoader", daemon=True)
+        thread.start()
+
+    def _load(self, db_path):
+        store = SettingsStore(db_path)
+        try:
+            loaded_profiles = profiles.load_profiles(store, sound_cache)
+        finally:
+            store.close()
+        self.loaded.emit(loaded_profiles)
+
+class HistoryExporter(QObject):
+    """Exports history of timer runs to CSV on a background thread over its own database
+    connection, so that a large export neither blocks GUI thread nor holds up database writes.
+    """
+    exported = pyqtSignal(str, int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, db_path, writer, parent=None):
+        """
+        Args:
+            db_path (str or pathlib.Path): path to database file.
+            writer (SettingsWriter): writer whose pending writes are waited for before export.
+        """
+        super().__init__(parent)
+        self.db_path = db_path
+        self.writer = writer
+
+    def start(self, path):
+        """Start export. exported signal is emitted with path and number of exported runs,
+        or failed signal with error message.
+
+        Args:
+            path (str): path to output file.
+        """
+        thread = threading.Thread(target=self._export, args=(path,), name="HistoryExporter", daemon=True)
+        thread.start()
+
+    def _export(self, path):
+        # Runs recorded before export was asked for are included
+        self.writer.flush()
+        try:
+            store = SettingsStore(self.db_path)
+            try:
+                count = store.export_sessions_csv(path)
+            finally:
+                store.close()
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.exported.emit(path, count)
 
 class SettingsWindow(QDialog):
     """QDialog window that contains various settings of TimerApp.
@@ -69,6 +316,7 @@ class SettingsWindow(QDialog):
         super().__init__(parent)
         # to refer to in styles.qss
         self.setObjectName("settingsWindow")
+        # Settings are immutable, edits make new snapshots and main window's settings change only on save
         self.settings = self.parent().settings
         self.initUI()
         self.set_layouts()
@@ -78,9 +326,13 @@ class SettingsWindow(QDialog):
         """ Initialize UI of SettingsWindow.
         """
         self.setWindowTitle('Settings | Timer Application')
+        # Imported here since the widget's NumPy is not needed before settings are opened
+        from multislider import MultiSlider
         # Create control widgets and corresponding labels
         self.duration_label = QLabel('&Timer duration', self)
         self.duration_spinbox = QDoubleSpinBox(self)
+        self.precision_label = QLabel('&Display precision', self)
+        self.precision_combobox = QComboBox(self)
         self.intermediate_multislider_label = QLabel('Add and remove bells', self)
         self.intermediate_multislider = MultiSlider()
         self.toggle_reset_on_save_label = QLabel('&Reset running timer on save', self)
@@ -92,11 +344,14 @@ class SettingsWindow(QDialog):
         self.final_sound_button = QPushButton('Select file', self)
         self.intermediate_sound_button = QPushButton('Select file', self)
         self.reset_button = QPushButton('&Reset settings', self)
+        self.save_profile_button = QPushButton('Save as &profile', self)
+        self.export_history_button = QPushButton('&Export history', self)
         self.save_settings_button = QPushButton('&Save settings', self)
         # Set buddies for labels and controls widgets
         self.toggle_reset_on_save_label.setBuddy(self.toggle_reset_on_save_checkbox)
         self.toggle_sound_label.setBuddy(self.toggle_sound_checkbox)
         self.duration_label.setBuddy(self.duration_spinbox)
+        self.precision_label.setBuddy(self.precision_combobox)
         self.final_sound_label.setBuddy(self.final_sound_button)
         self.intermediate_sound_label.setBuddy(self.intermediate_sound_button)
 
@@ -108,6 +363,10 @@ class SettingsWindow(QDialog):
         duration_layout.addWidget(self.duration_label)
         duration_layout.addStretch()
         duration_layout.addWidget(self.duration_spinbox)
+        precision_layout = QHBoxLayout()
+        precision_layout.addWidget(self.precision_label)
+        precision_layout.addStretch()
+        precision_layout.addWidget(self.precision_combobox)
         reset_on_save_layout = QHBoxLayout()
         reset_on_save_layout.addWidget(self.toggle_reset_on_save_label)
         reset_on_save_layout.addStretch()
@@ -119,6 +378,7 @@ class SettingsWindow(QDialog):
         # add top group of layouts to top layout
         timer_configuration_layout = QVBoxLayout()
         timer_configuration_layout.addLayout(duration_layout)
+        timer_configuration_layout.addLayout(precision_layout)
         timer_configuration_layout.addLayout(reset_on_save_layout)
         timer_configuration_layout.addLayout(multislider_layout)
         # middle group of widgets
@@ -142,7 +402,9 @@ class SettingsWindow(QDialog):
         # bottom layout
         bottom_buttons_layout = QHBoxLayout()
         bottom_buttons_layout.addWidget(self.reset_button)
+        bottom_buttons_layout.addWidget(self.export_history_button)
         bottom_buttons_layout.addStretch()
+        bottom_buttons_layout.addWidget(self.save_profile_button)
         bottom_buttons_layout.addWidget(self.save_settings_button)
         # combine all groups of layouts into main layout
         main_layout = QVBoxLayout()
@@ -162,6 +424,9 @@ class SettingsWindow(QDialog):
         self.duration_spinbox.setDecimals(0)
         self.duration_spinbox.setSizePolicy(QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Minimum)
         self.duration_spinbox.valueChanged.connect(self.set_duration)
+        # Configure display precision combobox, item index is number of decimals
+        self.precision_combobox.addItems(['Seconds', 'Tenths', 'Hundredths'])
+        self.precision_combobox.currentIndexChanged.connect(self.set_display_precision)
         # Configure multislider
         self.intermediate_multislider.setSizePolicy(QSizePolicy.Policy.MinimumExpanding, QSizePolicy.Policy.Fixed)
         # Configure toggle reset on save checkbox
@@ -174,6 +439,10 @@ class SettingsWindow(QDialog):
         self.intermediate_sound_button.pressed.connect(self.intermediate_open_file_dialog)
         # Connect reset settings button
         self.reset_button.pressed.connect(self.reset_settings)
+        # Connect export history button
+        self.export_history_button.pressed.connect(self.export_history)
+        # Connect save as profile button
+        self.save_profile_button.pressed.connect(self.save_as_profile)
         # Connect save settings button
         self.save_settings_button.pressed.connect(self.pass_settings_and_exit)
         # Set widgets according to settings
@@ -182,55 +451,83 @@ class SettingsWindow(QDialog):
     def load_from_settings(self):
         """Set widgets' values and states to what's specified in settings.
         """
-        self.duration_spinbox.setValue(self.settings["timer_duration"])
-        self.toggle_reset_on_save_checkbox.setChecked(self.settings["reset_timer_on_save"])
-        self.toggle_sound_checkbox.setChecked(self.settings["enable_sound"])
+        self.duration_spinbox.setValue(self.settings.timer_duration)
+        self.precision_combobox.setCurrentIndex(self.settings.display_precision)
+        self.toggle_reset_on_save_checkbox.setChecked(self.settings.reset_timer_on_save)
+        self.toggle_sound_checkbox.setChecked(self.settings.enable_sound)
+        self.intermediate_multislider.points = list(self.settings.intermediate_bells)
+        self.intermediate_multislider.update()
   
     def set_duration(self, value):
-        """Set duration in settings dictionary.
+        """Set duration in settings.
 
         Args:
             value (float): value of doubleSpinbox.
         """
-        self.settings["timer_duration"] = round(value, 2)
+        self.settings = self.settings.replace(timer_duration=round(value, 2))
+
+    def set_display_precision(self, index):
+        """Set number of decimals shown on timer label.
+
+        Args:
+            index (int): index of precision combobox item.
+        """
+        self.settings = self.settings.replace(display_precision=index)
 
     def set_reset_on_save(self):
         """Set behaviour of timer on saving the settings.
         """
-        self.settings["reset_timer_on_save"] = self.toggle_reset_on_save_checkbox.isChecked()
+        self.settings = self.settings.replace(reset_timer_on_save=self.toggle_reset_on_save_checkbox.isChecked())
 
     def set_sound_enabled(self):
         """Set enable sounds.
         """
-        self.settings["enable_sound"] = self.toggle_sound_checkbox.isChecked()
+        self.settings = self.settings.replace(enable_sound=self.toggle_sound_checkbox.isChecked())
 
     def final_open_file_dialog(self):
         """Open file dialog to pick a .wav file for final sound signal.
         """
         file_name, _ = QFileDialog.getOpenFileName(self, "Select Final sound for Timer | Timer Application", "", "WAV files (*.wav)")
         if file_name:
-            print(f"Selected Final soundfile: {file_name}")
-            self.settings["final_sound_filename"] = file_name
+            log.info("final sound selected", extra={"path": file_name})
+            self.settings = self.settings.replace(final_sound_filename=file_name)
 
     def intermediate_open_file_dialog(self):
         """Open file dialog to pick a .wav file for intermediate sound signal.
         """
         file_name, _ = QFileDialog.getOpenFileName(self, "Select Intermediate sound for Timer | Timer Application", "", "WAV files (*.wav)")
         if file_name:
-            print(f"Selected Intermediate soundfile: {file_name}")
-            self.settings["intermediate_sound_filename"] = file_name
+            log.info("intermediate sound selected", extra={"path": file_name})
+            self.settings = self.settings.replace(intermediate_sound_filename=file_name)
 
     def reset_settings(self):
-        """Reset settings to what is return in get_default_settings(), then update widgets.
+        """Reset settings to defaults, then update widgets.
         """
-        self.settings = get_default_settings()
+        self.settings = Settings()
         self.load_from_settings()
 
+    def save_as_profile(self):
+        """Ask for profile name and pass settings to main window to save them as a profile.
+        """
+        name, ok = QInputDialog.getText(self, "Save profile | Timer Application", "Profile name:")
+        name = name.strip()
+        if ok and name:
+            self.settings = self.settings.replace(intermediate_bells=sorted(self.intermediate_multislider.points))
+            self.parent().save_profile(name, self.settings)
+
+    def export_history(self):
+        """Open file dialog to pick a .csv file and export all timer runs to it.
+        """
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export history | Timer Application", "timer_history.csv", "CSV files (*.csv)")
+        if file_name:
+            self.parent().export_sessions(file_name)
+
     def pass_settings_and_exit(self):
         """Pass settings from settings window to main window. Then close the settings window.
         This method is created following the logic that all settings are passed in main window at the same time.
         I don't know if this is a proper way.
         """
+        self.settings = self.settings.replace(intermediate_bells=sorted(self.intermediate_multislider.points))
         self.parent().save_settings(self.settings)
         self.close()
 
@@ -241,28 +538,67 @@ class TimerApp(QMainWindow):
         super().__init__()
         # to refer to in styles.qss
         self.setObjectName("mainWindow")
-        self.settings = get_default_settings()
+        # Timer logic lives in countdown, this window is its frontend
+        self.scheduler = get_shared_scheduler()
+        self.countdown = Countdown(self.scheduler, Settings(), on_session=self.record_session, name="main")
         self.settings_window = None
-        initialize_db()
+        self.time_to_first_paint = None
+        self.store = SettingsStore(DB_PATH)
+        QApplication.instance().aboutToQuit.connect(self.store.close)
+        # Writes go through writer thread so that disk never stalls GUI thread
+        self.writer = SettingsWriter(DB_PATH, self)
+        self.writer.error.connect(self.show_persistence_error)
+        self.history_exporter = HistoryExporter(DB_PATH, self.writer, self)
+        self.history_exporter.exported.connect(self.show_history_exported)
+        self.history_exporter.failed.connect(self.show_export_error)
+        # Profiles are loaded in background and switched to without DB queries or decoding
+        self.profiles = {}
+        self.profile_loader = ProfileLoader(self)
+        self.profile_loader.loaded.connect(self.set_profiles)
+        self.profile_loader.start(DB_PATH)
         self.load_settings_from_db()
+        self.countdown.reset()
+        self.formatter = TimeFormatter(self.settings.display_precision)
+        # Display units currently shown on timer label, None if label shows something else
+        self.displayed_units = None
+        # Whether rendering was skipped while window was not visible
+        self.display_dirty = False
+        self.tick_policy = TickPolicy(self.countdown.engine.tick_interval / 1000)
+        # Pending display update
+        self.tick_event = None
         self.initUI()
         self.configure_widgets()
-        self.load_sounds()
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_timer)
+        # Sounds are decoded and audio output is opened in background, see set_audio()
+        self.audio = None
+        self.audio_loader = AudioLoader(self)
+        self.audio_loader.loaded.connect(self.set_audio)
+        self.audio_loader.start(self.settings)
+        self.countdown.listeners.append(self.on_countdown_event)
+        # Running timer is saved on state changes and continued after a crash or restart
+        self.countdown.listeners.append(checkpoint_listener(self.writer.submit))
+        self.restore_checkpoint()
+
+    @property
+    def settings(self):
+        return self.countdown.settings
+
+    @settings.setter
+    def settings(self, settings):
+        self.countdown.settings = settings
 
-       
     def initUI(self):
         """ Initialize UI of main window.
         """
         self.setWindowTitle('Timer Application')
-        # Create timer label and pushbuttons
+        # Create profile selector, timer label and pushbuttons
+        self.profile_combobox = QComboBox(self)
         self.timer_label = QLabel('TimerApp', self)
         self.settings_button = QPushButton('&Settings', self)
         self.start_button = QPushButton('Start', self)
         self.reset_button = QPushButton('&Reset', self)
         # Create and configure layouts
         layoutMain = QVBoxLayout()
+        layoutMain.addWidget(self.profile_combobox)
         layoutMain.addWidget(self.timer_label)
         layoutButtons = QHBoxLayout()
         layoutButtons.addWidget(self.settings_button)
@@ -277,130 +613,223 @@ class TimerApp(QMainWindow):
     def configure_widgets(self):
         # Configure timer label
         self.timer_label.setObjectName("timerLabel")
-        self.timer_label.setText(self.get_time((self.settings["timer_duration"])))
+        self.render_time(self.settings.timer_duration)
         self.timer_label.setAlignment(Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignVCenter)
+        # Configure profile selector, it is enabled when profiles are loaded
+        self.profile_combobox.setPlaceholderText('Profile')
+        self.profile_combobox.setEnabled(False)
+        self.profile_combobox.textActivated.connect(self.switch_profile)
         # Connect buttons to slots
         self.settings_button.clicked.connect(self.open_settings)
         self.start_button.clicked.connect(self.start_timer)
         self.start_button.setShortcut('Space')
         self.reset_button.clicked.connect(self.reset_timer)
 
-    def save_settings_to_db(self, db_path=DB_PATH):
-        """Save settings to database.
-        
+    def save_settings_to_db(self):
+        """Queue saving settings to database on writer thread. Saves made close together
+        are merged, so only the latest settings are written, and only columns that changed.
+        """
+        settings = self.settings
+        self.writer.submit(lambda store: store.save_settings(settings), key="settings")
+        log.debug("settings save queued")
+
+    def show_persistence_error(self, message):
+        """Show error of background database write in status bar.
+
         Args:
-            db_path (str or pathlib.Path): path to database file.
+            message (str): error message.
         """
-        con = sqlite3.connect(db_path)
-        cursor = con.cursor()
-        cursor.execute("""
-            INSERT INTO settings (timer_duration,
-                                  reset_timer_on_save,
-                                  enable_sound,
-                                  final_sound_filename,
-                                  intermediate_sound_filename)
-            VALUES (?, ?, ?, ?, ?)
-        """, (self.settings["timer_duration"],
-              self.settings["reset_timer_on_save"],
-              self.settings["enable_sound"],
-              self.settings["final_sound_filename"],
-              self.settings["intermediate_sound_filename"]))
-        print("Executed save settings query.")
-        con.commit()
-        print("Commited save settings to DB.")
-        cursor.execute("""
-
-        """)
-        con.close()
-
-    def load_settings_from_db(self, db_path=DB_PATH):
+        log.error("settings not saved", extra={"error": message})
+        self.statusBar().showMessage(f"Could not save settings: {message}", 10000)
+
+    def show_history_exported(self, path, count):
+        log.info("history exported", extra={"path": path, "sessions": count})
+        self.statusBar().showMessage(f"Exported {count} timer runs to {path}", 10000)
+
+    def show_export_error(self, message):
+        log.error("history not exported", extra={"error": message})
+        self.statusBar().showMessage(f"Could not export history: {message}", 10000)
+
+    def load_settings_from_db(self):
         """Load settings from database or set to defaults if no user settings loaded.
-        
-        Args:
-            db_path (str or pathlib.Path): path to database file.
         """
-        print("Trying to load settings...")
-        con = sqlite3.connect(db_path)
-        cursor = con.cursor()
-        # Get the latest settings configuration
-        cursor.execute("""
-            SELECT *
-              FROM settings
-             ORDER BY id DESC
-             LIMIT 1
-            """)
-        print("Executed load settings query.")
-        row = cursor.fetchone()
-        con.close()
-        default_settings = get_default_settings()
-        # If got settings then save it into class member, else stay with defaults
-        if row:
-            print(f"Found user settings.")
-            self.settings = {
-                "timer_duration" : row[1],
-                "reset_timer_on_save" : bool(row[2]),
-                "enable_sound" : bool(row[3]),
-                "final_sound_filename" : row[4],
-                "intermediate_sound_filename" : row[5]
-            }
-        else:
-            print(f"User settings not found, using defaults.")
-            self.settings = default_settings
-        # Merge with default settings (loaded settings will overwrite defaults, if present)
-        self.settings = {**default_settings, **self.settings}
-        print(f"Loaded settings: {self.settings}")
+        self.settings, found = load_settings(self.store)
+        log.info("settings loaded", extra={"source": "db" if found else "defaults", "settings": self.settings.as_dict()})
 
-    def load_sounds(self):
-        """Load sounds from paths specified in settings.
+    def restore_checkpoint(self):
+        """Continue countdown that was running or paused when application last exited.
+        """
+        checkpoint = self.store.load_checkpoints().get(self.countdown.name)
+        if checkpoint is not None:
+            restored = self.countdown.restore(checkpoint)
+            log.info("timer restored" if restored else "timer finished while not running",
+                     extra={"remaining": round(self.countdown.remaining(), 3)})
+
+    def set_audio(self, output):
+        """Start using audio output once it is opened by audio loader. Sounds are taken from
+        sound cache, which audio loader has filled.
 
         Args:
-            final: sound which is played then timer ends;
-            intermediate: sound which is played for intermediate bells.
+            output (audio.AudioOutput or audio.SimpleAudioOutput): shared audio output.
         """
-      
-        try:
-            self.wave_final = sa.WaveObject.from_wave_file(self.settings["final_sound_filename"])
-            self.wave_intermediate = sa.WaveObject.from_wave_file(self.settings["intermediate_sound_filename"])
-        except Exception as e:
-            print(f'Error while loading sounds: {e}')
-        print("Loaded sounds.")
+        if self.audio is not None:
+            return
+        self.audio = output
+        self.countdown.set_audio(output)
+        log.info("sounds loaded", extra={"cache": sound_cache.stats()})
+
+    def ensure_audio(self):
+        """Wait for audio loader if it's still running, e.g. if timer is started right after startup.
+        """
+        if self.audio is None:
+            self.set_audio(self.audio_loader.wait())
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.time_to_first_paint is None:
+            self.time_to_first_paint = time.perf_counter() - STARTUP_TIME
+            log.info("first paint", extra={"ms": round(self.time_to_first_paint * 1000, 1)})
+
+    def load_sounds(self):
+        """Load sounds from paths specified in settings. Sounds whose files haven't changed
+        are taken from sound cache without decoding.
+        """
+        self.countdown.load_sounds()
+        log.info("sounds loaded", extra={"cache": sound_cache.stats()})
 
     def start_timer(self):
         """Reset timer to its full duration and start timer.
         """
-        self.time_left = self.settings["timer_duration"] # Reset time
-        self.timer.start(10)  # Timer will tick every 1/100th of second
+        self.ensure_audio()
+        self.countdown.start()
+
+    def schedule_tick(self):
+        """Schedule next display update according to tick policy. No update is scheduled
+        while the window is not visible.
+        """
+        self.scheduler.cancel(self.tick_event)
+        now = self.scheduler.clock()
+        until_bell = None
+        if self.countdown.bell_event is not None:
+            until_bell = self.countdown.bell_event.deadline - now
+        delay, precise = self.tick_policy.next_tick(self.countdown.remaining(), until_bell,
+                                                    self.formatter, self.is_display_visible())
+        if delay is None:
+            self.tick_event = None
+            return
+        self.tick_event = self.scheduler.schedule(now + delay, self.update_timer, precise=precise)
+
+    def cancel_tick(self):
+        self.scheduler.cancel(self.tick_event)
+        self.tick_event = None
 
     def update_timer(self):
-        """Manage timer by subtracting timer timeout interval from time_left at every timeout.
-        If no time left, stop timer, update UI [and play sound].
-        """
-        # Continuously update timer until time_left > 0
-        if self.time_left > 0:
-            # Subtract timer step from time_left (at the moment it is 1/100th of second hardcoded)
-            self.time_left -= 0.01
-            self.time_left = round(self.time_left, 2)
-            time_str = self.get_time(self.time_left)
-            self.timer_label.setText(time_str)
-        else:
-            self.timer.stop()
-            self.time_left = self.settings["timer_duration"]
+        """Update timer label with time left until the countdown's deadline and schedule next update.
+        """
+        # Display updates wake the application too
+        self.countdown.wakeups += 1
+        self.countdown.observe_lateness(self.tick_event, "tick")
+        self.render_time(self.countdown.remaining())
+        self.schedule_tick()
+
+    def on_countdown_event(self, countdown, event):
+        """Update UI when countdown changes state.
+
+        Args:
+            countdown (Countdown): this window's countdown.
+            event (str): "start", "pause", "resume", "reset", "bell" or "finish".
+        """
+        if event in ("start", "resume"):
+            self.schedule_tick()
+        elif event == "finish":
+            self.cancel_tick()
             self.timer_label.setText('Time\'s up!')
-            if self.settings["enable_sound"] == True:
-                play_final = self.wave_final.play()
+            self.displayed_units = None
+            self.display_dirty = False
+        elif event in ("pause", "reset"):
+            self.cancel_tick()
+            self.render_time(countdown.remaining())
+
+    def record_session(self, session):
+        """Record finished or interrupted run in history. Session is written by writer thread
+        together with other writes queued at the same time.
+
+        Args:
+            session (dict): session dictionary, see SettingsStore.add_sessions().
+        """
+        self.writer.submit(lambda store: store.add_sessions([session]))
+
+    def export_sessions(self, path):
+        """Export history of timer runs to CSV file in background, after pending writes.
+
+        Args:
+            path (str): path to output file.
+        """
+        self.history_exporter.start(path)
 
     def reconfigure_timer(self, duration):
-        self.time_left = self.settings["timer_duration"]
-        time_str = self.get_time(self.settings["timer_duration"])
-        self.timer_label.setText(time_str)
+        """Set new duration and show it on timer label. Running countdown is stopped.
+
+        Args:
+            duration (float): new timer duration in seconds.
+        """
+        self.countdown.reset(duration)
 
     def reset_timer(self):
         """Stop timer and set timer label text to original duration.
         """
-        print("Reset timer.")
-        self.timer.stop()
-        time_str = self.get_time(self.settings["timer_duration"])
-        self.timer_label.setText(time_str)
+        log.debug("timer reset")
+        self.countdown.reset()
+
+    def render_time(self, seconds):
+        """Show time on timer label, but only if the visible text changes and window is visible.
+
+        Args:
+            seconds (float): time in seconds.
+        """
+        if not self.is_display_visible():
+            self.display_dirty = True
+            return
+        units = self.formatter.units(seconds)
+        if units == self.displayed_units:
+            return
+        self.displayed_units = units
+        self.timer_label.setText(self.formatter.format_units(units))
+
+    def is_display_visible(self):
+        # Label is not rendered while window is hidden at startup or minimized
+        return self.isVisible() and not self.isMinimized()
+
+    def refresh_display(self):
+        """Render current time if rendering was skipped or display precision changed.
+        """
+        if self.display_dirty or self.displayed_units is not None:
+            self.display_dirty = False
+            self.displayed_units = None
+            self.render_time(self.countdown.remaining())
+        # Display updates stop while window is hidden, resume them
+        if self.countdown.is_running and self.tick_event is None:
+            self.schedule_tick()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh_display()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.Type.WindowStateChange and not self.isMinimized():
+            self.refresh_display()
+
+    def set_display_precision(self, precision):
+        """Change number of decimals shown on timer label.
+
+        Args:
+            precision (int): number of decimals.
+        """
+        if precision == self.formatter.precision:
+            return
+        self.formatter = TimeFormatter(precision)
+        self.refresh_display()
 
     def get_time(self, raw_time):
         """Convert time from seconds to HH:MM:SS.SS format.
@@ -427,35 +856,92 @@ class TimerApp(QMainWindow):
 
     
     def open_settings(self):
-        print("Opened settings.")
         if self.settings_window is None:
             self.settings_window = SettingsWindow(self)
         else:
             self.settings_window.settings = self.settings
             self.settings_window.load_from_settings()
+        # Modal dialog runs its own event loop until it's closed
+        start = metrics.start()
         self.settings_window.exec()
+        metrics.observe_since("settings_dialog_seconds", start)
 
     def save_settings(self, settings):
-        """Save all settings passed from settings window in main window.
-        
+        """Apply settings passed from settings window, doing only the work that changed fields need:
+        sounds are reloaded if their paths changed, stopped timer is reconfigured if duration changed
+        and only changed columns are saved.
+
         Args:
-            settings (dict): settings dictionary   {"timer_duration": int,
-                                                    "reset_on_save: bool,
-                                                    "enable_sound": bool,
-                                                    "final_sound_filename": str,
-                                                    "intermediate_sound_filename": str}
-        """
-        self.settings = settings
-        self.load_sounds()
-        if settings["reset_timer_on_save"] == True:
+            settings (Settings): new settings.
+        """
+        changed = self.countdown.apply_settings(settings)
+        if changed & {"final_sound_filename", "intermediate_sound_filename"}:
+            log.info("sounds loaded", extra={"cache": sound_cache.stats()})
+        if "display_precision" in changed:
+            self.set_display_precision(settings.display_precision)
+        if settings.reset_timer_on_save:
             self.reset_timer()
-        self.save_settings_to_db()
+        elif "timer_duration" in changed and not self.countdown.is_running and not self.countdown.is_paused:
+            self.reconfigure_timer(settings.timer_duration)
+        if changed:
+            self.save_settings_to_db()
+
+    def set_profiles(self, loaded_profiles):
+        """Store loaded profiles and fill profile selector with their names.
+
+        Args:
+            loaded_profiles (dict): profile name -> profiles.Profile.
+        """
+        self.profiles = loaded_profiles
+        log.info("profiles loaded", extra={"profiles": list(loaded_profiles)})
+        self.profile_combobox.clear()
+        self.profile_combobox.addItems(loaded_profiles.keys())
+        self.profile_combobox.setCurrentIndex(-1)
+        self.profile_combobox.setEnabled(bool(loaded_profiles))
+
+    def switch_profile(self, name):
+        """Make preloaded profile's settings and sounds active. Running or paused countdown is not
+        interrupted, new duration applies from the next start.
+
+        Args:
+            name (str): profile name.
+        """
+        profile = self.profiles[name]
+        changed = self.countdown.apply_settings(profile.settings, profile.sounds)
+        self.set_display_precision(self.settings.display_precision)
+        if "timer_duration" in changed and not self.countdown.is_running and not self.countdown.is_paused:
+            self.reconfigure_timer(self.settings.timer_duration)
+        if changed:
+            self.save_settings_to_db()
+        log.info("profile switched", extra={"profile": name})
+
+    def save_profile(self, name, settings):
+        """Save settings as a profile and add it to preloaded profiles.
+
+        Args:
+            name (str): profile name.
+            settings (Settings): profile's settings.
+        """
+        self.profiles[name] = profiles.load_profile(name, settings, sound_cache)
+        self.writer.submit(lambda store: store.save_profile(name, settings), key=("profile", name))
+        self.set_profiles(dict(sorted(self.profiles.items())))
+        self.profile_combobox.setCurrentText(name)
 
 if __name__ == '__main__':
-    print("TimerApp by D. Sergeev.")
+    configure_logging()
+    log.info("TimerApp by D. Sergeev.")
     app = QApplication(sys.argv)
+    if configure_metrics():
+        lag_probe = EventLoopLagProbe(app)
+        lag_probe.start()
+        app.aboutToQuit.connect(metrics.stop_dumping)
+    # Apply stylesheet before the window is created, so it is styled only once
+    with open(BASE_DIR / "styles.qss", "r") as f:
+        app.setStyleSheet(f.read())
     window = TimerApp()
+    # Set TIMERAPP_CONTROL to a socket path to let other processes control the timer
+    if "TIMERAPP_CONTROL" in os.environ:
+        control_server = ControlServer(WindowTimers(window), app)
+        control_server.listen(os.environ["TIMERAPP_CONTROL"] or CONTROL_SOCKET_PATH)
     window.show()
-    with open(BASE_DIR / "styles.qss", "r") as f: 
-        app.setStyleSheet(f.read())
     sys.exit(app.exec())
\ No newline at end of file
@@ -1,9 +1,12 @@
 import sys
-from PyQt6.QtCore import Qt, QRectF, QLineF, QSize
-from PyQt6.QtGui import QPainter, QColor, QBrush, QPen
+import numpy as np
+from PyQt6.QtCore import Qt, QRectF, QLineF, QSize, pyqtSignal
+from PyQt6.QtGui import QPainter, QColor, QBrush, QPen, QPixmap
 from PyQt6.QtWidgets import QApplication, QWidget, QSizePolicy
 
 class MultiSlider(QWidget):
+    # Emitted once per user edit or bulk operation that changed points
+    pointsChanged = pyqtSignal()
     LEFT_MARGIN = 10
     RIGHT_MARGIN = 10
     POINT_DIAMETER = 13
@@ -19,12 +22,123 @@ class MultiSlider(QWidget):
         self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
         self.min_value = min_value
         self.max_value = max_value
-        # List of points' X-axis coordinates scaled in [min_value; max_value] range
-        self.points = []
+        # Sorted array of points' X-axis coordinates scaled in [min_value; max_value] range
+        self._points = np.empty(0)
         self.selected_point = None
+        # Whether points were added or moved since mouse press; pointsChanged is emitted
+        # once on release, so that adding a point and dragging it is one edit
+        self.edited = False
+        # Track and unselected points, rebuilt only when they change or on resize
+        self._cache = None
+
+    @property
+    def points(self):
+        """Sorted list of points."""
+        return self._points.tolist()
+
+    @points.setter
+    def points(self, points):
+        self.set_points(points)
+
+    @property
+    def points_array(self):
+        """Sorted array of points. It must not be modified."""
+        return self._points
+
+    def set_points(self, values):
+        """Replace all points.
+
+        Args:
+            values (array-like of float): new points, clipped to [min_value; max_value].
+        """
+        self._points = np.sort(self._clip(values))
+        self._points_changed()
+
+    def add_points(self, values):
+        """Add many points at once.
+
+        Args:
+            values (array-like of float): points to add, clipped to [min_value; max_value].
+        """
+        values = np.sort(self._clip(values))
+        if len(values) == 0:
+            return
+        # Both arrays are sorted, so merging them is a single insert
+        self._points = np.insert(self._points, np.searchsorted(self._points, values), values)
+        self._points_changed()
+
+    def remove_points(self, values):
+        """Remove all points equal to any of given values.
+
+        Args:
+            values (array-like of float): points to remove.
+        """
+        keep = ~np.isin(self._points, np.asarray(values, dtype=float))
+        if keep.all():
+            return
+        self._points = self._points[keep]
+        self._points_changed()
+
+    def remove_points_between(self, low, high):
+        """Remove all points in [low; high] range.
+
+        Args:
+            low (float): lower bound of range.
+            high (float): upper bound of range.
+        """
+        start = int(np.searchsorted(self._points, low, side="left"))
+        end = int(np.searchsorted(self._points, high, side="right"))
+        if start >= end:
+            return
+        self._points = np.delete(self._points, np.s_[start:end])
+        self._points_changed()
+
+    def set_evenly_spaced(self, count):
+        """Replace all points with count points evenly spaced between min_value and max_value,
+        excluding both ends.
+
+        Args:
+            count (int): number of points.
+        """
+        self.set_points(np.linspace(self.min_value, self.max_value, count + 2)[1:-1])
+
+    def _clip(self, values):
+        return np.clip(np.asarray(values, dtype=float).ravel(), self.min_value, self.max_value)
+
+    def _points_changed(self):
+        self.selected_point = None
+        self.invalidate_cache()
+        self.update()
+        self.pointsChanged.emit()
+
+    def invalidate_cache(self):
+        self._cache = None
 
     def paintEvent(self, event):
+        if self._cache is None:
+            self._cache = self.render_cache()
         painter = QPainter(self)
+        # Only the dirty part is copied from the cache
+        rect = QRectF(event.rect())
+        ratio = self._cache.devicePixelRatio()
+        painter.drawPixmap(rect, self._cache, QRectF(rect.topLeft() * ratio, rect.size() * ratio))
+        # Selected point is not cached, since it is the one being dragged
+        if self.selected_point is not None:
+            painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+            painter.setBrush(QBrush(self.SELECTED_COLOR))
+            painter.drawEllipse(self.point_rect(self._points[self.selected_point]))
+
+    def render_cache(self):
+        """Draw slider track and all points except selected one on a pixmap.
+
+        Returns:
+            pixmap (QPixmap): pixmap of widget's size.
+        """
+        ratio = self.devicePixelRatioF()
+        pixmap = QPixmap(self.size() * ratio)
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(pixmap)
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
 
         # Draw slider track
@@ -32,18 +146,49 @@ class MultiSlider(QWidget):
         painter.setPen(QPen(self.TRACK_COLOR, self.TRACK_THICKNESS))
         painter.drawLine(track_line)
 
-        # Draw points
-        for i, point in enumerate(self.points):
-            x = self.get_denormalized_x(point)
-            y = self.height() / 2
-            if (i == self.selected_point):
-                painter.setBrush(QBrush(self.SELECTED_COLOR))
-            else:
-                painter.setBrush(QBrush(self.POINT_COLOR))
-            painter.drawEllipse(QRectF(x - self.POINT_DIAMETER / 2,
-                                       y - self.POINT_DIAMETER / 2,
-                                       self.POINT_DIAMETER,
-                                       self.POINT_DIAMETER))
+        # Draw points. Only one point per pixel column is drawn, so dense point sets
+        # cost no more than the widget's width.
+        painter.setBrush(QBrush(self.POINT_COLOR))
+        points = self._points
+        if self.selected_point is not None:
+            points = np.delete(points, self.selected_point)
+        xs = self.get_denormalized_xs(points)
+        columns = np.round(xs)
+        first_in_column = np.ones(len(columns), dtype=bool)
+        first_in_column[1:] = columns[1:] != columns[:-1]
+        y = self.height() / 2 - self.POINT_DIAMETER / 2
+        for x in (xs[first_in_column] - self.POINT_DIAMETER / 2).tolist():
+            painter.drawEllipse(QRectF(x, y, self.POINT_DIAMETER, self.POINT_DIAMETER))
+        painter.end()
+        return pixmap
+
+    def point_rect(self, point):
+        """Get bounding rectangle of point's ellipse.
+
+        Args:
+            point (float): scaled point X coordinate.
+        Returns:
+            rect (QRectF): ellipse's bounding rectangle.
+        """
+        x = self.get_denormalized_x(point)
+        y = self.height() / 2
+        return QRectF(x - self.POINT_DIAMETER / 2,
+                      y - self.POINT_DIAMETER / 2,
+                      self.POINT_DIAMETER,
+                      self.POINT_DIAMETER)
+
+    def update_point(self, point):
+        """Schedule repaint of the area around a point only.
+
+        Args:
+            point (float): scaled point X coordinate.
+        """
+        # Margin covers the outline pen and antialiasing
+        self.update(self.point_rect(point).adjusted(-2, -2, 2, 2).toAlignedRect())
+
+    def resizeEvent(self, event):
+        self.invalidate_cache()
+        super().resizeEvent(event)
 
     def mousePressEvent(self, event):
         """Handle left-click - selecting and creating points; handle right-click - removing points.
@@ -56,45 +201,68 @@ class MultiSlider(QWidget):
         if (event.button() == Qt.MouseButton.LeftButton):
             # If left-clicked on existing point, do nothing
             if (self.selected_point is not None):
+                self.invalidate_cache()
                 self.update()
                 return
             # Else add new point
             else:
-                new_point = self.get_scaled_x(x)
-                self.points.append(new_point)
-                # Immediately select new point (which is last in list of points)
+                new_point = max(self.min_value, min(self.max_value, self.get_scaled_x(x)))
+                # Immediately select new point
                 # This overcomes the need to release mouse and click again
-                self.selected_point = len(self.points) - 1
+                self.selected_point = int(np.searchsorted(self._points, new_point))
+                self._points = np.insert(self._points, self.selected_point, new_point)
+                self.edited = True
         # Right-click handling
         elif (event.button() == Qt.MouseButton.RightButton):
             if (self.selected_point is not None):
-                self.points.pop(self.selected_point)
+                self._points = np.delete(self._points, self.selected_point)
                 self.selected_point = None
+                self.pointsChanged.emit()
+        self.invalidate_cache()
         self.update()
 
     def mouseMoveEvent(self, event):
         if self.selected_point is not None:
             x = event.position().x()
-            new_value = self.get_scaled_x(x)
-            self.points[self.selected_point] = max(self.min_value, min(self.max_value, new_value))
-            self.update()
+            new_value = max(self.min_value, min(self.max_value, self.get_scaled_x(x)))
+            old_value = self._points[self.selected_point]
+            # Keep points sorted. Selected point is not in the cache, so the cache stays valid.
+            points = np.delete(self._points, self.selected_point)
+            self.selected_point = int(np.searchsorted(points, new_value))
+            self._points = np.insert(points, self.selected_point, new_value)
+            self.edited = True
+            self.update_point(old_value)
+            self.update_point(new_value)
 
     def mouseReleaseEvent(self, event):
-        self.selected_point = None
+        if self.selected_point is not None:
+            self.selected_point = None
+            # Put released point back into the cache
+            self.invalidate_cache()
+            self.update()
+        # One change signal per edit
+        if self.edited:
+            self.edited = False
+            self.pointsChanged.emit()
 
     def is_on_point(self, x):
         """Return point's index if x is close to some point's X coordinate.
-        
+        Neighbours of x are found by binary search in sorted points.
+
         Args:
             x (int): x coordinate on slider track.
         Returns:
             i (int): index of close point.
         """
-        for i, point in enumerate(self.points):
-            px = self.get_denormalized_x(point)
-            if abs(px - x) < self.ON_POINT_THRESHOLD:
-                return i
-        return None
+        i = int(np.searchsorted(self._points, self.get_scaled_x(x)))
+        closest = None
+        closest_distance = self.ON_POINT_THRESHOLD
+        for j in (i - 1, i):
+            if 0 <= j < len(self._points):
+                distance = abs(self.get_denormalized_x(self._points[j]) - x)
+                if distance < closest_distance:
+                    closest, closest_distance = j, distance
+        return closest
 
     def get_denormalized_x(self, scaled_x):
         """Calculate point X coordinate to display on window from scaled point X coordinate.
@@ -121,6 +289,28 @@ class MultiSlider(QWidget):
                                    * (self.max_value - self.min_value)
         return scaled_x
 
+    def get_denormalized_xs(self, scaled_xs):
+        """Vectorized get_denormalized_x() for a whole array of points.
+
+        Args:
+            scaled_xs (array-like of float): scaled points X coordinates.
+        Returns:
+            xs (numpy.ndarray): points X coordinates to display on window.
+        """
+        scale = (self.width() - self.LEFT_MARGIN - self.RIGHT_MARGIN) / (self.max_value - self.min_value)
+        return self.LEFT_MARGIN + (np.asarray(scaled_xs, dtype=float) - self.min_value) * scale
+
+    def get_scaled_xs(self, xs):
+        """Vectorized get_scaled_x() for a whole array of window X coordinates.
+
+        Args:
+            xs (array-like of float): coordinates of range [0; self.width()].
+        Returns:
+            scaled_xs (numpy.ndarray): coordinates scaled to range [self.min_value; self.max_value].
+        """
+        scale = (self.max_value - self.min_value) / (self.width() - self.LEFT_MARGIN - self.RIGHT_MARGIN)
+        return self.min_value + (np.asarray(xs, dtype=float) - self.LEFT_MARGIN) * scale
+
     def get_selected_value(self):
         print(round(self.points[self.selected_point], 2))
         return self.points[self.selected_point]
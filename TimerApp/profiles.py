@@ -0,0 +1,63 @@
+import logging
+
+log = logging.getLogger("timerapp.profiles")
+
+class Profile:
+    """Named settings with their sounds decoded ahead of time, so that switching to a profile
+    doesn't need a database query or decoding.
+    """
+    __slots__ = ("name", "settings", "final_sound", "intermediate_sound")
+
+    def __init__(self, name, settings, final_sound=None, intermediate_sound=None):
+        """
+        Args:
+            name (str): profile name.
+            settings (settings.Settings): profile's settings.
+            final_sound (audio.Sound): decoded final sound or None if it couldn't be loaded.
+            intermediate_sound (audio.Sound): decoded intermediate sound or None if it couldn't be loaded.
+        """
+        self.name = name
+        self.settings = settings
+        self.final_sound = final_sound
+        self.intermediate_sound = intermediate_sound
+
+    @property
+    def sounds_loaded(self):
+        return self.final_sound is not None and self.intermediate_sound is not None
+
+    @property
+    def sounds(self):
+        """Decoded sounds by settings field of their path, see countdown.Countdown.apply_settings()."""
+        return {"final_sound_filename": self.final_sound,
+                "intermediate_sound_filename": self.intermediate_sound}
+
+def load_profile(name, settings, sound_cache):
+    """Create profile and decode its sounds through sound cache.
+
+    Args:
+        name (str): profile name.
+        settings (settings.Settings): profile's settings.
+        sound_cache (SoundCache): cache to take decoded sounds from.
+    Returns:
+        profile (Profile): profile; its sounds that failed to load are None.
+    """
+    sounds = []
+    for path in (settings.final_sound_filename, settings.intermediate_sound_filename):
+        try:
+            sounds.append(sound_cache.get(path))
+        except Exception as e:
+            log.warning("profile sound not loaded", extra={"profile": name, "path": path, "error": str(e)})
+            sounds.append(None)
+    return Profile(name, settings, *sounds)
+
+def load_profiles(store, sound_cache):
+    """Load all profiles from database and decode their sounds.
+
+    Args:
+        store (SettingsStore): store to read profiles from.
+        sound_cache (SoundCache): cache to take decoded sounds from.
+    Returns:
+        profiles (dict): profile name -> Profile, ordered by name.
+    """
+    return {name: load_profile(name, settings, sound_cache)
+            for name, settings in store.load_profiles().items()}
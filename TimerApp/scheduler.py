@@ -0,0 +1,131 @@
+import heapq
+import itertools
+import time
+
+class ScheduledEvent:
+    """Handle of a callback scheduled on Scheduler. Pass it to Scheduler.cancel() to cancel.
+    """
+    __slots__ = ("deadline", "callback", "args", "precise", "cancelled")
+
+    def __init__(self, deadline, callback, args, precise=True):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.precise = precise
+        self.cancelled = False
+
+class Scheduler:
+    """Priority queue of deadlines that drives any number of timers with a single wakeup source.
+
+    The scheduler doesn't own a timer itself. Whenever the nearest deadline changes it calls
+    arm(delay, precise) with seconds until that deadline (or None if nothing is scheduled)
+    and whether that event needs a precise timer, and the owner of the real timer (QTimer,
+    asyncio loop, ...) must call run_due() when it fires.
+
+    Scheduling and firing cost O(log n). Cancelling only marks the event and costs O(1);
+    cancelled events are dropped when they reach the top of the heap or when they make up
+    more than half of it.
+    """
+
+    def __init__(self, arm, clock=time.monotonic):
+        """
+        Args:
+            arm (callable): arm(delay, precise) is called with seconds until nearest deadline
+                or None and whether the nearest event asked for a precise timer.
+            clock (callable): monotonic clock returning seconds as float.
+        """
+        self.arm = arm
+        self.clock = clock
+        # Heap of (deadline, sequence number, event) tuples. Sequence number keeps FIFO
+        # order for equal deadlines and prevents comparing events.
+        self._heap = []
+        self._counter = itertools.count()
+        self._cancelled_count = 0
+        self._armed_deadline = None
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled_count
+
+    def schedule(self, deadline, callback, *args, precise=True):
+        """Schedule callback(*args) to be called at deadline.
+
+        Args:
+            deadline (float): time on scheduler's clock.
+            callback (callable): function to call.
+            precise (bool): whether event needs a precise timer. Events that may fire
+                slightly late, like display updates, should pass False to save power.
+        Returns:
+            event (ScheduledEvent): handle to cancel event with.
+        """
+        event = ScheduledEvent(deadline, callback, args, precise)
+        heapq.heappush(self._heap, (deadline, next(self._counter), event))
+        if self._armed_deadline is None or deadline < self._armed_deadline:
+            self._rearm()
+        return event
+
+    def cancel(self, event):
+        """Cancel scheduled event. Cancelling fired or already cancelled event does nothing.
+
+        Args:
+            event (ScheduledEvent): handle returned by schedule().
+        """
+        if event is None or event.cancelled:
+            return
+        event.cancelled = True
+        self._cancelled_count += 1
+        if self._cancelled_count > len(self._heap) // 2:
+            self._heap[:] = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled_count = 0
+        if event.deadline == self._armed_deadline:
+            self._rearm()
+
+    def next_deadline(self):
+        """Get the nearest deadline of pending events or None.
+        """
+        self._drop_cancelled_head()
+        return self._heap[0][0] if self._heap else None
+
+    def next_event(self):
+        """Get the nearest pending event or None.
+        """
+        self._drop_cancelled_head()
+        return self._heap[0][2] if self._heap else None
+
+    def run_due(self):
+        """Call callbacks of all events whose deadline has passed, then rearm for the next one.
+
+        Returns:
+            fired (int): number of events fired.
+        """
+        fired = 0
+        now = self.clock()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, _, event = heapq.heappop(heap)
+            if event.cancelled:
+                self._cancelled_count -= 1
+                continue
+            # Mark fired event as cancelled so that cancel() after firing is a no-op
+            event.cancelled = True
+            event.callback(*event.args)
+            fired += 1
+        self._rearm(force=True)
+        return fired
+
+    def _drop_cancelled_head(self):
+        heap = self._heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+            self._cancelled_count -= 1
+
+    def _rearm(self, force=False):
+        event = self.next_event()
+        deadline = event.deadline if event is not None else None
+        if deadline == self._armed_deadline and not force:
+            return
+        self._armed_deadline = deadline
+        if event is None:
+            self.arm(None, False)
+        else:
+            self.arm(max(0.0, deadline - self.clock()), event.precise)
@@ -0,0 +1,117 @@
+import os
+import tempfile
+from pathlib import Path
+
+# Specifying base directory, path to database and path to sounds directory.
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH = BASE_DIR / "timer_app.db"
+SOUNDS_PATH = BASE_DIR / "sounds"
+# Sounds converted to output format, see sound_prep.py
+PREPARED_SOUNDS_PATH = BASE_DIR / "prepared_sounds"
+# Unix socket of control API, see control.py
+CONTROL_SOCKET_PATH = Path(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()) / "timerapp.sock"
+
+class Settings:
+    """Immutable snapshot of timer settings. Defaults are used for fields that are not given.
+
+    Snapshots are shared freely between windows, countdowns and profiles since nobody can
+    change them; a change is a new snapshot made with replace(). changed_fields() tells which
+    fields differ between two snapshots, so that applying new settings does only the work
+    each changed field needs.
+    """
+    __slots__ = ("timer_duration",
+                 "reset_timer_on_save",
+                 "enable_sound",
+                 "final_sound_filename",
+                 "intermediate_sound_filename",
+                 "intermediate_bells",
+                 "display_precision")
+
+    def __init__(self,
+                 timer_duration=10.0,
+                 reset_timer_on_save=False,
+                 enable_sound=True,
+                 final_sound_filename=str(SOUNDS_PATH / "bell.wav"),
+                 intermediate_sound_filename=str(SOUNDS_PATH / "beep.wav"),
+                 intermediate_bells=(),
+                 display_precision=2):
+        """
+        Args:
+            timer_duration (float): countdown duration in seconds.
+            reset_timer_on_save (bool): whether saving settings stops running countdown.
+            enable_sound (bool): whether sounds are played.
+            final_sound_filename (str): path to sound played when countdown finishes.
+            intermediate_sound_filename (str): path to sound of intermediate bells.
+            intermediate_bells (iterable of float): bell positions as fractions of duration.
+            display_precision (int): number of decimals shown.
+        """
+        setattr_ = object.__setattr__
+        setattr_(self, "timer_duration", timer_duration)
+        setattr_(self, "reset_timer_on_save", reset_timer_on_save)
+        setattr_(self, "enable_sound", enable_sound)
+        setattr_(self, "final_sound_filename", final_sound_filename)
+        setattr_(self, "intermediate_sound_filename", intermediate_sound_filename)
+        setattr_(self, "intermediate_bells", tuple(intermediate_bells))
+        setattr_(self, "display_precision", display_precision)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Settings are immutable, use replace()")
+
+    def __delattr__(self, name):
+        raise AttributeError("Settings are immutable")
+
+    def __reduce__(self):
+        # Slots of immutable object can't be set by copy and pickle, so they call constructor
+        return (Settings, tuple(getattr(self, name) for name in self.__slots__))
+
+    def __eq__(self, other):
+        if not isinstance(other, Settings):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"Settings({fields})"
+
+    def replace(self, **changes):
+        """Get copy of settings with some fields changed.
+
+        Args:
+            changes: new values of fields.
+        Returns:
+            settings (Settings)"""
+        return Settings(**{**self.as_dict(), **changes})
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+def changed_fields(old, new):
+    """Get names of fields whose values differ between two settings snapshots.
+
+    Args:
+        old (Settings): previous settings, None if there were none.
+        new (Settings): new settings.
+    Returns:
+        changed (frozenset of str): names of changed fields, all of them if old is None.
+    """
+    if old is None:
+        return frozenset(Settings.__slots__)
+    if old is new:
+        return frozenset()
+    return frozenset(name for name in Settings.__slots__ if getattr(old, name) != getattr(new, name))
+
+def load_settings(store):
+    """Load active settings from database. Fields that settings saved by earlier versions
+    don't have get default values.
+
+    Args:
+        store (storage.SettingsStore): store to read settings from.
+    Returns:
+        settings (Settings): active settings, defaults if none were saved.
+        found (bool): whether user settings were found in database.
+    """
+    settings = store.load_settings()
+    return settings or Settings(), settings is not None
@@ -0,0 +1,113 @@
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+class SoundCache:
+    """LRU cache of decoded sounds with a memory budget and a limit on number of entries.
+
+    Entries are keyed by resolved path, file size and modification time, so a sound is
+    decoded again only when the file itself changes. The cache can be shared between threads.
+    Entries limit bounds sounds that take no memory but hold other resources, like streamed
+    sounds with their memory-mapped files; an evicted sound releases them once nothing plays it.
+    """
+    DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+    DEFAULT_MAX_ENTRIES = 32
+
+    def __init__(self, loader, max_bytes=DEFAULT_MAX_BYTES, sizeof=None, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Args:
+            loader (callable): loader(path) decodes sound file, e.g. audio.load_wave.
+            max_bytes (int): memory budget for all cached sounds.
+            sizeof (callable): sizeof(sound) returns memory taken by decoded sound in bytes.
+                By default sound's nbytes is used, see audio.Sound.
+            max_entries (int): most sounds kept at once.
+        """
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.sizeof = sizeof or (lambda sound: sound.nbytes)
+        # key -> (sound, size), least recently used first
+        self._entries = OrderedDict()
+        # resolved path -> key of its cached version, to drop outdated versions of a file
+        self._keys_by_path = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path):
+        try:
+            return self._make_key(path) in self._entries
+        except OSError:
+            return False
+
+    def get(self, path):
+        """Get decoded sound from cache or decode it with loader on miss.
+
+        Args:
+            path (str or pathlib.Path): path to sound file.
+        Returns:
+            sound: decoded sound returned by loader.
+        Raises:
+            OSError: if file can't be accessed. Loader's exceptions are propagated as well.
+        """
+        key = self._make_key(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        # Decode outside of lock, so that other threads are not blocked by slow files
+        sound = self.loader(key[0])
+        with self._lock:
+            self._put(key, sound)
+        return sound
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_path.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Get cache counters.
+
+        Returns: stats (dict)"""
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes}
+
+    def _make_key(self, path):
+        resolved = str(Path(path).resolve())
+        stat = os.stat(resolved)
+        return (resolved, stat.st_size, stat.st_mtime_ns)
+
+    def _put(self, key, sound):
+        # Replace outdated version of the same file
+        old_key = self._keys_by_path.pop(key[0], None)
+        if old_key is not None:
+            self._remove(old_key)
+        size = self.sizeof(sound)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (sound, size)
+        self._keys_by_path[key[0]] = key
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes or len(self._entries) > self.max_entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            del self._keys_by_path[oldest_key[0]]
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, size = self._entries.pop(key)
+        self.current_bytes -= size
@@ -0,0 +1,162 @@
+"""Preparation of sounds for playback: every selected sound is converted once to the output's
+format (sample rate, channels, float32) with normalized loudness, and the result is kept
+in a cache directory, keyed by hash of file's contents and conversion parameters.
+Later loads of the same sound read a ready buffer and do no conversion at all.
+"""
+import os
+import hashlib
+import logging
+import tempfile
+import numpy as np
+from pathlib import Path
+import audio
+from settings import PREPARED_SOUNDS_PATH
+from instrumentation import metrics
+
+log = logging.getLogger("timerapp.audio")
+
+# Bump when conversion changes, so that files prepared by older versions are not used
+PIPELINE_VERSION = 1
+# Loudness that all sounds are brought to, as RMS of their audible part in dBFS
+TARGET_LOUDNESS = -20.0
+# Samples quieter than this don't count towards loudness, so that silent tails don't make sounds louder
+GATE_LEVEL = -60.0
+# Highest peak after normalization; quiet sounds with loud peaks get less gain rather than clipping
+PEAK_LIMIT = 0.98
+
+def db_to_amplitude(db):
+    return 10.0 ** (db / 20.0)
+
+def measure_loudness(samples, gate=GATE_LEVEL):
+    """Measure RMS level of samples louder than gate, over all channels.
+
+    Args:
+        samples (numpy.ndarray): float32 array of shape (frames, channels).
+        gate (float): gate level in dBFS.
+    Returns:
+        loudness (float): RMS level in dBFS, None if samples are silent.
+    """
+    power = np.square(samples, dtype=np.float64).mean(axis=1)
+    audible = power[power > db_to_amplitude(gate) ** 2]
+    if not len(audible):
+        return None
+    return 10.0 * np.log10(audible.mean())
+
+def normalize_loudness(samples, target=TARGET_LOUDNESS, peak_limit=PEAK_LIMIT):
+    """Scale samples to target loudness, keeping peaks at or below peak_limit.
+
+    Args:
+        samples (numpy.ndarray): float32 array of shape (frames, channels).
+        target (float): target loudness in dBFS, see measure_loudness().
+        peak_limit (float): highest allowed absolute sample value.
+    Returns:
+        samples (numpy.ndarray): scaled float32 array, samples itself if they are silent.
+    """
+    loudness = measure_loudness(samples)
+    if loudness is None:
+        return samples
+    gain = db_to_amplitude(target - loudness)
+    peak = float(np.abs(samples).max())
+    gain = min(gain, peak_limit / peak)
+    return samples * np.float32(gain)
+
+class PreparedSounds:
+    """Directory of sounds converted to one canonical format.
+
+    Prepared sounds are stored as .npy files named by SHA-256 of source file's contents
+    and conversion parameters, so renamed or copied files share one entry and edited files
+    get a new one. Files that are streamed (see audio.load_wave()) are not prepared.
+    """
+
+    def __init__(self, directory=PREPARED_SOUNDS_PATH, sample_rate=audio.SAMPLE_RATE,
+                 channels=audio.CHANNELS, target_loudness=TARGET_LOUDNESS):
+        """
+        Args:
+            directory (str or pathlib.Path): cache directory, created when the first sound is prepared.
+            sample_rate (int): sample rate of prepared sounds.
+            channels (int): number of channels of prepared sounds.
+            target_loudness (float): loudness of prepared sounds in dBFS, None to keep original levels.
+        """
+        self.directory = Path(directory)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.target_loudness = target_loudness
+
+    def key(self, path):
+        """Get cache key of sound file.
+
+        Returns: key (str): hex digest of file's contents and conversion parameters."""
+        digest = hashlib.sha256(f"{PIPELINE_VERSION}:{self.sample_rate}:{self.channels}:"
+                                f"{self.target_loudness}:".encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def path_for(self, key):
+        return self.directory / f"{key}.npy"
+
+    def load(self, path):
+        """Load prepared sound, preparing and storing it first if it's not in cache.
+
+        Args:
+            path (str or pathlib.Path): path to WAV file.
+        Returns:
+            sound (audio.Sound or audio.StreamedSound): sound in canonical format, or streamed sound
+                for files above audio.STREAM_THRESHOLD.
+        """
+        if os.path.getsize(path) > audio.STREAM_THRESHOLD:
+            return audio.load_wave(path)
+        prepared_path = self.path_for(self.key(path))
+        try:
+            samples = np.load(prepared_path)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log.warning("prepared sound is damaged, preparing again", extra={"path": str(prepared_path), "error": str(e)})
+        else:
+            if samples.dtype == np.float32 and samples.ndim == 2 and samples.shape[1] == self.channels:
+                return audio.Sound(samples, self.sample_rate)
+        samples = self.prepare(audio.load_wave(path))
+        self.store(prepared_path, samples)
+        return audio.Sound(samples, self.sample_rate)
+
+    def prepare(self, sound):
+        """Convert decoded sound to canonical format.
+
+        Args:
+            sound (audio.Sound): decoded sound.
+        Returns:
+            samples (numpy.ndarray): float32 array of shape (frames, channels).
+        """
+        start = metrics.start()
+        samples = sound.converted(self.sample_rate, self.channels)
+        if self.target_loudness is not None:
+            samples = normalize_loudness(samples, self.target_loudness)
+        metrics.observe_since("sound_prepare_seconds", start)
+        return samples
+
+    def store(self, prepared_path, samples):
+        """Write prepared samples atomically. Failures are logged, the sound is still playable.
+        """
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.save(f, samples)
+                os.replace(tmp_path, prepared_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            log.warning("prepared sound not saved", extra={"path": str(prepared_path), "error": str(e)})
+
+    def clear(self):
+        """Remove all prepared sounds.
+        """
+        for prepared_path in self.directory.glob("*.npy"):
+            prepared_path.unlink()
+
+# Prepared sounds of the application
+prepared_sounds = PreparedSounds()
@@ -0,0 +1,607 @@
+import csv
+import json
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from instrumentation import metrics
+from settings import Settings, changed_fields
+
+# Id of the settings row that holds active settings
+ACTIVE_SETTINGS_ID = 1
+
+def _create_base_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+                    id INTEGER PRIMARY KEY,
+                    timer_duration REAL,
+                    reset_timer_on_save BOOLEAN,
+                    enable_sound BOOLEAN,
+                    final_sound_filename TEXT,
+                    intermediate_sound_filename TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS profiles (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT,
+                    settings_id INTEGER,
+                    FOREIGN KEY (settings_id) REFERENCES settings (id)
+        )
+    """)
+
+def _add_intermediate_bells(cursor):
+    # Databases of earlier versions may already have this column
+    columns = [row["name"] for row in cursor.execute("PRAGMA table_info(settings)")]
+    if "intermediate_bells" not in columns:
+        cursor.execute("ALTER TABLE settings ADD COLUMN intermediate_bells TEXT")
+
+def _split_settings_history(cursor):
+    # Earlier versions inserted a new settings row on every save and used the latest one.
+    # Move all of them to history and keep only the latest one as active settings.
+    cursor.execute("""
+        CREATE TABLE settings_history (
+                    id INTEGER PRIMARY KEY,
+                    saved_at REAL,
+                    timer_duration REAL,
+                    reset_timer_on_save BOOLEAN,
+                    enable_sound BOOLEAN,
+                    final_sound_filename TEXT,
+                    intermediate_sound_filename TEXT,
+                    intermediate_bells TEXT
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO settings_history (timer_duration,
+                                      reset_timer_on_save,
+                                      enable_sound,
+                                      final_sound_filename,
+                                      intermediate_sound_filename,
+                                      intermediate_bells)
+        SELECT timer_duration,
+               reset_timer_on_save,
+               enable_sound,
+               final_sound_filename,
+               intermediate_sound_filename,
+               intermediate_bells
+          FROM settings
+         ORDER BY id
+    """)
+    cursor.execute("DELETE FROM settings WHERE id < (SELECT MAX(id) FROM settings)")
+    cursor.execute("UPDATE settings SET id = ?", (ACTIVE_SETTINGS_ID,))
+
+def _add_profile_name_index(cursor):
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS profiles_name ON profiles (name)")
+
+def _add_display_precision(cursor):
+    cursor.execute("ALTER TABLE settings ADD COLUMN display_precision INTEGER")
+    cursor.execute("ALTER TABLE settings_history ADD COLUMN display_precision INTEGER")
+
+def _add_sessions(cursor):
+    cursor.execute("""
+        CREATE TABLE sessions (
+                    id INTEGER PRIMARY KEY,
+                    started_at REAL NOT NULL,
+                    ended_at REAL NOT NULL,
+                    duration REAL NOT NULL,
+                    elapsed REAL NOT NULL,
+                    bells_fired INTEGER NOT NULL,
+                    outcome TEXT NOT NULL CHECK (outcome IN ('finished', 'reset'))
+        )
+    """)
+    # Covers totals queries, so they read the index only
+    cursor.execute("CREATE INDEX sessions_started_at ON sessions (started_at, elapsed, outcome)")
+
+def _add_checkpoints(cursor):
+    # One row per running or paused countdown: deadline while running, remaining time while paused
+    cursor.execute("""
+        CREATE TABLE checkpoints (
+                    name TEXT PRIMARY KEY,
+                    deadline REAL,
+                    paused_remaining REAL,
+                    duration REAL NOT NULL,
+                    bell_offsets TEXT NOT NULL,
+                    bells_fired INTEGER NOT NULL,
+                    started_at REAL NOT NULL,
+                    CHECK ((deadline IS NULL) != (paused_remaining IS NULL))
+        )
+    """)
+
+def _add_checkpoint_bells_skipped(cursor):
+    # Bells that came due while no process ran the countdown are skipped, not fired
+    cursor.execute("ALTER TABLE checkpoints ADD COLUMN bells_skipped INTEGER NOT NULL DEFAULT 0")
+
+# Schema migrations in order. Database's PRAGMA user_version is the number of applied ones.
+MIGRATIONS = [
+    _create_base_tables,
+    _add_intermediate_bells,
+    _split_settings_history,
+    _add_profile_name_index,
+    _add_display_precision,
+    _add_sessions,
+    _add_checkpoints,
+    _add_checkpoint_bells_skipped,
+]
+
+SETTINGS_COLUMNS = ("timer_duration",
+                    "reset_timer_on_save",
+                    "enable_sound",
+                    "final_sound_filename",
+                    "intermediate_sound_filename",
+                    "intermediate_bells",
+                    "display_precision")
+
+SELECT_SETTINGS = f"SELECT {', '.join(SETTINGS_COLUMNS)} FROM settings WHERE id = ?"
+UPSERT_SETTINGS = f"""
+    INSERT INTO settings (id, {', '.join(SETTINGS_COLUMNS)})
+    VALUES (?, {', '.join('?' for _ in SETTINGS_COLUMNS)})
+    ON CONFLICT (id) DO UPDATE
+       SET {', '.join(f'{column} = excluded.{column}' for column in SETTINGS_COLUMNS)}
+"""
+# Updates only the given columns of a settings row
+UPDATE_SETTINGS = "UPDATE settings SET {assignments} WHERE id = ?"
+INSERT_HISTORY = f"""
+    INSERT INTO settings_history (saved_at, {', '.join(SETTINGS_COLUMNS)})
+    VALUES (?, {', '.join('?' for _ in SETTINGS_COLUMNS)})
+"""
+SELECT_PROFILES = f"""
+    SELECT profiles.name, {', '.join(f'settings.{column}' for column in SETTINGS_COLUMNS)}
+      FROM profiles
+      JOIN settings ON settings.id = profiles.settings_id
+     ORDER BY profiles.name
+"""
+SELECT_PROFILE_SETTINGS_ID = "SELECT settings_id FROM profiles WHERE name = ?"
+# Profiles' settings rows get ids after the active settings row
+INSERT_PROFILE_SETTINGS = f"""
+    INSERT INTO settings (id, {', '.join(SETTINGS_COLUMNS)})
+    VALUES ((SELECT MAX(COALESCE(MAX(id), 0), ?) + 1 FROM settings),
+            {', '.join('?' for _ in SETTINGS_COLUMNS)})
+"""
+INSERT_PROFILE = "INSERT INTO profiles (name, settings_id) VALUES (?, ?)"
+DELETE_PROFILE = "DELETE FROM profiles WHERE name = ?"
+DELETE_SETTINGS = "DELETE FROM settings WHERE id = ?"
+PRUNE_HISTORY = """
+    DELETE FROM settings_history
+     WHERE id <= (SELECT id FROM settings_history ORDER BY id DESC LIMIT 1 OFFSET ?)
+"""
+
+SESSION_COLUMNS = ("started_at",
+                   "ended_at",
+                   "duration",
+                   "elapsed",
+                   "bells_fired",
+                   "outcome")
+
+INSERT_SESSION = f"""
+    INSERT INTO sessions ({', '.join(SESSION_COLUMNS)})
+    VALUES ({', '.join('?' for _ in SESSION_COLUMNS)})
+"""
+SELECT_SESSIONS = f"""
+    SELECT {', '.join(SESSION_COLUMNS)}
+      FROM sessions
+     WHERE started_at >= ? AND started_at < ?
+     ORDER BY started_at
+"""
+# Start of period in local time: the day itself or Monday of the week
+SESSION_PERIODS = {
+    "day": "date(started_at, 'unixepoch', 'localtime')",
+    "week": "date(started_at, 'unixepoch', 'localtime', 'weekday 0', '-6 days')",
+}
+SELECT_SESSION_TOTALS = """
+    SELECT {period} AS period,
+           COUNT(*) AS runs,
+           SUM(outcome = 'finished') AS finished,
+           SUM(elapsed) AS elapsed
+      FROM sessions
+     WHERE started_at >= ? AND started_at < ?
+     GROUP BY period
+     ORDER BY period
+"""
+
+CHECKPOINT_COLUMNS = ("name",
+                      "deadline",
+                      "paused_remaining",
+                      "duration",
+                      "bell_offsets",
+                      "bells_fired",
+                      "bells_skipped",
+                      "started_at")
+
+UPSERT_CHECKPOINT = f"""
+    INSERT OR REPLACE INTO checkpoints ({', '.join(CHECKPOINT_COLUMNS)})
+    VALUES ({', '.join('?' for _ in CHECKPOINT_COLUMNS)})
+"""
+SELECT_CHECKPOINTS = f"SELECT {', '.join(CHECKPOINT_COLUMNS)} FROM checkpoints"
+DELETE_CHECKPOINT = "DELETE FROM checkpoints WHERE name = ?"
+
+def settings_to_row(settings):
+    """Convert Settings to tuple of SETTINGS_COLUMNS values.
+    """
+    return (settings.timer_duration,
+            settings.reset_timer_on_save,
+            settings.enable_sound,
+            settings.final_sound_filename,
+            settings.intermediate_sound_filename,
+            json.dumps(settings.intermediate_bells),
+            settings.display_precision)
+
+def row_to_settings(row):
+    """Convert sqlite3.Row with SETTINGS_COLUMNS to Settings. NULL columns get default values.
+    """
+    fields = {"timer_duration": row["timer_duration"],
+              "reset_timer_on_save": bool(row["reset_timer_on_save"]),
+              "enable_sound": bool(row["enable_sound"]),
+              "final_sound_filename": row["final_sound_filename"],
+              "intermediate_sound_filename": row["intermediate_sound_filename"],
+              "intermediate_bells": json.loads(row["intermediate_bells"]) if row["intermediate_bells"] else (),
+              "display_precision": row["display_precision"]}
+    return Settings(**{name: value for name, value in fields.items() if value is not None})
+
+def session_to_row(session):
+    """Convert session dictionary to tuple of SESSION_COLUMNS values.
+    """
+    return tuple(session[column] for column in SESSION_COLUMNS)
+
+def checkpoint_to_row(checkpoint):
+    """Convert checkpoint dictionary to tuple of CHECKPOINT_COLUMNS values.
+    """
+    return tuple(json.dumps(checkpoint[column]) if column == "bell_offsets" else checkpoint[column]
+                 for column in CHECKPOINT_COLUMNS)
+
+def row_to_checkpoint(row):
+    """Convert sqlite3.Row with CHECKPOINT_COLUMNS to checkpoint dictionary.
+    """
+    checkpoint = dict(row)
+    checkpoint["bell_offsets"] = json.loads(checkpoint["bell_offsets"])
+    return checkpoint
+
+class SettingsStore:
+    """Persistence of settings in SQLite database over one long-lived connection.
+
+    Active settings are kept in a single settings row that is updated in place. Every save
+    is also appended to settings_history, which is pruned to history_limit rows. Pruning is
+    done once per PRUNE_BATCH saves rather than on every save.
+
+    Completed timer runs are kept in sessions table, which is never pruned. Running and
+    paused countdowns are kept in checkpoints table until they finish or are reset.
+    """
+    # Rows fetched at once while iterating over sessions
+    FETCH_SIZE = 1000
+    HISTORY_LIMIT = 100
+    PRUNE_BATCH = 50
+
+    def __init__(self, db_path, history_limit=HISTORY_LIMIT):
+        """Open database and upgrade its schema.
+
+        Args:
+            db_path (str or pathlib.Path): path to database file.
+            history_limit (int): number of saved settings to keep in history.
+        """
+        self.history_limit = history_limit
+        self._in_transaction = False
+        self.con = sqlite3.connect(db_path)
+        self.con.row_factory = sqlite3.Row
+        self.con.execute("PRAGMA journal_mode = WAL")
+        # In WAL mode NORMAL is durable against application crashes and much faster than FULL
+        self.con.execute("PRAGMA synchronous = NORMAL")
+        self.migrate()
+        self._history_count = self.con.execute("SELECT COUNT(*) FROM settings_history").fetchone()[0]
+
+    def migrate(self):
+        """Apply schema migrations that are not applied yet, each in its own transaction.
+        """
+        version = self.con.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            with self.con:
+                # Explicit BEGIN makes schema changes transactional too
+                self.con.execute("BEGIN")
+                migration(self.con.cursor())
+                # PRAGMA doesn't support parameters
+                self.con.execute(f"PRAGMA user_version = {number}")
+
+    @contextmanager
+    def transaction(self):
+        """Run statements in one transaction, committed on exit or rolled back on exception.
+        Nested transactions are merged into the outermost one.
+        """
+        if self._in_transaction:
+            yield
+            return
+        self._in_transaction = True
+        try:
+            with self.con:
+                self.con.execute("BEGIN")
+                yield
+        finally:
+            self._in_transaction = False
+
+    def load_settings(self):
+        """Load active settings.
+
+        Returns:
+            settings (Settings): active settings or None if settings were never saved.
+        """
+        start = metrics.start()
+        row = self.con.execute(SELECT_SETTINGS, (ACTIVE_SETTINGS_ID,)).fetchone()
+        metrics.observe_since("db_operation_seconds", start, op="load_settings")
+        return row_to_settings(row) if row else None
+
+    def save_settings(self, settings):
+        """Save active settings and add them to history in one transaction. Only columns that
+        differ from saved active settings are updated; if none differ, nothing is written.
+
+        Args:
+            settings (Settings): settings to save.
+        Returns:
+            changed (frozenset of str): names of fields that were saved.
+        """
+        start = metrics.start()
+        values = settings_to_row(settings)
+        with self.transaction():
+            row = self.con.execute(SELECT_SETTINGS, (ACTIVE_SETTINGS_ID,)).fetchone()
+            changed = changed_fields(row_to_settings(row) if row else None, settings)
+            if row is None:
+                self.con.execute(UPSERT_SETTINGS, (ACTIVE_SETTINGS_ID, *values))
+            elif changed:
+                columns = [(column, value) for column, value in zip(SETTINGS_COLUMNS, values) if column in changed]
+                assignments = ", ".join(f"{column} = ?" for column, _ in columns)
+                self.con.execute(UPDATE_SETTINGS.format(assignments=assignments),
+                                 (*[value for _, value in columns], ACTIVE_SETTINGS_ID))
+            if changed:
+                self.con.execute(INSERT_HISTORY, (time.time(), *values))
+                self._history_count += 1
+                if self._history_count >= self.history_limit + self.PRUNE_BATCH:
+                    self.prune_history()
+        metrics.observe_since("db_operation_seconds", start, op="save_settings")
+        return changed
+
+    def load_profiles(self):
+        """Load all profiles with their settings in one query.
+
+        Returns:
+            profiles (dict): profile name -> Settings, ordered by name.
+        """
+        start = metrics.start()
+        profiles = {row["name"]: row_to_settings(row) for row in self.con.execute(SELECT_PROFILES)}
+        metrics.observe_since("db_operation_seconds", start, op="load_profiles")
+        return profiles
+
+    def save_profile(self, name, settings):
+        """Create profile or replace settings of existing one.
+
+        Args:
+            name (str): profile name.
+            settings (Settings): profile's settings.
+        """
+        start = metrics.start()
+        values = settings_to_row(settings)
+        with self.transaction():
+            row = self.con.execute(SELECT_PROFILE_SETTINGS_ID, (name,)).fetchone()
+            if row:
+                self.con.execute(UPSERT_SETTINGS, (row["settings_id"], *values))
+            else:
+                cursor = self.con.execute(INSERT_PROFILE_SETTINGS, (ACTIVE_SETTINGS_ID, *values))
+                self.con.execute(INSERT_PROFILE, (name, cursor.lastrowid))
+        metrics.observe_since("db_operation_seconds", start, op="save_profile")
+
+    def delete_profile(self, name):
+        """Delete profile and its settings. Deleting non-existent profile does nothing.
+
+        Args:
+            name (str): profile name.
+        """
+        with self.transaction():
+            row = self.con.execute(SELECT_PROFILE_SETTINGS_ID, (name,)).fetchone()
+            if row:
+                self.con.execute(DELETE_PROFILE, (name,))
+                self.con.execute(DELETE_SETTINGS, (row["settings_id"],))
+
+    def prune_history(self):
+        """Delete the oldest history rows beyond history_limit.
+        """
+        self.con.execute(PRUNE_HISTORY, (self.history_limit,))
+        self._history_count = self.con.execute("SELECT COUNT(*) FROM settings_history").fetchone()[0]
+
+    def add_sessions(self, sessions):
+        """Record completed timer runs.
+
+        Args:
+            sessions (list of dict): sessions with SESSION_COLUMNS keys: started_at and ended_at
+                (float, Unix time), duration and elapsed (float, seconds), bells_fired (int)
+                and outcome ("finished" or "reset").
+        """
+        start = metrics.start()
+        with self.transaction():
+            self.con.executemany(INSERT_SESSION, map(session_to_row, sessions))
+        metrics.observe_since("db_operation_seconds", start, op="add_sessions")
+
+    def iter_sessions(self, since=0.0, until=float("inf")):
+        """Iterate over sessions started in [since; until) range, oldest first. Rows are fetched
+        in chunks of FETCH_SIZE, so memory use doesn't depend on number of sessions.
+
+        Args:
+            since (float): Unix time.
+            until (float): Unix time.
+        Yields:
+            session (dict): session dictionary, see add_sessions().
+        """
+        cursor = self.con.execute(SELECT_SESSIONS, (since, until))
+        while True:
+            rows = cursor.fetchmany(self.FETCH_SIZE)
+            if not rows:
+                return
+            for row in rows:
+                yield dict(zip(SESSION_COLUMNS, row))
+
+    def session_totals(self, period="day", since=0.0, until=float("inf")):
+        """Sum up sessions started in [since; until) range by local day or week.
+
+        Args:
+            period (str): "day" or "week". Weeks start on Monday.
+            since (float): Unix time.
+            until (float): Unix time.
+        Returns:
+            totals (list of dict): one dict per period with sessions, oldest first: period
+                (str, date of period's first day), runs (int), finished (int) and elapsed (float, seconds).
+        """
+        if period not in SESSION_PERIODS:
+            raise ValueError(f"Period must be one of {list(SESSION_PERIODS)}, got {period!r}")
+        start = metrics.start()
+        query = SELECT_SESSION_TOTALS.format(period=SESSION_PERIODS[period])
+        totals = [dict(row) for row in self.con.execute(query, (since, until))]
+        metrics.observe_since("db_operation_seconds", start, op="session_totals")
+        return totals
+
+    def export_sessions_csv(self, path, since=0.0, until=float("inf")):
+        """Write sessions started in [since; until) range to CSV file. Rows are streamed from
+        the database to the file, so exporting takes constant memory.
+
+        Args:
+            path (str or pathlib.Path): path to output file.
+            since (float): Unix time.
+            until (float): Unix time.
+        Returns:
+            count (int): number of exported sessions.
+        """
+        count = 0
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(SESSION_COLUMNS)
+            cursor = self.con.execute(SELECT_SESSIONS, (since, until))
+            while True:
+                rows = cursor.fetchmany(self.FETCH_SIZE)
+                if not rows:
+                    return count
+                writer.writerows(rows)
+                count += len(rows)
+
+    def save_checkpoint(self, checkpoint):
+        """Save state of running or paused countdown, replacing its previous checkpoint.
+
+        Args:
+            checkpoint (dict): checkpoint with CHECKPOINT_COLUMNS keys, see countdown.Countdown.checkpoint().
+        """
+        start = metrics.start()
+        with self.transaction():
+            self.con.execute(UPSERT_CHECKPOINT, checkpoint_to_row(checkpoint))
+        metrics.observe_since("db_operation_seconds", start, op="save_checkpoint")
+
+    def delete_checkpoint(self, name):
+        """Delete checkpoint of countdown. Deleting non-existent checkpoint does nothing.
+
+        Args:
+            name (str): name of countdown.
+        """
+        with self.transaction():
+            self.con.execute(DELETE_CHECKPOINT, (name,))
+
+    def load_checkpoints(self):
+        """Load checkpoints of all countdowns that were running or paused.
+
+        Returns:
+            checkpoints (dict): name of countdown -> checkpoint dictionary.
+        """
+        start = metrics.start()
+        checkpoints = {row["name"]: row_to_checkpoint(row) for row in self.con.execute(SELECT_CHECKPOINTS)}
+        metrics.observe_since("db_operation_seconds", start, op="load_checkpoints")
+        return checkpoints
+
+    def close(self):
+        self.con.close()
+
+class BackgroundWriter:
+    """Write-behind queue that runs database writes on its own thread with its own SettingsStore.
+
+    Jobs submitted close together are run in one transaction. Jobs submitted with the same key
+    replace each other within a batch, so only the latest of several saves is written.
+    """
+    COALESCE_DELAY = 0.05
+
+    def __init__(self, db_path, on_error=None, coalesce_delay=COALESCE_DELAY, **store_kwargs):
+        """
+        Args:
+            db_path (str or pathlib.Path): path to database file.
+            on_error (callable): on_error(exception) is called from writer thread when a batch fails.
+            coalesce_delay (float): seconds to wait for more jobs before writing a batch.
+            store_kwargs: keyword arguments passed to SettingsStore.
+        """
+        self.db_path = db_path
+        self.on_error = on_error
+        self.coalesce_delay = coalesce_delay
+        self.store_kwargs = store_kwargs
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="BackgroundWriter", daemon=True)
+        self._thread.start()
+
+    def submit(self, job, key=None):
+        """Queue job to run on writer thread.
+
+        Args:
+            job (callable): job(store) is called with writer's SettingsStore.
+            key (hashable): jobs with the same key in one batch are replaced by the latest one.
+        """
+        self._queue.put((key, job))
+
+    def flush(self, timeout=None):
+        """Block until all jobs submitted before this call are written.
+
+        Returns:
+            flushed (bool): False if timeout expired.
+        """
+        done = threading.Event()
+        self._queue.put((None, done))
+        return done.wait(timeout)
+
+    def close(self):
+        """Write pending jobs and stop writer thread.
+        """
+        if self._thread.is_alive():
+            self._queue.put((None, None))
+            self._thread.join()
+
+    def _run(self):
+        store = SettingsStore(self.db_path, **self.store_kwargs)
+        running = True
+        while running:
+            batch = {}
+            waiters = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.coalesce_delay
+            while True:
+                key, job = item
+                if job is None:
+                    running = False
+                    break
+                if isinstance(job, threading.Event):
+                    # Flush requests are served right away
+                    waiters.append(job)
+                    break
+                batch[key if key is not None else object()] = job
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                start = metrics.start()
+                try:
+                    with store.transaction():
+                        for job in batch.values():
+                            job(store)
+                    # Whole batch including commit, which is where the disk is written
+                    metrics.observe_since("db_operation_seconds", start, op="write_batch")
+                except Exception:
+                    # Batch was rolled back, retry jobs one by one so that only failing ones are lost
+                    for job in batch.values():
+                        self._run_job(store, job)
+            for waiter in waiters:
+                waiter.set()
+        store.close()
+
+    def _run_job(self, store, job):
+        try:
+            with store.transaction():
+                job(store)
+        except Exception as e:
+            if self.on_error is not None:
+                self.on_error(e)
@@ -0,0 +1,34 @@
+import os
+import sys
+import pytest
+from pathlib import Path
+
+# Modules of the application are imported the way the application does, from its directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# No sound device is needed, sounds are rendered and discarded
+os.environ["TIMERAPP_AUDIO"] = "null"
+# Widgets are created without a display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+@pytest.fixture(autouse=True)
+def prepared_sounds_directory(tmp_path, monkeypatch):
+    # Sounds prepared by tests don't end up in the application's directory
+    import sound_prep
+    monkeypatch.setattr(sound_prep.prepared_sounds, "directory", tmp_path / "prepared_sounds")
+
+@pytest.fixture(scope="session")
+def qapp():
+    from PyQt6.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+@pytest.fixture
+def window(qapp, tmp_path, monkeypatch):
+    """Main window with its own database."""
+    import main
+    monkeypatch.setattr(main, "DB_PATH", tmp_path / "timer_app.db")
+    window = main.TimerApp()
+    yield window
+    window.audio_loader.wait()
+    window.writer.writer.close()
+    window.store.close()
+    window.deleteLater()
@@ -0,0 +1,47 @@
+"""Fakes shared by tests."""
+from scheduler import Scheduler
+
+class FakeClock:
+    """Monotonic clock that only moves when a test moves it."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class FakeLoop:
+    """Event loop stand-in that fires a scheduler's events on a fake clock.
+
+    Every wakeup comes lateness() seconds after the deadline the scheduler armed, like
+    a real timer on a busy machine.
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock or FakeClock()
+        self.armed_at = None
+        self.wakeups = 0
+        self.scheduler = Scheduler(self.arm, clock=self.clock)
+
+    def arm(self, delay, precise):
+        self.armed_at = None if delay is None else self.clock() + delay
+
+    def run_until(self, when):
+        """Fire events due up to given time, on time, and move clock there.
+        """
+        while self.armed_at is not None and self.armed_at <= when:
+            self.clock.now = max(self.clock.now, self.armed_at)
+            self.wakeups += 1
+            self.scheduler.run_due()
+        self.clock.now = max(self.clock.now, when)
+
+    def run_until_idle(self, lateness=lambda: 0.0):
+        """Fire events until none is left.
+
+        Args:
+            lateness (callable): lateness() gives seconds by which the next wakeup is late.
+        """
+        while self.armed_at is not None:
+            self.clock.now = max(self.clock.now, self.armed_at + lateness())
+            self.wakeups += 1
+            self.scheduler.run_due()
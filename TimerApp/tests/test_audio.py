@@ -0,0 +1,89 @@
+import wave
+import numpy as np
+import audio
+from audio import CHANNELS, SAMPLE_RATE, NullAudioOutput, Sound
+from fakes import FakeClock
+
+def click(level=0.25, frames=10):
+    return Sound(np.full((frames, CHANNELS), level, dtype=np.float32), SAMPLE_RATE)
+
+def render(output, blocks):
+    return np.concatenate([output.render() for _ in range(blocks)])
+
+def test_scheduled_sound_starts_on_exact_frame():
+    output = NullAudioOutput(clock=FakeClock(0.0))
+    output.play_at(click(), 1000 / SAMPLE_RATE)
+    rendered = render(output, 8)
+    assert int(np.flatnonzero(rendered[:, 0])[0]) == 1000
+    assert np.allclose(rendered[1000:1010], 0.25)
+    assert not rendered[1010:].any()
+
+def test_overlapping_sounds_are_mixed():
+    output = NullAudioOutput(clock=FakeClock(0.0))
+    output.play_at(click(), 1000 / SAMPLE_RATE)
+    output.play_at(click(), 1005 / SAMPLE_RATE)
+    rendered = render(output, 8)
+    assert np.allclose(rendered[1000:1005, 0], 0.25)
+    assert np.allclose(rendered[1005:1010, 0], 0.5)
+    assert np.allclose(rendered[1010:1015, 0], 0.25)
+
+def test_mix_is_clipped():
+    output = NullAudioOutput(clock=FakeClock(0.0))
+    for _ in range(3):
+        output.play_at(click(0.5), 0.0)
+    assert np.abs(render(output, 1)).max() == 1.0
+
+def test_stopped_sound_is_not_played():
+    output = NullAudioOutput(clock=FakeClock(0.0))
+    voice = output.play_at(click(), 1000 / SAMPLE_RATE)
+    output.stop(voice)
+    assert not render(output, 8).any()
+
+def test_sound_played_now_starts_with_next_block_and_reports_latency():
+    clock = FakeClock(0.0)
+    output = NullAudioOutput(clock=clock)
+    output.play(click())
+    rendered = output.render()
+    assert np.allclose(rendered[:10], 0.25)
+    assert output.start_latency == 0.0
+    assert output.latency == audio.BLOCK_SIZE / SAMPLE_RATE
+
+def test_sound_scheduled_in_the_past_starts_right_away():
+    clock = FakeClock(0.0)
+    output = NullAudioOutput(clock=clock)
+    render(output, 4)
+    output.play_at(click(), 0.0)
+    assert np.allclose(output.render()[:10], 0.25)
+
+def write_tone(path, frames=48000, rate=48000):
+    tone = (np.sin(np.arange(frames) * 0.05) * 20000).astype("<i2")
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(tone.tobytes())
+    return path
+
+def test_large_files_are_streamed(tmp_path):
+    path = write_tone(tmp_path / "tone.wav")
+    assert isinstance(audio.load_wave(path), Sound)
+    streamed = audio.load_wave(path, stream_threshold=0)
+    assert isinstance(streamed, audio.StreamedSound)
+    assert streamed.nbytes == 0 and streamed.frames == 48000 and streamed.channels == 1
+
+def test_streamed_sound_plays_like_decoded_one(tmp_path):
+    path = write_tone(tmp_path / "tone.wav")
+    expected = audio.load_wave(path).converted(SAMPLE_RATE, CHANNELS)
+    samples = audio.load_wave(path, stream_threshold=0).converted(SAMPLE_RATE, CHANNELS)
+    assert len(samples) == len(expected)
+    blocks = [samples[start:start + audio.BLOCK_SIZE] for start in range(0, len(samples), audio.BLOCK_SIZE)]
+    assert np.abs(np.concatenate(blocks) - expected).max() < 1e-6
+
+def test_streamed_sound_is_mixed_block_by_block(tmp_path):
+    path = write_tone(tmp_path / "tone.wav")
+    expected = audio.load_wave(path).converted(SAMPLE_RATE, CHANNELS)
+    output = NullAudioOutput(clock=FakeClock(0.0))
+    output.play_at(audio.load_wave(path, stream_threshold=0), 0.0)
+    rendered = render(output, len(expected) // audio.BLOCK_SIZE + 2)
+    assert np.abs(rendered[:len(expected)] - expected).max() < 1e-6
+    assert not rendered[len(expected):].any()
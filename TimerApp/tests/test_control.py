@@ -0,0 +1,88 @@
+import json
+import asyncio
+from control import ControlClient, ControlSession, start_control_server
+from daemon import TimerService
+from settings import Settings
+
+class Target:
+    """Control target without timers."""
+    countdowns = {}
+    scheduler = None
+
+    def start(self, name):
+        pass
+
+    pause = resume = reset = start
+
+    def load_profile(self, name, profile_name):
+        pass
+
+def test_request_that_fails_to_parse_gets_error_response():
+    sent = []
+    session = ControlSession(Target(), sent.append)
+    # Nested too deep for the JSON parser, which raises RecursionError
+    session.handle_line(b"[" * 100000)
+    session.handle_line(b'{"cmd": "status", "id": 7}')
+    responses = [json.loads(line) for line in sent]
+    assert responses[0]["ok"] is False and "recursion" in responses[0]["error"]
+    assert responses[1] == {"ok": True, "result": {}, "id": 7}
+
+def test_batch_with_unhashable_command_name_gets_array_response():
+    sent = []
+    session = ControlSession(Target(), sent.append)
+    session.handle_line(b'[{"cmd": "reset"}, {"cmd": ["x"], "id": 2}]')
+    [response] = [json.loads(line) for line in sent]
+    assert response[0] == {"ok": True}
+    assert response[1] == {"ok": False, "error": "Unknown command ['x']", "id": 2}
+
+def test_command_that_raises_fails_alone():
+    class FailingTarget(Target):
+        countdowns = {"a": None}
+
+        def pause(self, name):
+            raise RuntimeError("timer is gone")
+
+    sent = []
+    session = ControlSession(FailingTarget(), sent.append)
+    session.handle_line(b'[{"cmd": "pause"}, {"cmd": "reset"}]')
+    [response] = [json.loads(line) for line in sent]
+    assert response == [{"ok": False, "error": "Command failed: timer is gone"}, {"ok": True}]
+
+def test_client_controls_timers_over_socket(tmp_path):
+    socket_path = tmp_path / "control.sock"
+
+    def client_session():
+        with ControlClient(socket_path, timeout=10) as client:
+            results = [client.request([{"cmd": "start", "timer": "a"}, {"cmd": "status", "id": 1}])]
+            # Bad lines are answered with errors and don't end the connection
+            client.sock.sendall(b"[" * 100000 + b"\n")
+            results.append(client.receive())
+            client.sock.sendall(b"not json\n")
+            results.append(client.receive())
+            results.append(client.request({"cmd": "pause", "timer": "nope"}))
+            results.append(client.request({"cmd": "reset"}))
+            results.append(client.request({"cmd": "status", "timer": "a"}))
+            return results
+
+    async def serve():
+        service = TimerService(tmp_path / "timers.db")
+        await service.open()
+        for name in ("a", "b"):
+            await service.add_timer(name, Settings(timer_duration=60.0))
+        server = await start_control_server(service, socket_path)
+        try:
+            return await asyncio.to_thread(client_session)
+        finally:
+            server.close()
+            await service.close()
+
+    batch, deep, invalid, unknown, reset, status = asyncio.run(serve())
+    assert batch[0] == {"ok": True}
+    assert batch[1]["id"] == 1
+    assert batch[1]["result"]["a"]["state"] == "running"
+    assert batch[1]["result"]["b"]["state"] == "stopped"
+    assert deep["ok"] is False
+    assert invalid["ok"] is False and invalid["error"].startswith("Invalid JSON")
+    assert unknown == {"ok": False, "error": "No timer named 'nope'"}
+    assert reset == {"ok": True}
+    assert status["result"]["a"] == {"state": "stopped", "remaining": 60.0, "duration": 60.0}
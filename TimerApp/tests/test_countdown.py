@@ -0,0 +1,175 @@
+import wave
+import numpy as np
+import pytest
+import audio
+from countdown import Countdown, SOUND_QUEUE_AHEAD, checkpoint_listener
+from settings import Settings
+from storage import SettingsStore
+from fakes import FakeLoop
+
+class RecordingOutput(audio.NullAudioOutput):
+    """Null output that records every sound played or queued on it."""
+
+    def __init__(self, clock):
+        super().__init__(clock=clock)
+        # (time of call, voice)
+        self.played = []
+        # (time of call, start time, voice)
+        self.queued = []
+
+    def play(self, sound):
+        voice = super().play(sound)
+        self.played.append((self.clock(), voice))
+        return voice
+
+    def play_at(self, sound, when):
+        voice = super().play_at(sound, when)
+        self.queued.append((self.clock(), when, voice))
+        return voice
+
+def write_wave(path, level):
+    samples = np.full(4410, int(level * 32767), dtype="<i2")
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(44100)
+        wav.writeframes(samples.tobytes())
+    return str(path)
+
+@pytest.fixture
+def loop():
+    return FakeLoop()
+
+@pytest.fixture
+def settings(tmp_path):
+    return Settings(timer_duration=100.0,
+                    final_sound_filename=write_wave(tmp_path / "final.wav", 0.5),
+                    intermediate_sound_filename=write_wave(tmp_path / "bell.wav", 0.25),
+                    intermediate_bells=(0.5,))
+
+def make_countdown(loop, settings, sessions=None):
+    output = RecordingOutput(loop.clock)
+    countdown = Countdown(loop.scheduler, settings, output, on_session=sessions.append if sessions is not None else None)
+    countdown.load_sounds()
+    return countdown, output
+
+def test_countdown_with_missing_sounds_runs_silently(loop, settings):
+    sessions = []
+    settings = settings.replace(final_sound_filename="/nonexistent/final.wav",
+                                intermediate_sound_filename="/nonexistent/bell.wav")
+    countdown, output = make_countdown(loop, settings, sessions)
+    assert countdown.final_sound is None and countdown.intermediate_sound is None
+    countdown.start()
+    loop.run_until_idle()
+    assert output.played == [] and output.queued == []
+    assert [(session["outcome"], session["bells_fired"]) for session in sessions] == [("finished", 1)]
+
+def test_sounds_are_queued_shortly_before_their_deadlines(loop, settings):
+    countdown, output = make_countdown(loop, settings)
+    countdown.start()
+    started = loop.clock.now
+    loop.run_until_idle()
+    assert [when - started for _, when, _ in output.queued] == [50.0, 100.0]
+    for queued_at, when, _ in output.queued:
+        assert when - SOUND_QUEUE_AHEAD <= queued_at < when
+    # Queued sounds are not played again by bell and finish
+    assert output.played == []
+
+def test_disabling_sound_stops_queued_sounds(loop, settings):
+    countdown, output = make_countdown(loop, settings)
+    countdown.start()
+    loop.run_until(loop.clock.now + 50.0 - SOUND_QUEUE_AHEAD / 2)
+    [(_, _, bell_voice)] = output.queued
+    countdown.apply_settings(settings.replace(enable_sound=False))
+    assert bell_voice.stopped
+    loop.run_until_idle()
+    assert len(output.queued) == 1 and output.played == []
+
+def test_changing_sound_replaces_queued_sound(loop, settings, tmp_path):
+    countdown, output = make_countdown(loop, settings)
+    countdown.start()
+    loop.run_until(loop.clock.now + 50.0 - SOUND_QUEUE_AHEAD / 2)
+    [(_, bell_at, old_voice)] = output.queued
+    countdown.apply_settings(settings.replace(intermediate_sound_filename=write_wave(tmp_path / "new.wav", 0.75)))
+    assert old_voice.stopped
+    [(_, when, new_voice)] = output.queued[1:]
+    assert when == bell_at
+    assert new_voice.samples is countdown.intermediate_sound.converted(audio.SAMPLE_RATE, audio.CHANNELS)
+    assert not new_voice.stopped
+
+def test_profile_sounds_that_failed_to_load_keep_current_ones(loop, settings, tmp_path):
+    countdown, output = make_countdown(loop, settings)
+    final_sound, bell_sound = countdown.final_sound, countdown.intermediate_sound
+    profile_bell = audio.Sound(np.zeros((10, 2), dtype=np.float32), audio.SAMPLE_RATE)
+    changed = countdown.apply_settings(settings.replace(final_sound_filename=str(tmp_path / "missing.wav"),
+                                                        intermediate_sound_filename=str(tmp_path / "other.wav")),
+                                       {"final_sound_filename": None, "intermediate_sound_filename": profile_bell})
+    assert changed == {"final_sound_filename", "intermediate_sound_filename"}
+    assert countdown.final_sound is final_sound
+    assert countdown.intermediate_sound is profile_bell is not bell_sound
+
+def test_countdown_wakes_only_for_bells_and_finish(loop, settings):
+    # An hour-long run with display ticks would wake the application thousands of times
+    settings = settings.replace(timer_duration=3600.0, intermediate_bells=(0.25, 0.5, 0.75))
+    countdown = Countdown(loop.scheduler, settings)
+    countdown.start()
+    loop.run_until_idle(lambda: 0.003)
+    assert countdown.wakeups == len(countdown.bells) + 1 == 4
+    assert loop.wakeups == countdown.wakeups
+
+def test_queueing_sounds_adds_one_wakeup_per_sound(loop, settings):
+    countdown, output = make_countdown(loop, settings.replace(timer_duration=3600.0))
+    countdown.start()
+    loop.run_until_idle()
+    assert countdown.wakeups == 2 * (len(countdown.bells) + 1) == len(output.queued) * 2
+    assert loop.wakeups == countdown.wakeups
+
+def checkpoint_after_crash(tmp_path, loop, settings, ran, down):
+    """Run a countdown for ran seconds, save its checkpoint and load it back as if the process
+    was restarted after being down for down seconds."""
+    countdown = Countdown(loop.scheduler, settings, name="crashed")
+    countdown.start()
+    loop.run_until(loop.clock.now + ran)
+    store = SettingsStore(tmp_path / "timers.db")
+    try:
+        checkpoint = countdown.checkpoint()
+        store.save_checkpoint(dict(checkpoint, deadline=checkpoint["deadline"] - down))
+        return store.load_checkpoints()["crashed"]
+    finally:
+        store.close()
+
+def test_restore_skips_bells_missed_while_not_running(tmp_path, settings):
+    settings = settings.replace(intermediate_bells=(0.25, 0.5, 0.75))
+    checkpoint = checkpoint_after_crash(tmp_path, FakeLoop(), settings, ran=30.0, down=30.0)
+    assert checkpoint["bells_fired"] == 1 and checkpoint["bells_skipped"] == 0
+    loop = FakeLoop()
+    sessions = []
+    countdown = Countdown(loop.scheduler, settings, on_session=sessions.append)
+    assert countdown.restore(checkpoint)
+    # The bell at 50 s came due while the process was down
+    assert (countdown.bells.fired, countdown.bells.skipped) == (1, 1)
+    assert countdown.checkpoint()["bells_skipped"] == 1
+    loop.run_until_idle()
+    assert countdown.wakeups == 2
+    assert [(session["outcome"], session["bells_fired"]) for session in sessions] == [("finished", 2)]
+
+def test_restore_of_expired_run_counts_only_bells_that_rang(tmp_path, settings):
+    settings = settings.replace(intermediate_bells=(0.25, 0.5, 0.75))
+    checkpoint = checkpoint_after_crash(tmp_path, FakeLoop(), settings, ran=30.0, down=100.0)
+    sessions = []
+    countdown = Countdown(FakeLoop().scheduler, settings, on_session=sessions.append)
+    assert not countdown.restore(checkpoint)
+    assert [(session["outcome"], session["bells_fired"]) for session in sessions] == [("finished", 1)]
+
+def test_countdowns_of_different_namespaces_keep_separate_checkpoints(tmp_path, settings):
+    store = SettingsStore(tmp_path / "timers.db")
+    try:
+        for namespace, duration in (("dashboard", 100.0), ("daemon", 200.0)):
+            countdown = Countdown(FakeLoop().scheduler, settings.replace(timer_duration=duration), name="timer-1")
+            countdown.listeners.append(checkpoint_listener(lambda job, key: job(store), namespace))
+            countdown.start()
+        checkpoints = store.load_checkpoints()
+        assert {name: checkpoint["duration"] for name, checkpoint in checkpoints.items()} == \
+            {"dashboard/timer-1": 100.0, "daemon/timer-1": 200.0}
+    finally:
+        store.close()
@@ -0,0 +1,81 @@
+import pytest
+from PyQt6.QtCore import Qt
+from countdown import Countdown
+from dashboard import CountdownListModel
+from settings import Settings
+from fakes import FakeLoop
+
+@pytest.fixture
+def loop():
+    return FakeLoop()
+
+@pytest.fixture
+def model(qapp, loop):
+    countdowns = [Countdown(loop.scheduler, Settings(timer_duration=600.0, display_precision=1), name=f"timer-{i}")
+                  for i in range(1, 101)]
+    model = CountdownListModel(loop.scheduler, countdowns)
+    model.changes = []
+
+    def on_data_changed(first, last, roles):
+        # Like a view, read the text of changed rows again
+        model.changes.append((first.row(), last.row()))
+        for row in range(first.row(), last.row() + 1):
+            model.data(model.index(row))
+
+    model.dataChanged.connect(on_data_changed)
+    return model
+
+def render_visible(model):
+    """Read displayed text of visible rows, the way the view does when it paints them."""
+    return [model.data(model.index(row)) for row in model.visible_rows]
+
+def test_ticks_announce_only_visible_rows_whose_text_changed(model, loop):
+    model.set_visible_rows(10, 19)
+    for countdown in model.countdowns:
+        countdown.start()
+    render_visible(model)
+    model.changes.clear()
+    loop.run_until(loop.clock.now + 1.05)
+    # One signal per tenth of a second, covering the visible rows only
+    assert len(model.changes) == 10
+    assert set(model.changes) == {(10, 19)}
+    assert loop.wakeups == 10
+
+def test_hidden_rows_are_not_announced(model, loop):
+    model.set_visible_rows(0, 4)
+    model.countdowns[50].start()
+    model.changes.clear()
+    loop.run_until(loop.clock.now + 5.0)
+    # Nothing visible runs, so there are no display updates at all
+    assert model.changes == [] and model.tick_event is None
+    model.set_visible_rows(48, 52)
+    assert model.tick_event is not None
+
+def test_no_updates_while_display_is_hidden(model, loop):
+    model.set_visible_rows(0, 9)
+    model.countdowns[0].start()
+    model.set_display_visible(False)
+    model.changes.clear()
+    loop.run_until(loop.clock.now + 5.0)
+    assert model.changes == [] and loop.wakeups == 0
+    model.set_display_visible(True)
+    assert model.tick_event is not None
+
+def test_rows_change_text_and_state_on_countdown_events(model, loop):
+    model.set_visible_rows(0, 9)
+    countdown = model.countdowns[3]
+    index = model.index(3)
+    assert model.data(index) == "10:00.0" and model.data(index, Qt.ItemDataRole.UserRole + 2) == "stopped"
+    countdown.start()
+    assert model.changes == [(3, 3)]
+    loop.run_until_idle()
+    assert model.data(index) == "Time's up!" and model.state(3) == "finished"
+
+def test_signal_spans_only_rows_whose_text_changed(model, loop):
+    model.set_visible_rows(0, 9)
+    for row in (2, 5, 7):
+        model.countdowns[row].start()
+    model.countdowns[7].pause()
+    model.changes.clear()
+    loop.run_until(loop.clock.now + 0.15)
+    assert model.changes == [(2, 5)]
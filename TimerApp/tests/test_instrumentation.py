@@ -0,0 +1,38 @@
+import json
+import logging
+from instrumentation import Metrics, StructuredFormatter
+
+def test_disabled_metrics_record_nothing():
+    registry = Metrics()
+    registry.observe("tick_lateness_seconds", 0.003)
+    assert registry.start() is None
+    registry.observe_since("tick_lateness_seconds", None)
+    assert registry.snapshot() == []
+
+def make_registry():
+    registry = Metrics(enabled=True)
+    for value in (0.0001, 0.003, 0.003, 0.7, 9.0):
+        registry.observe("tick_lateness_seconds", value, event="tick")
+    return registry
+
+def test_export_formats_are_consistent():
+    registry = make_registry()
+    entry, = registry.snapshot()
+    assert entry["count"] == 5 and entry["buckets"]["0.005"] == 3 and entry["buckets"]["+Inf"] == 5
+    assert 'timerapp_tick_lateness_seconds_bucket{event="tick",le="0.001"} 1' in registry.to_prometheus()
+    assert json.loads(registry.to_json())["metrics"][0]["max"] == 9.0
+
+def test_dump_format_follows_file_suffix(tmp_path):
+    registry = make_registry()
+    registry.dump(tmp_path / "metrics.json")
+    registry.dump(tmp_path / "metrics.prom")
+    assert json.loads((tmp_path / "metrics.json").read_text())["metrics"] == registry.snapshot()
+    assert (tmp_path / "metrics.prom").read_text() == registry.to_prometheus()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["metrics.json", "metrics.prom"]
+
+def test_structured_formatter_writes_extra_fields():
+    record = logging.LogRecord("timerapp.test", logging.INFO, __file__, 1, "sound loaded", (), None)
+    record.path = "/tmp/a b.wav"
+    record.count = 2
+    line = StructuredFormatter().format(record)
+    assert line.endswith('level=info logger=timerapp.test msg="sound loaded" path="/tmp/a b.wav" count=2')
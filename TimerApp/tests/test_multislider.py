@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+from PyQt6.QtCore import QPoint, Qt
+from PyQt6.QtTest import QTest
+from multislider import MultiSlider
+
+@pytest.fixture
+def slider(qapp):
+    slider = MultiSlider()
+    # Track is 200 pixels wide, so a point moves one pixel per 0.005
+    slider.resize(220, 20)
+    changes = []
+    slider.pointsChanged.connect(lambda: changes.append(slider.points))
+    slider.changes = changes
+    yield slider
+    slider.deleteLater()
+
+def x_of(slider, value):
+    return round(slider.get_denormalized_x(value))
+
+def test_adding_and_dragging_point_is_one_edit(slider):
+    y = slider.height() // 2
+    QTest.mousePress(slider, Qt.MouseButton.LeftButton, pos=QPoint(x_of(slider, 0.25), y))
+    assert slider.changes == []
+    QTest.mouseMove(slider, QPoint(x_of(slider, 0.5), y))
+    QTest.mouseRelease(slider, Qt.MouseButton.LeftButton, pos=QPoint(x_of(slider, 0.5), y))
+    assert slider.changes == [[0.5]]
+
+def test_adding_point_without_drag_is_one_edit(slider):
+    y = slider.height() // 2
+    QTest.mouseClick(slider, Qt.MouseButton.LeftButton, pos=QPoint(x_of(slider, 0.25), y))
+    assert slider.changes == [[0.25]]
+    # Clicking a point without moving it changes nothing
+    QTest.mouseClick(slider, Qt.MouseButton.LeftButton, pos=QPoint(x_of(slider, 0.25), y))
+    QTest.mouseClick(slider, Qt.MouseButton.RightButton, pos=QPoint(x_of(slider, 0.25), y))
+    assert slider.changes == [[0.25], []]
+
+def test_bulk_operations_keep_points_sorted_and_emit_once(slider):
+    slider.set_points([0.75, 2.0, 0.25])
+    assert slider.points == [0.25, 0.75, 1.0]
+    slider.add_points([0.9, 0.1, 0.5])
+    assert slider.points == [0.1, 0.25, 0.5, 0.75, 0.9, 1.0]
+    slider.remove_points_between(0.2, 0.75)
+    assert slider.points == [0.1, 0.9, 1.0]
+    slider.remove_points([1.0, 0.3])
+    assert slider.points == [0.1, 0.9]
+    # Operations that change nothing don't emit
+    slider.remove_points([0.3])
+    slider.remove_points_between(0.4, 0.6)
+    slider.add_points([])
+    assert len(slider.changes) == 4
+
+def test_evenly_spaced_points_exclude_ends(slider):
+    slider.set_evenly_spaced(3)
+    assert np.allclose(slider.points, [0.25, 0.5, 0.75])
+    assert slider.changes == [slider.points]
+
+def test_vectorized_transforms_match_scalar_ones(slider):
+    values = np.linspace(0.0, 1.0, 11)
+    xs = slider.get_denormalized_xs(values)
+    assert np.allclose(xs, [slider.get_denormalized_x(value) for value in values])
+    assert np.allclose(slider.get_scaled_xs(xs), values)
+
+def test_hit_testing_finds_closest_point_within_threshold(slider):
+    slider.set_points([0.25, 0.26, 0.75])
+    x = slider.get_denormalized_x(0.25)
+    assert slider.is_on_point(x) == 0
+    # 0.26 is two pixels to the right, the closer one wins on both sides
+    assert slider.is_on_point(x + 1.5) == 1
+    assert slider.is_on_point(x - slider.ON_POINT_THRESHOLD + 0.5) == 0
+    assert slider.is_on_point(x - slider.ON_POINT_THRESHOLD - 0.5) is None
+    assert slider.is_on_point(slider.get_denormalized_x(0.5)) is None
+    assert slider.is_on_point(slider.get_denormalized_x(1.0)) is None
+
+def test_hit_testing_matches_linear_scan_on_many_points(slider):
+    rng = np.random.default_rng(0)
+    slider.set_points(rng.random(10000))
+    xs = slider.get_denormalized_xs(slider.points_array)
+    for x in rng.uniform(0, slider.width(), 200):
+        distances = np.abs(xs - x)
+        expected = int(distances.argmin()) if distances.min() < slider.ON_POINT_THRESHOLD else None
+        found = slider.is_on_point(x)
+        if expected is None:
+            assert found is None
+        else:
+            # Of points at the same distance, either may be found
+            assert distances[found] == distances[expected]
+
+def test_cached_painting_matches_full_repaint(slider):
+    slider.set_points([0.1, 0.5, 0.9])
+    slider.show()
+    full = slider.grab().toImage()
+    assert slider._cache is not None
+    cache = slider._cache
+    assert slider.grab().toImage() == full
+    # Painting from cache doesn't rebuild it
+    assert slider._cache is cache
+    slider.add_points([0.3])
+    assert slider._cache is None
+    slider.hide()
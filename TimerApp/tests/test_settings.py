@@ -0,0 +1,60 @@
+import pytest
+from settings import Settings, changed_fields
+from storage import SettingsStore
+from countdown import Countdown
+from fakes import FakeLoop
+
+def test_settings_are_immutable():
+    with pytest.raises(AttributeError):
+        Settings().timer_duration = 5.0
+
+def test_changed_fields_are_exactly_the_replaced_ones():
+    defaults = Settings()
+    changed = defaults.replace(timer_duration=5.0, intermediate_bells=[0.5])
+    assert changed_fields(defaults, changed) == {"timer_duration", "intermediate_bells"}
+    assert changed_fields(defaults, Settings()) == frozenset() and defaults == Settings()
+    assert changed_fields(None, defaults) == frozenset(Settings.__slots__)
+
+def test_apply_settings_touches_only_changed_fields(monkeypatch):
+    countdown = Countdown(FakeLoop().scheduler, Settings())
+    loaded = []
+    monkeypatch.setattr(countdown, "load_sounds", lambda fields, sounds=None: loaded.append(set(fields)))
+    monkeypatch.setattr(countdown, "requeue_sounds", lambda: loaded.append("requeued"))
+    assert countdown.apply_settings(countdown.settings.replace(display_precision=1)) == {"display_precision"}
+    assert countdown.apply_settings(countdown.settings.replace(final_sound_filename="other.wav")) == {"final_sound_filename"}
+    # Only sounds whose fields changed are loaded, and queued sounds are replaced only then
+    assert loaded == [{"display_precision"}, {"final_sound_filename"}, "requeued"]
+
+def test_save_settings_updates_only_changed_columns(tmp_path):
+    store = SettingsStore(tmp_path / "timer_app.db")
+    statements = []
+    store.con.set_trace_callback(statements.append)
+    try:
+        settings = Settings()
+        assert store.save_settings(settings) == frozenset(Settings.__slots__)
+        statements.clear()
+        assert store.save_settings(settings.replace(timer_duration=5.0)) == {"timer_duration"}
+        [update] = [statement for statement in statements if statement.lstrip().upper().startswith("UPDATE")]
+        assert "timer_duration" in update and "enable_sound" not in update
+        statements.clear()
+        assert store.save_settings(settings.replace(timer_duration=5.0)) == frozenset()
+        assert not [statement for statement in statements if statement.lstrip().upper().startswith(("UPDATE", "INSERT"))]
+        assert store.load_settings() == settings.replace(timer_duration=5.0)
+    finally:
+        store.close()
+
+def test_switching_profile_while_paused_keeps_paused_run(window):
+    import profiles
+    from countdown import sound_cache
+    window.start_timer()
+    window.countdown.pause()
+    remaining = window.countdown.remaining()
+    settings = window.settings.replace(timer_duration=window.settings.timer_duration + 60.0)
+    window.profiles["longer"] = profiles.load_profile("longer", settings, sound_cache)
+    window.switch_profile("longer")
+    assert window.countdown.is_paused and window.countdown.remaining() == remaining
+    assert window.settings.timer_duration == settings.timer_duration
+    window.countdown.resume()
+    window.reset_timer()
+    # New duration applies from the next start
+    assert window.countdown.remaining() == settings.timer_duration
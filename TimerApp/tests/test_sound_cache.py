@@ -0,0 +1,81 @@
+import os
+import pytest
+from sound_cache import SoundCache
+
+class FakeSound:
+    def __init__(self, path, nbytes):
+        self.path = path
+        self.nbytes = nbytes
+
+class CountingLoader:
+    """Loader that makes sounds of a fixed size and counts loads per path."""
+
+    def __init__(self, nbytes=100):
+        self.nbytes = nbytes
+        self.loads = {}
+
+    def __call__(self, path):
+        self.loads[path] = self.loads.get(path, 0) + 1
+        return FakeSound(path, self.nbytes)
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for name in ("a.wav", "b.wav", "c.wav"):
+        path = tmp_path / name
+        path.write_bytes(b"RIFF" + name.encode())
+        paths.append(str(path))
+    return paths
+
+def test_sounds_are_loaded_once(files):
+    loader = CountingLoader()
+    cache = SoundCache(loader, max_bytes=1000)
+    first = cache.get(files[0])
+    assert cache.get(files[0]) is first
+    assert list(loader.loads.values()) == [1]
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "entries": 1, "bytes": 100}
+
+def test_least_recently_used_sound_is_evicted_over_budget(files):
+    loader = CountingLoader()
+    cache = SoundCache(loader, max_bytes=250)
+    a, b, c = files
+    cache.get(a)
+    cache.get(b)
+    # a becomes the most recently used, so b goes when c doesn't fit
+    cache.get(a)
+    cache.get(c)
+    assert a in cache and c in cache and b not in cache
+    assert cache.current_bytes == 200 and cache.evictions == 1
+
+def test_sound_larger_than_budget_is_not_cached(files):
+    cache = SoundCache(CountingLoader(nbytes=2000), max_bytes=1000)
+    assert cache.get(files[0]).nbytes == 2000
+    assert len(cache) == 0 and cache.current_bytes == 0
+
+def test_changed_file_is_loaded_again_and_replaces_old_version(files):
+    loader = CountingLoader()
+    cache = SoundCache(loader, max_bytes=1000)
+    path = files[0]
+    old = cache.get(path)
+    with open(path, "ab") as f:
+        f.write(b"more")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    new = cache.get(path)
+    assert new is not old
+    assert loader.loads[path] == 2
+    assert len(cache) == 1 and cache.current_bytes == 100
+
+def test_missing_file_raises_and_is_not_cached(tmp_path):
+    cache = SoundCache(CountingLoader())
+    with pytest.raises(OSError):
+        cache.get(tmp_path / "missing.wav")
+    assert tmp_path / "missing.wav" not in cache
+
+def test_sounds_without_size_are_evicted_over_entries_limit(files):
+    # Like streamed sounds, which report no memory but keep a file mapped
+    cache = SoundCache(CountingLoader(nbytes=0), max_entries=2)
+    for path in files:
+        cache.get(path)
+    assert len(cache) == 2 and files[0] not in cache
+    assert cache.evictions == 1
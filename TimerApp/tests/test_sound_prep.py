@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+import audio
+from settings import SOUNDS_PATH
+from sound_prep import PreparedSounds, PEAK_LIMIT, TARGET_LOUDNESS, measure_loudness
+
+@pytest.fixture
+def prepared(tmp_path):
+    return PreparedSounds(tmp_path / "prepared")
+
+@pytest.mark.parametrize("path", sorted(SOUNDS_PATH.glob("*.wav")), ids=lambda path: path.name)
+def test_sounds_come_out_in_one_format_at_one_loudness(prepared, path):
+    sound = prepared.load(path)
+    assert sound.sample_rate == audio.SAMPLE_RATE and sound.channels == audio.CHANNELS
+    assert sound.samples.dtype == np.float32
+    assert np.abs(sound.samples).max() <= PEAK_LIMIT + 1e-6
+    # Sounds with loud peaks get less gain, but none get more. Scaling moves quiet samples
+    # across the gate, so loudness measured again is close to target rather than equal.
+    assert measure_loudness(sound.samples) <= TARGET_LOUDNESS + 1.0
+
+def test_second_load_reads_prepared_file(prepared, monkeypatch):
+    path = SOUNDS_PATH / "beep.wav"
+    sound = prepared.load(path)
+    assert len(list(prepared.directory.glob("*.npy"))) == 1
+    monkeypatch.setattr(prepared, "prepare", lambda sound: pytest.fail("sound prepared again"))
+    again = prepared.load(path)
+    assert np.array_equal(sound.samples, again.samples)
+
+def test_damaged_prepared_file_is_prepared_again(prepared):
+    path = SOUNDS_PATH / "beep.wav"
+    sound = prepared.load(path)
+    prepared.path_for(prepared.key(path)).write_bytes(b"not npy")
+    assert np.array_equal(prepared.load(path).samples, sound.samples)
+
+def test_copied_file_shares_prepared_sound(prepared, tmp_path):
+    copy = tmp_path / "copy.wav"
+    copy.write_bytes((SOUNDS_PATH / "beep.wav").read_bytes())
+    prepared.load(SOUNDS_PATH / "beep.wav")
+    prepared.load(copy)
+    assert len(list(prepared.directory.glob("*.npy"))) == 1
+    prepared.clear()
+    assert not list(prepared.directory.glob("*.npy"))
@@ -0,0 +1,188 @@
+import csv
+import time
+import sqlite3
+import pytest
+from settings import Settings
+from storage import SettingsStore, BackgroundWriter, MIGRATIONS, SESSION_COLUMNS
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "timer_app.db"
+
+@pytest.fixture
+def store(db_path):
+    store = SettingsStore(db_path)
+    yield store
+    store.close()
+
+def create_baseline_db(db_path, durations):
+    """Create database the way the first release did: no user_version, and a new settings
+    row on every save, the latest being active."""
+    con = sqlite3.connect(db_path)
+    con.execute("""
+        CREATE TABLE settings (
+                    id INTEGER PRIMARY KEY,
+                    timer_duration REAL,
+                    reset_timer_on_save BOOLEAN,
+                    enable_sound BOOLEAN,
+                    final_sound_filename TEXT,
+                    intermediate_sound_filename TEXT
+        )
+    """)
+    con.execute("""
+        CREATE TABLE profiles (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT,
+                    settings_id INTEGER,
+                    FOREIGN KEY (settings_id) REFERENCES settings (id)
+        )
+    """)
+    con.executemany("INSERT INTO settings (timer_duration, reset_timer_on_save, enable_sound, final_sound_filename,"
+                    " intermediate_sound_filename) VALUES (?, 0, 1, 'final.wav', 'bell.wav')",
+                    [(duration,) for duration in durations])
+    con.commit()
+    con.close()
+
+def history_durations(store):
+    return [row[0] for row in store.con.execute("SELECT timer_duration FROM settings_history ORDER BY id")]
+
+def test_baseline_database_is_migrated_to_current_schema(db_path):
+    create_baseline_db(db_path, [10.0, 20.0, 30.0])
+    store = SettingsStore(db_path)
+    try:
+        assert store.con.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+        assert store.con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        # The latest save is active, every save is in history, missing fields get defaults
+        settings = store.load_settings()
+        assert settings == Settings(timer_duration=30.0, final_sound_filename="final.wav",
+                                    intermediate_sound_filename="bell.wav")
+        assert history_durations(store) == [10.0, 20.0, 30.0]
+        assert store.con.execute("SELECT COUNT(*) FROM settings").fetchone()[0] == 1
+        assert store.load_checkpoints() == {} and list(store.iter_sessions()) == []
+    finally:
+        store.close()
+    # Opening migrated database again applies nothing
+    store = SettingsStore(db_path)
+    try:
+        assert store.load_settings().timer_duration == 30.0
+    finally:
+        store.close()
+
+def test_history_is_pruned_to_limit_in_batches(db_path):
+    store = SettingsStore(db_path, history_limit=5)
+    try:
+        limit = store.history_limit + store.PRUNE_BATCH
+        for duration in range(1, limit):
+            store.save_settings(Settings(timer_duration=float(duration)))
+        assert history_durations(store) == [float(duration) for duration in range(1, limit)]
+        store.save_settings(Settings(timer_duration=float(limit)))
+        # Newest saves are kept
+        assert history_durations(store) == [float(duration) for duration in range(limit - 4, limit + 1)]
+    finally:
+        store.close()
+
+def test_profiles_keep_their_own_settings(store):
+    store.save_settings(Settings(timer_duration=5.0))
+    store.save_profile("Round", Settings(timer_duration=180.0))
+    store.save_profile("Break", Settings(timer_duration=60.0))
+    store.save_profile("Round", Settings(timer_duration=120.0))
+    assert {name: settings.timer_duration for name, settings in store.load_profiles().items()} == \
+        {"Break": 60.0, "Round": 120.0}
+    store.delete_profile("Break")
+    store.delete_profile("Missing")
+    assert list(store.load_profiles()) == ["Round"]
+    assert store.load_settings().timer_duration == 5.0
+
+@pytest.fixture
+def errors():
+    return []
+
+@pytest.fixture
+def writer(db_path, store, errors):
+    # Database is created by store first, not by two threads at once. Long delay, so that
+    # everything submitted before flush() is one batch.
+    writer = BackgroundWriter(db_path, on_error=errors.append, coalesce_delay=1.0)
+    yield writer
+    writer.close()
+
+def test_writer_coalesces_jobs_with_same_key(writer, store):
+    written = []
+
+    def save(duration):
+        def job(job_store):
+            written.append(duration)
+            job_store.save_settings(Settings(timer_duration=duration))
+        return job
+
+    for duration in (1.0, 2.0, 3.0):
+        writer.submit(save(duration), key="settings")
+    writer.submit(lambda job_store: written.append("unkeyed"))
+    writer.submit(lambda job_store: written.append("unkeyed"))
+    assert writer.flush(timeout=10)
+    assert written == [3.0, "unkeyed", "unkeyed"]
+    assert store.load_settings().timer_duration == 3.0
+
+def test_failing_job_is_retried_alone_and_reported(writer, store, errors):
+    def fail(job_store):
+        job_store.save_profile("Lost", Settings())
+        raise ValueError("disk full")
+
+    writer.submit(lambda job_store: job_store.save_settings(Settings(timer_duration=1.0)))
+    writer.submit(fail)
+    writer.submit(lambda job_store: job_store.save_profile("Round", Settings()))
+    assert writer.flush(timeout=10)
+    # Jobs around the failing one are written, the failing one is rolled back
+    assert store.load_settings().timer_duration == 1.0
+    assert list(store.load_profiles()) == ["Round"]
+    assert [str(error) for error in errors] == ["disk full"]
+
+def test_close_writes_pending_jobs(db_path, store):
+    writer = BackgroundWriter(db_path, coalesce_delay=10.0)
+    writer.submit(lambda job_store: job_store.save_settings(Settings(timer_duration=7.0)))
+    writer.close()
+    assert store.load_settings().timer_duration == 7.0
+
+def make_session(started_at, elapsed=60.0, outcome="finished"):
+    return {"started_at": started_at, "ended_at": started_at + elapsed, "duration": 60.0,
+            "elapsed": elapsed, "bells_fired": 1, "outcome": outcome}
+
+def local_time(day, hour):
+    # Days of October 2026; the 12th is a Monday
+    return time.mktime((2026, 10, day, hour, 0, 0, 0, 0, -1))
+
+@pytest.fixture
+def sessions(store):
+    sessions = [make_session(local_time(12, 9)),
+                make_session(local_time(12, 23), elapsed=30.0, outcome="reset"),
+                make_session(local_time(13, 0)),
+                make_session(local_time(19, 8))]
+    # Insertion order doesn't matter
+    store.add_sessions(sessions[::-1])
+    return sessions
+
+def test_session_totals_by_local_day_and_week(store, sessions):
+    assert store.session_totals("day") == [
+        {"period": "2026-10-12", "runs": 2, "finished": 1, "elapsed": 90.0},
+        {"period": "2026-10-13", "runs": 1, "finished": 1, "elapsed": 60.0},
+        {"period": "2026-10-19", "runs": 1, "finished": 1, "elapsed": 60.0}]
+    assert store.session_totals("week", since=local_time(12, 12)) == [
+        {"period": "2026-10-12", "runs": 2, "finished": 1, "elapsed": 90.0},
+        {"period": "2026-10-19", "runs": 1, "finished": 1, "elapsed": 60.0}]
+    with pytest.raises(ValueError):
+        store.session_totals("month")
+
+def test_sessions_are_iterated_in_chunks_oldest_first(store, sessions):
+    store.FETCH_SIZE = 3
+    assert list(store.iter_sessions()) == sessions
+    assert list(store.iter_sessions(since=local_time(12, 23), until=local_time(19, 8))) == sessions[1:3]
+
+def test_sessions_are_exported_to_csv(store, sessions, tmp_path):
+    store.FETCH_SIZE = 3
+    path = tmp_path / "history.csv"
+    assert store.export_sessions_csv(path) == 4
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [float(row["started_at"]) for row in rows] == [session["started_at"] for session in sessions]
+    assert [row["outcome"] for row in rows] == ["finished", "reset", "finished", "finished"]
+    assert store.export_sessions_csv(path, since=local_time(20, 0)) == 0
+    assert path.read_text().splitlines() == [",".join(SESSION_COLUMNS)]
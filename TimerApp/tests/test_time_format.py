@@ -0,0 +1,61 @@
+import pytest
+from time_format import TimeFormatter
+
+def test_units_round_up_so_zero_is_shown_only_when_time_is_up():
+    formatter = TimeFormatter(2)
+    assert formatter.units(10.0) == 1000
+    assert formatter.units(9.991) == 1000
+    assert formatter.units(9.99) == 999
+    assert formatter.units(0.0001) == 1
+    assert formatter.units(0.0) == formatter.units(-1.0) == 0
+
+@pytest.mark.parametrize("precision, seconds, text", [
+    (0, 58.2, "59"),
+    (0, 59.2, "01:00"),
+    (1, 61.25, "01:01.3"),
+    (2, 5.0, "05.00"),
+    (2, 3599.99, "59:59.99"),
+    (2, 3661.5, "1:01:01.50"),
+    (1, 36000.0, "10:00:00.0"),
+])
+def test_format(precision, seconds, text):
+    assert TimeFormatter(precision).format(seconds) == text
+
+def test_format_matches_legacy_formatting_at_whole_hundredths(window):
+    formatter = TimeFormatter(2)
+    for hundredths in (0, 1, 99, 500, 5999, 6000, 6001, 359999, 360000, 1000000):
+        assert formatter.format(hundredths / 100) == window.get_time(hundredths / 100)
+
+def test_invalid_precision_is_rejected():
+    with pytest.raises(ValueError):
+        TimeFormatter(3)
+
+def test_prefix_cache_is_bounded():
+    formatter = TimeFormatter(0)
+    for minute in range(1, TimeFormatter.PREFIX_CACHE_SIZE * 3):
+        assert formatter.format(minute * 60 + 1).endswith(":01")
+    assert len(formatter._prefixes) <= TimeFormatter.PREFIX_CACHE_SIZE
+
+def test_label_is_rendered_only_when_visible_text_changes(window, monkeypatch):
+    window.show()
+    texts = []
+    monkeypatch.setattr(window.timer_label, "setText", texts.append)
+    window.displayed_units = None
+    for seconds in (10.0, 9.999, 9.995, 9.991, 9.99, 9.985):
+        window.render_time(seconds)
+    assert texts == ["10.00", "09.99"]
+    # Lower precision changes text less often
+    window.set_display_precision(0)
+    for seconds in (9.5, 9.01, 9.0):
+        window.render_time(seconds)
+    assert texts == ["10.00", "09.99", "10", "09"]
+    window.hide()
+
+def test_hidden_window_renders_on_show(window, monkeypatch):
+    texts = []
+    monkeypatch.setattr(window.timer_label, "setText", texts.append)
+    window.render_time(42.0)
+    assert texts == [] and window.display_dirty
+    window.show()
+    assert texts and not window.display_dirty
+    window.hide()
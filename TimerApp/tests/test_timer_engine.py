@@ -0,0 +1,143 @@
+import random
+import pytest
+from timer_engine import TimerEngine, BellSchedule, TickPolicy
+from time_format import TimeFormatter
+from fakes import FakeClock, FakeLoop
+
+def test_remaining_time_follows_clock_through_late_ticks_and_pauses():
+    # A three-hour countdown is driven by display ticks that come late, with occasional
+    # long stalls and pauses. Ticks are rescheduled from the time they actually fired,
+    # the way a drifting countdown would, but the engine must only trust the deadline.
+    loop = FakeLoop()
+    clock, scheduler = loop.clock, loop.scheduler
+    duration = 3 * 3600.0
+    engine = TimerEngine(duration, clock=clock)
+    rng = random.Random(0)
+    # Time the countdown actually ran, summed from clock steps between ticks
+    ran = 0.0
+    last_tick = clock.now
+    errors = []
+    pauses = 0
+    paused_at = None
+    paused_for = 0.0
+    finished = []
+
+    def tick(count):
+        nonlocal ran, last_tick, pauses, paused_at
+        if not engine.is_running:
+            # Countdown finished before this tick
+            return
+        ran += clock.now - last_tick
+        last_tick = clock.now
+        errors.append(abs(engine.remaining() - max(0.0, duration - ran)))
+        if count % 100000 == 0:
+            pauses += 1
+            paused_at = clock.now
+            engine.pause()
+            scheduler.cancel(finish_event[0])
+            scheduler.schedule(clock.now + 2.0, resume)
+            return
+        scheduler.schedule(clock.now + engine.tick_interval / 1000, tick, count + 1)
+
+    def resume():
+        nonlocal last_tick, paused_for
+        paused_for += clock.now - paused_at
+        last_tick = clock.now
+        engine.resume()
+        finish_event[0] = scheduler.schedule(engine.deadline, finish)
+        scheduler.schedule(clock.now + engine.tick_interval / 1000, tick, 1)
+
+    def finish():
+        finished.append((finish_event[0].deadline, clock.now))
+        engine.reset()
+
+    def lateness():
+        late = rng.expovariate(100)
+        if rng.random() < 1e-4:
+            late += rng.uniform(0.5, 5.0)
+        return late
+
+    engine.start()
+    started = clock.now
+    finish_event = [scheduler.schedule(engine.deadline, finish)]
+    scheduler.schedule(clock.now + engine.tick_interval / 1000, tick, 1)
+    loop.run_until_idle(lateness)
+
+    assert len(errors) > 100000
+    assert max(errors) < 1e-6
+    # Every pause moved the deadline by its length exactly once, and finish fired on the first
+    # wakeup after the deadline
+    assert pauses > 0
+    [(deadline, fired_at)] = finished
+    assert abs(deadline - (started + duration + paused_for)) < 1e-6
+    assert deadline <= fired_at < deadline + 6.0
+
+def test_pause_freezes_remaining_time():
+    clock = FakeClock()
+    engine = TimerEngine(60.0, clock=clock)
+    engine.start()
+    clock.now += 10.0
+    engine.pause()
+    clock.now += 1000.0
+    assert engine.remaining() == 50.0
+    engine.resume()
+    assert engine.deadline == clock.now + 50.0
+    clock.now += 50.0
+    assert engine.is_finished()
+    assert engine.remaining() == 0.0
+
+def test_late_wakeups_do_not_move_deadlines():
+    # Events scheduled at fixed deadlines fire in order and never later than the first
+    # wakeup after their deadline, no matter how late earlier ones fired
+    loop = FakeLoop()
+    fired = []
+    for deadline in (1001.0, 1002.0, 1002.5, 1010.0):
+        loop.scheduler.schedule(deadline, lambda deadline=deadline: fired.append((deadline, loop.clock.now)))
+    loop.run_until_idle(lambda: 0.7)
+    assert [deadline for deadline, _ in fired] == [1001.0, 1002.0, 1002.5, 1010.0]
+    assert all(deadline <= now <= deadline + 0.7 for deadline, now in fired)
+
+def test_bell_schedule_seek_skips_due_bells():
+    bells = BellSchedule([0.75, 0.25, 0.5, 1.0], 100.0)
+    assert bells.offsets == [25.0, 50.0, 75.0]
+    assert bells.next_offset() == 25.0
+    bells.seek(50.0)
+    assert bells.next_offset() == 75.0
+    bells.advance()
+    assert bells.next_offset() is None
+
+@pytest.fixture
+def policy():
+    return TickPolicy(0.01)
+
+def test_far_from_deadlines_ticks_are_coarse_and_spaced_out(policy):
+    delay, precise = policy.next_tick(600.0, None, TimeFormatter(2), visible=True)
+    assert delay == policy.far_interval and not precise
+    # Whole seconds only change once a second
+    delay, precise = policy.next_tick(600.5, None, TimeFormatter(0), visible=True)
+    assert delay == pytest.approx(0.5) and not precise
+
+def test_near_deadline_or_bell_ticks_follow_display_precision(policy):
+    delay, precise = policy.next_tick(5.005, None, TimeFormatter(2), visible=True)
+    assert delay == pytest.approx(0.01) and precise
+    delay, precise = policy.next_tick(600.0, 3.0, TimeFormatter(2), visible=True)
+    assert delay == pytest.approx(0.01) and precise
+    # Tick lands where the visible text changes
+    delay, precise = policy.next_tick(5.25, None, TimeFormatter(0), visible=True)
+    assert delay == pytest.approx(0.25) and precise
+
+def test_no_ticks_while_hidden_or_finished(policy):
+    assert policy.next_tick(600.0, 3.0, TimeFormatter(2), visible=False) == (None, False)
+    assert policy.next_tick(0.0, None, TimeFormatter(2), visible=True) == (None, False)
+
+def test_hidden_window_schedules_no_display_updates(window):
+    window.show()
+    window.start_timer()
+    assert window.tick_event is not None
+    window.hide()
+    window.update_timer()
+    assert window.tick_event is None
+    window.show()
+    assert window.tick_event is not None
+    window.reset_timer()
+    window.hide()
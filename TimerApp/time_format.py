@@ -0,0 +1,74 @@
+import math
+
+class TimeFormatter:
+    """Formats countdown time as [H:]MM:SS[.ff] with given number of decimals.
+
+    Time is first quantized to integer display units (whole seconds, tenths or hundredths),
+    so callers can compare units to skip rendering when visible text wouldn't change.
+    Formatted pieces (hours and minutes prefix, seconds, fraction) are cached, so rendering
+    a new value is a few lookups and one concatenation.
+    """
+    MAX_PRECISION = 2
+    # Prefixes are kept for this many distinct minute values
+    PREFIX_CACHE_SIZE = 256
+
+    def __init__(self, precision=2):
+        """
+        Args:
+            precision (int): number of decimals, from 0 (whole seconds) to MAX_PRECISION.
+        """
+        if not 0 <= precision <= self.MAX_PRECISION:
+            raise ValueError(f"Precision must be in [0; {self.MAX_PRECISION}], got {precision}")
+        self.precision = precision
+        self.scale = 10 ** precision
+        self._seconds = [f"{second:02d}" for second in range(60)]
+        self._fractions = [f".{fraction:0{precision}d}" if precision else "" for fraction in range(self.scale)]
+        self._prefixes = {}
+
+    def units(self, seconds):
+        """Quantize time to display units, rounding up so that zero is shown only when time is up.
+
+        Args:
+            seconds (float): time in seconds.
+        Returns:
+            units (int): number of display units.
+        """
+        # Small epsilon keeps exact values like 10.0 from being rounded up by float error
+        return max(0, math.ceil(seconds * self.scale - 1e-6))
+
+    def format(self, seconds):
+        """Convert time from seconds to [H:]MM:SS[.ff] format.
+
+        Args:
+            seconds (float): time in seconds.
+        Returns:
+            time_str (str): formatted time string.
+        """
+        return self.format_units(self.units(seconds))
+
+    def format_units(self, units):
+        """Convert time in display units to [H:]MM:SS[.ff] format.
+
+        Args:
+            units (int): time in display units as returned by units().
+        Returns:
+            time_str (str): formatted time string.
+        """
+        whole_seconds, fraction = divmod(units, self.scale)
+        minutes, second = divmod(whole_seconds, 60)
+        return self._prefix(minutes) + self._seconds[second] + self._fractions[fraction]
+
+    def _prefix(self, minutes):
+        prefix = self._prefixes.get(minutes)
+        if prefix is None:
+            if len(self._prefixes) >= self.PREFIX_CACHE_SIZE:
+                self._prefixes.clear()
+            hours, minute = divmod(minutes, 60)
+            if hours:
+                prefix = f"{hours}:{minute:02d}:"
+            elif minutes:
+                prefix = f"{minute:02d}:"
+            else:
+                prefix = ""
+            self._prefixes[minutes] = prefix
+        return prefix
@@ -0,0 +1,199 @@
+import time
+from bisect import bisect_right
+
+class TimerEngine:
+    """Countdown core that keeps an absolute deadline on a monotonic clock.
+
+    Remaining time is always computed as deadline - now, so late ticks or a blocked
+    event loop only delay the display, they never accumulate into drift.
+    """
+    DEFAULT_TICK_INTERVAL = 10
+
+    def __init__(self, duration, tick_interval=DEFAULT_TICK_INTERVAL, clock=time.monotonic):
+        """
+        Args:
+            duration (float): countdown duration in seconds.
+            tick_interval (int): interval between display ticks in milliseconds.
+            clock (callable): monotonic clock returning seconds as float.
+        """
+        self.duration = duration
+        self.tick_interval = tick_interval
+        self.clock = clock
+        self.deadline = None
+        # Remaining time frozen at the moment of pausing
+        self.paused_remaining = None
+
+    @property
+    def is_running(self):
+        return self.deadline is not None
+
+    @property
+    def is_paused(self):
+        return self.paused_remaining is not None
+
+    def start(self):
+        """Start countdown from full duration.
+        """
+        self.paused_remaining = None
+        self.deadline = self.clock() + self.duration
+
+    def pause(self):
+        """Freeze remaining time. Does nothing if timer is not running.
+        """
+        if self.deadline is None:
+            return
+        self.paused_remaining = self.remaining()
+        self.deadline = None
+
+    def resume(self):
+        """Continue countdown from the time left at pause. Does nothing if timer is not paused.
+        """
+        if self.paused_remaining is None:
+            return
+        self.deadline = self.clock() + self.paused_remaining
+        self.paused_remaining = None
+
+    def reset(self, duration=None):
+        """Stop countdown and optionally set new duration.
+
+        Args:
+            duration (float): new countdown duration in seconds.
+        """
+        if duration is not None:
+            self.duration = duration
+        self.deadline = None
+        self.paused_remaining = None
+
+    def remaining(self):
+        """Get time left in seconds, never negative.
+
+        Returns:
+            remaining (float): seconds until deadline.
+        """
+        if self.deadline is not None:
+            return max(0.0, self.deadline - self.clock())
+        if self.paused_remaining is not None:
+            return self.paused_remaining
+        return self.duration
+
+    def is_finished(self):
+        return self.deadline is not None and self.clock() >= self.deadline
+
+class BellSchedule:
+    """Sorted schedule of intermediate bells compiled from bell points when timer starts.
+
+    Bells are kept as offsets in seconds from the start of countdown. A cursor points at the
+    next bell to ring, so finding it costs O(1) no matter how many bells there are.
+    """
+
+    def __init__(self, points, duration):
+        """
+        Args:
+            points (iterable of float): bell positions as fractions of duration in [0; 1).
+                Points at the very end are skipped since final sound is played there.
+            duration (float): countdown duration in seconds.
+        """
+        self.offsets = sorted(point * duration for point in points if 0 <= point < 1)
+        self.cursor = 0
+        # Number of bells before cursor that were skipped rather than rung
+        self.skipped = 0
+
+    @classmethod
+    def from_offsets(cls, offsets, fired=0, skipped=0):
+        """Create schedule from bell offsets, e.g. saved from an earlier schedule's offsets.
+
+        Args:
+            offsets (iterable of float): bell offsets in seconds from start of countdown.
+            fired (int): number of first bells that already rang.
+            skipped (int): number of first bells that were skipped, after those that rang.
+        Returns:
+            bells (BellSchedule)"""
+        bells = cls([], 0)
+        bells.offsets = sorted(offsets)
+        bells.cursor = fired + skipped
+        bells.skipped = skipped
+        return bells
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def fired(self):
+        """Number of bells that already rang."""
+        return self.cursor - self.skipped
+
+    def next_offset(self):
+        """Get offset of next bell from start of countdown or None if no bells left.
+        """
+        if self.cursor < len(self.offsets):
+            return self.offsets[self.cursor]
+        return None
+
+    def advance(self):
+        """Move cursor to the next bell after the current one has rung.
+        """
+        self.cursor += 1
+
+    def seek(self, elapsed):
+        """Move cursor past all bells due at or before elapsed time, e.g. after resuming.
+
+        Args:
+            elapsed (float): seconds elapsed since start of countdown.
+        """
+        self.cursor = bisect_right(self.offsets, elapsed)
+
+    def skip(self, elapsed):
+        """Move cursor past all bells due at or before elapsed time without ringing them,
+        e.g. bells that came due while the application wasn't running. They don't count as fired.
+
+        Args:
+            elapsed (float): seconds elapsed since start of countdown.
+        """
+        cursor = max(self.cursor, bisect_right(self.offsets, elapsed))
+        self.skipped += cursor - self.cursor
+        self.cursor = cursor
+
+class TickPolicy:
+    """Chooses when the next display update is due and which kind of timer to use for it.
+
+    Updates are aligned to the moments when visible text changes. While deadline and next bell
+    are far away, updates are at least far_interval apart and use a coarse timer, which lets
+    the OS batch wakeups. Close to a deadline or bell updates follow the display precision on
+    a precise timer. While display is not visible there are no updates at all: bells and the
+    final deadline are separate events and don't depend on display updates.
+    """
+    NEAR_THRESHOLD = 10.0
+    FAR_INTERVAL = 0.1
+
+    def __init__(self, min_interval, far_interval=FAR_INTERVAL, near_threshold=NEAR_THRESHOLD):
+        """
+        Args:
+            min_interval (float): shortest interval between updates in seconds.
+            far_interval (float): shortest interval between updates far from deadlines in seconds.
+            near_threshold (float): seconds before deadline or bell when updates become precise.
+        """
+        self.min_interval = min_interval
+        self.far_interval = far_interval
+        self.near_threshold = near_threshold
+
+    def next_tick(self, remaining, until_bell, formatter, visible):
+        """Get delay until the next display update.
+
+        Args:
+            remaining (float): seconds until deadline.
+            until_bell (float): seconds until next bell or None.
+            formatter (TimeFormatter): formatter of displayed time.
+            visible (bool): whether display is visible.
+        Returns:
+            delay (float): seconds until next update or None if no update is needed.
+            precise (bool): whether the update needs a precise timer.
+        """
+        if not visible or remaining <= 0:
+            return None, False
+        nearest = remaining if until_bell is None else min(remaining, until_bell)
+        near = nearest <= self.near_threshold
+        # Text changes when remaining time drops to the next lower display unit
+        units = formatter.units(remaining)
+        delay = remaining - (units - 1) / formatter.scale
+        delay = max(delay, self.min_interval if near else self.far_interval)
+        return delay, near